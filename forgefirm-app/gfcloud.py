@@ -27,6 +27,7 @@ from pathlib import Path
 
 from gfutilities.configuration import parse, get_cfg
 from gfutilities import GFUIService
+from gfhardware._common import enable_attr_stats, install_attr_stats_signal
 
 import ffmachine
 
@@ -67,6 +68,12 @@ def main() -> int:
 
     ffmachine.apply_identity_overrides()
 
+    # Attribute latency: recorded when attr_stats is on in the shared config
+    # (cheap enough to leave on), written to /tmp as JSON on SIGUSR2.
+    if ffmachine.read_machine_conf().get('attr_stats', '0') not in ('', '0', 'off'):
+        enable_attr_stats()
+    install_attr_stats_signal()
+
     # Machine() reads the OCOTP identity and head info; it fails cleanly if
     # grblHAL still holds /dev/glowforge (controller_mode must be cloud).
     try:
@@ -5,3 +5,4 @@ https://community.openglow.org
 SPDX-License-Identifier:    MIT
 """
 from gfhardware.machine import Machine
+from gfhardware.readings import snapshot, Snapshot
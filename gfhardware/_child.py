@@ -0,0 +1,85 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+SPDX-License-Identifier:    MIT
+
+Helper processes, started fresh rather than forked.
+
+The step accounting and the feed can each run in a child of their own. A
+fork of this service would carry every object the parent held into the
+child: a held-open sysfs attribute, a log file or a socket, each of which
+closes its descriptor when the copy lets go of it. That is a number the
+child may already have reused for the pulse device, so the device could be
+closed or written over by a destructor. A child here is instead a new
+interpreter, execed with nothing open but the descriptors named for it, at
+the numbers they had.
+
+This file is its entry point, run by path rather than imported as
+gfhardware._child, so that the package's __init__ (the whole machine) is not
+loaded. The package is put in place empty, as the host tests do, and only
+the module the child runs is imported.
+"""
+import json
+import os
+import subprocess
+import sys
+import types
+from importlib import import_module
+from typing import Iterable
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class Child:
+    """A started helper, with the parts of multiprocessing.Process its owners use."""
+
+    def __init__(self, popen: subprocess.Popen):
+        self._popen = popen
+
+    @property
+    def pid(self) -> int:
+        return self._popen.pid
+
+    def is_alive(self) -> bool:
+        return self._popen.poll() is None
+
+    def join(self, timeout: float = None) -> None:
+        try:
+            self._popen.wait(timeout)
+        except subprocess.TimeoutExpired:
+            pass
+
+    def terminate(self) -> None:
+        if self.is_alive():
+            self._popen.terminate()
+
+    def kill(self) -> None:
+        if self.is_alive():
+            self._popen.kill()
+
+
+def start(module: str, func: str, fds: Iterable[int], *args) -> Child:
+    """Run gfhardware.<module>.<func>(*args) in a new interpreter.
+
+    The child gets ``fds`` and stdin, stdout and stderr, and nothing else.
+    ``args`` go to it as JSON, so they are numbers and strings: a descriptor
+    is passed as its number. It finds its imports on this process's path.
+    Raises OSError if it cannot be started.
+    """
+    spec = json.dumps({'path': sys.path, 'module': module, 'func': func, 'args': args})
+    return Child(subprocess.Popen([sys.executable, os.path.join(HERE, '_child.py'), spec],
+                                  stdin=subprocess.DEVNULL, pass_fds=tuple(fds)))
+
+
+def _main(spec: str) -> None:
+    spec = json.loads(spec)
+    sys.path[:] = spec['path']
+    package = types.ModuleType('gfhardware')
+    package.__path__ = [HERE]
+    sys.modules['gfhardware'] = package
+    getattr(import_module('gfhardware.' + spec['module']), spec['func'])(*spec['args'])
+
+
+if __name__ == '__main__':
+    _main(sys.argv[1])
@@ -4,25 +4,40 @@ Scott Wiederhold, s.e.wiederhold@gmail.com
 https://community.openglow.org
 SPDX-License-Identifier:    MIT
 """
+import errno
 import importlib.machinery
 import importlib.util
+import json
+import logging
 import os
+import signal
+import stat
+import struct
 import sysconfig
+import threading
 from collections import namedtuple
+from time import perf_counter_ns
 from enum import Enum, IntEnum
 from typing import Union
 
 # System Wide Values
 LOGGER_NAME = 'openglow'
-PULS_DEVICE = '/dev/glowforge'
-SYSFS_GF_BASE = '/sys/glowforge/'
-SWITCH_DEVICE = '/dev/input/event0'
+# The three places the hardware shows up. Each can be moved with an
+# environment variable, read once at import, so the job path can run against
+# a stand-in (gfhardware.sim) off the machine.
+PULS_DEVICE = os.getenv('GF_PULSE_DEVICE', '/dev/glowforge')
+SYSFS_GF_BASE = os.path.join(os.getenv('GF_SYSFS_BASE', '/sys/glowforge'), '')
+SWITCH_DEVICE = os.getenv('GF_SWITCH_DEVICE', '/dev/input/event0')
 TEMP_SENSORS = ['chassis', 'water_1', 'water_2', 'power', 'tec']
 XY_STEP_PER_MM = 0.15
 Z_STEP_PER_MM = 0.70612
 
+logger = logging.getLogger(LOGGER_NAME)
+
 # Named Tuples
 AxisPosition = namedtuple('AxisPosition', ['steps', 'mm', 'inch'])
+CncConfig = namedtuple('CncConfig', ['step_freq', 'x_mode', 'y_mode', 'x_decay', 'y_decay', 'x_current', 'y_current'],
+                       defaults=(None,) * 7)
 HeadInfo = namedtuple('HeadInfo', ['hardware_id', 'serial', 'version'])
 Position = namedtuple('Position', ['x', 'y', 'z', 'bytes'])
 PulsPosition = namedtuple('PulsPosition', ['total', 'processed'])
@@ -102,18 +117,530 @@ class ZCur(Enum):
     LOW = 1
 
 
+class AxisReading(object):
+    """
+    One axis of a decoded position, standing in for an AxisPosition.
+
+    The steps are what the driver counts; mm and inch are worked out only
+    when asked for, since most readers of a position (the progress report,
+    the run loop) never ask. Compares, unpacks and indexes as the tuple it
+    stands in for.
+    """
+    __slots__ = ('steps', '_mode', '_mm_per_step')
+    _fields = AxisPosition._fields
+
+    def __init__(self, steps: int, mode: int, mm_per_step: float):
+        self.steps = steps
+        self._mode = mode
+        self._mm_per_step = mm_per_step
+
+    @property
+    def mm(self) -> float:
+        return (self.steps / self._mode) * self._mm_per_step
+
+    @property
+    def inch(self) -> float:
+        return self.mm / 25.4
+
+    def __iter__(self):
+        mm = self.mm
+        return iter((self.steps, mm, mm / 25.4))
+
+    def __len__(self):
+        return 3
+
+    def __getitem__(self, i):
+        return tuple(self)[i]
+
+    def __eq__(self, other):
+        try:
+            return tuple(self) == tuple(other)
+        except TypeError:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return 'AxisPosition(steps=%r, mm=%r, inch=%r)' % tuple(self)
+
+
+class PositionRecord(object):
+    """
+    cnc/position, decoded in one unpack, standing in for a Position.
+
+    Holds the five counters as read; the axes and the byte counters are built
+    on access. Compares, unpacks and indexes as the tuple it stands in for.
+    """
+    LAYOUT = struct.Struct('<3i2I')
+    __slots__ = ('x_steps', 'y_steps', 'z_steps', 'processed', 'total', '_x_mode', '_y_mode')
+    _fields = Position._fields
+
+    def __init__(self, raw, x_mode: int, y_mode: int):
+        # Full 4-byte little-endian words: x, y, z signed; then the processed
+        # and the total byte counters.
+        if len(raw) < self.LAYOUT.size:
+            raise ValueError('cnc/position: %d bytes, not %d' % (len(raw), self.LAYOUT.size))
+        (self.x_steps, self.y_steps, self.z_steps,
+         self.processed, self.total) = self.LAYOUT.unpack_from(raw)
+        self._x_mode = x_mode
+        self._y_mode = y_mode
+
+    @property
+    def x(self) -> AxisReading:
+        return AxisReading(self.x_steps, self._x_mode, XY_STEP_PER_MM)
+
+    @property
+    def y(self) -> AxisReading:
+        return AxisReading(self.y_steps, self._y_mode, XY_STEP_PER_MM)
+
+    @property
+    def z(self) -> AxisReading:
+        return AxisReading(self.z_steps, 2, Z_STEP_PER_MM)
+
+    @property
+    def bytes(self) -> PulsPosition:
+        return PulsPosition(self.total, self.processed)
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z, self.bytes))
+
+    def __len__(self):
+        return 4
+
+    def __getitem__(self, i):
+        return tuple(self)[i]
+
+    def __eq__(self, other):
+        try:
+            return tuple(self) == tuple(other)
+        except TypeError:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return 'Position(x=%r, y=%r, z=%r, bytes=%r)' % tuple(self)
+
+
+class LatencyHistogram(object):
+    """
+    Call count and latency distribution of one kind of access to one path.
+
+    Log-linear buckets in the manner of an HDR histogram: every power of two
+    of nanoseconds is split in SUB_BUCKETS, so a bucket is never wider than
+    1/SUB_BUCKETS of what it holds (a 6% worst-case error at 16), from a
+    nanosecond to over a minute, in a fixed few hundred counters. Recording
+    is a bit_length() and an increment.
+    """
+    SUB_BITS = 4
+    SUB_BUCKETS = 1 << SUB_BITS
+    # Shifts up to 32 reach 2**37 ns, past two minutes; anything longer
+    # lands in the last bucket, and max still says how long it was.
+    BUCKETS = (32 + 1) * SUB_BUCKETS + SUB_BUCKETS
+    __slots__ = ('count', 'errors', 'total_ns', 'max_ns', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.buckets = [0] * self.BUCKETS
+
+    @classmethod
+    def index(cls, ns: int) -> int:
+        shift = ns.bit_length() - cls.SUB_BITS - 1
+        if shift <= 0:
+            return ns
+        return min((shift << cls.SUB_BITS) + (ns >> shift), cls.BUCKETS - 1)
+
+    @classmethod
+    def bounds(cls, index: int) -> tuple:
+        """The [low, high) nanoseconds bucket ``index`` counts."""
+        if index < 2 * cls.SUB_BUCKETS:
+            return index, index + 1
+        shift = (index >> cls.SUB_BITS) - 1
+        low = (index - (shift << cls.SUB_BITS)) << shift
+        return low, low + (1 << shift)
+
+    def record(self, ns: int, failed: bool = False) -> None:
+        self.count += 1
+        if failed:
+            self.errors += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+        self.buckets[self.index(ns)] += 1
+
+    def percentile(self, q: float) -> int:
+        """Nanoseconds at or under which ``q`` percent of calls finished
+        (the top of the bucket that crosses it, never more than the max)."""
+        if not self.count:
+            return 0
+        want = max(1, -(-self.count * q // 100))
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= want:
+                return min(self.bounds(index)[1] - 1, self.max_ns)
+        return self.max_ns
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'mean_us': round(self.total_ns / self.count / 1000, 3) if self.count else 0,
+            'max_us': round(self.max_ns / 1000, 3),
+            'p50_us': round(self.percentile(50) / 1000, 3),
+            'p90_us': round(self.percentile(90) / 1000, 3),
+            'p99_us': round(self.percentile(99) / 1000, 3),
+            'p999_us': round(self.percentile(99.9) / 1000, 3),
+            'total_ms': round(self.total_ns / 1e6, 3),
+            # Low edge of each occupied bucket, in ns: enough to rebuild it.
+            'buckets': {str(self.bounds(i)[0]): n for i, n in enumerate(self.buckets) if n},
+        }
+
+
+# Per-path, per-operation latency, or None while not recording. Off by
+# default; GF_ATTR_STATS=1 in the environment turns it on from import, and
+# enable_attr_stats() at any time.
+_attr_stats = {} if os.getenv('GF_ATTR_STATS', '') not in ('', '0') else None
+_attr_stats_lock = threading.Lock()
+
+# Where a signal-requested dump goes: tmpfs, never the eMMC.
+ATTR_STATS_PATH = '/tmp/gfhardware-attr-stats.json'
+
+
+def _record(path: str, op: str, t0: int, failed: bool) -> None:
+    ns = perf_counter_ns() - t0
+    stats = _attr_stats
+    if stats is None:
+        return
+    with _attr_stats_lock:
+        hist = stats.get((path, op))
+        if hist is None:
+            hist = stats[(path, op)] = LatencyHistogram()
+        hist.record(ns, failed)
+
+
+def enable_attr_stats(on: bool = True) -> None:
+    """Start (or, with False, stop and drop) recording attribute latency."""
+    global _attr_stats
+    with _attr_stats_lock:
+        if not on:
+            _attr_stats = None
+        elif _attr_stats is None:
+            _attr_stats = {}
+
+
+def attr_stats() -> dict:
+    """What has been recorded: {path: {'read'|'write': histogram summary}},
+    {} while not recording."""
+    with _attr_stats_lock:
+        items = list((_attr_stats or {}).items())
+        out = {}
+        for (path, op), hist in sorted(items):
+            out.setdefault(path, {})[op] = hist.to_dict()
+    return out
+
+
+def dump_attr_stats(path: str = ATTR_STATS_PATH) -> str:
+    """Write attr_stats() to ``path`` as JSON, attributes by time spent in
+    them, most first; the path."""
+    stats = attr_stats()
+    ranked = dict(sorted(stats.items(), key=lambda kv: -sum(op['total_ms'] for op in kv[1].values())))
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(ranked, f, indent=1)
+    os.replace(tmp, path)
+    return path
+
+
+def install_attr_stats_signal(signum: int = signal.SIGUSR2, path: str = ATTR_STATS_PATH) -> None:
+    """Dump the attribute latency to ``path`` whenever the process gets
+    ``signum``. Main thread only, as any signal.signal() is."""
+    def _dump(*_):
+        try:
+            logger.info('attribute latency written to %s', dump_attr_stats(path))
+        except OSError as e:
+            logger.warning('attribute latency not written: %s', e)
+    signal.signal(signum, _dump)
+
+
 def read_file(attr: str, binary: bool = False) -> Union[str, bytes]:
-    with open(attr, 'br' if binary else 'r') as f:
-        return f.read() if binary else f.read().strip()
+    if _attr_stats is None:
+        with open(attr, 'br' if binary else 'r') as f:
+            return f.read() if binary else f.read().strip()
+    t0 = perf_counter_ns()
+    failed = True
+    try:
+        with open(attr, 'br' if binary else 'r') as f:
+            val = f.read() if binary else f.read().strip()
+        failed = False
+        return val
+    finally:
+        _record(attr, 'read', t0, failed)
 
 
 def write_file(attr: str, val: Union[str, bytes], binary: bool = False) -> None:
-    with open(attr, 'bw' if binary else 'w') as file:
-        file.write(val)
+    if _attr_stats is None:
+        with open(attr, 'bw' if binary else 'w') as file:
+            file.write(val)
+        return
+    t0 = perf_counter_ns()
+    failed = True
+    try:
+        with open(attr, 'bw' if binary else 'w') as file:
+            file.write(val)
+        failed = False
+    finally:
+        _record(attr, 'write', t0, failed)
+
+
+# What an attribute can say in one read: sysfs hands a show() one page.
+_ATTR_READ_MAX = 4096
+
+# Errors that mean the descriptor outlived the attribute it was opened on:
+# the driver was unloaded or reloaded under it. Anything else is the
+# attribute's own answer and goes to the caller.
+_STALE = (errno.ENODEV, errno.EBADF, errno.ENOENT, errno.ESTALE)
+
+
+class SysfsAttr(object):
+    """
+    One attribute file, held open for the life of the process.
+
+    An open/read/close of a sysfs attribute is three syscalls and a path
+    walk, and the run loop pays it for every attribute on every pass. Held
+    open, a read is one pread() from offset 0, which makes kernfs call the
+    attribute's show() afresh, and a write is one pwrite() (store() never
+    looks at the offset). The read and write descriptors are opened
+    separately and only when first needed, since most attributes are one
+    or the other.
+
+    A driver reload leaves the descriptors pointing at attributes that no
+    longer exist; the first call to find that out reopens by path, onto the
+    same descriptor numbers, and tries once more. Whatever was known about
+    the hardware's settings is forgotten at the same moment (see write_attr).
+    """
+    __slots__ = ('path', 'shadow', '_rfd', '_wfd', '_regular', '_lock')
+
+    def __init__(self, path: str):
+        self.path = path
+        # The last value written with shadow=True, while it is still known
+        # to be what the hardware holds; None once it is not.
+        self.shadow = None
+        self._rfd = None
+        self._wfd = None
+        self._regular = False
+        self._lock = threading.Lock()
+
+    def _fd(self, write: bool) -> int:
+        fd = self._wfd if write else self._rfd
+        if fd is not None:
+            return fd
+        with self._lock:
+            if write:
+                if self._wfd is None:
+                    self._wfd = os.open(self.path, os.O_WRONLY | os.O_CLOEXEC)
+                    # A regular file (a test tree, a simulated one) keeps
+                    # whatever tail a shorter value does not overwrite; an
+                    # attribute has no tail to keep.
+                    self._regular = stat.S_ISREG(os.fstat(self._wfd).st_mode)
+                return self._wfd
+            if self._rfd is None:
+                self._rfd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+            return self._rfd
+
+    def read_bytes(self, size: int = _ATTR_READ_MAX) -> bytes:
+        if _attr_stats is None:
+            return self._read(size)
+        t0 = perf_counter_ns()
+        failed = True
+        try:
+            data = self._read(size)
+            failed = False
+            return data
+        finally:
+            _record(self.path, 'read', t0, failed)
+
+    def _read(self, size: int) -> bytes:
+        try:
+            return os.pread(self._fd(False), size, 0)
+        except OSError as e:
+            if e.errno not in _STALE:
+                raise
+            self._reopen()
+            return os.pread(self._fd(False), size, 0)
+
+    def read(self) -> str:
+        return self.read_bytes().decode().strip()
+
+    def readinto(self, buf) -> int:
+        """Read the attribute into ``buf`` (any writable buffer) in place, for
+        a caller reading the same attribute at a high rate without making a
+        new bytes object each time; the bytes read."""
+        if _attr_stats is None:
+            return self._readinto(buf)
+        t0 = perf_counter_ns()
+        failed = True
+        try:
+            n = self._readinto(buf)
+            failed = False
+            return n
+        finally:
+            _record(self.path, 'read', t0, failed)
+
+    def _readinto(self, buf) -> int:
+        try:
+            return os.preadv(self._fd(False), [buf], 0)
+        except OSError as e:
+            if e.errno not in _STALE:
+                raise
+            self._reopen()
+            return os.preadv(self._fd(False), [buf], 0)
+
+    def _pwrite(self, data: bytes) -> None:
+        fd = self._fd(True)
+        os.pwrite(fd, data, 0)
+        if self._regular:
+            os.ftruncate(fd, len(data))
+
+    def write(self, val: Union[str, bytes]) -> None:
+        data = val if isinstance(val, bytes) else str(val).encode()
+        if _attr_stats is None:
+            self._write(data)
+            return
+        t0 = perf_counter_ns()
+        failed = True
+        try:
+            self._write(data)
+            failed = False
+        finally:
+            _record(self.path, 'write', t0, failed)
+
+    def _write(self, data: bytes) -> None:
+        try:
+            self._pwrite(data)
+        except OSError as e:
+            # Only a descriptor that went stale is retried: a store() that
+            # refused the value has already answered, and some attributes
+            # (resume, run) are commands that must not be issued twice.
+            if e.errno not in _STALE:
+                raise
+            self._reopen()
+            self._pwrite(data)
+
+    def _reopen(self) -> None:
+        # The driver went away under this descriptor, and came back with
+        # every setting at its default.
+        logger.warning('%s went stale; reopening (driver reloaded?)', self.path)
+        invalidate_shadow()
+        with self._lock:
+            for slot, flags in (('_rfd', os.O_RDONLY), ('_wfd', os.O_WRONLY)):
+                old = getattr(self, slot)
+                if old is None:
+                    continue
+                # The new open takes over the old one's number, so a thread
+                # that fetched the number before the reload reaches the new
+                # attribute with it. Closed first, the number could be given
+                # to an unrelated open and that thread's write land there.
+                fd = os.open(self.path, flags | os.O_CLOEXEC)
+                if fd == old:
+                    # The old one was closed outright, and its number free.
+                    continue
+                try:
+                    os.dup2(fd, old, inheritable=False)
+                finally:
+                    os.close(fd)
+
+    def close(self) -> None:
+        """Let the descriptors go, for when nothing is reading or writing
+        through them any more (at shutdown, or before a driver reload)."""
+        with self._lock:
+            for fd in (self._rfd, self._wfd):
+                if fd is not None:
+                    try:
+                        os.close(fd)
+                    except OSError:
+                        pass
+            self._rfd = None
+            self._wfd = None
+
+
+_attrs = {}
+_attrs_lock = threading.Lock()
+
+
+def sysfs_attr(attr: str) -> SysfsAttr:
+    """The process-wide handle for an attribute path, opened on first use."""
+    handle = _attrs.get(attr)
+    if handle is None:
+        with _attrs_lock:
+            handle = _attrs.setdefault(attr, SysfsAttr(attr))
+    return handle
+
+
+def close_attrs() -> None:
+    """Drop every held attribute descriptor (before a driver reload, or at
+    shutdown); the next access reopens by path."""
+    with _attrs_lock:
+        handles = list(_attrs.values())
+        _attrs.clear()
+    for handle in handles:
+        handle.close()
+
+
+def read_attr(attr: str, binary: bool = False) -> Union[str, bytes]:
+    """read_file() for an attribute read over and over: through its held
+    descriptor rather than an open per call."""
+    handle = sysfs_attr(attr)
+    return handle.read_bytes() if binary else handle.read()
+
+
+_shadow_skips = 0
+
+
+def write_attr(attr: str, val: Union[str, int], shadow: bool = False) -> None:
+    """
+    Write one attribute value.
+
+    ``shadow`` is for settings this process is the only writer of (step
+    frequency, microstep modes, currents, LED levels): the value written is
+    remembered, and writing the same value again is skipped rather than
+    costing another PIC or driver transaction. Never for commands or
+    anything the driver changes on its own. A failed write forgets the value,
+    since the hardware may or may not hold it; invalidate_shadow() forgets on
+    purpose, wherever the hardware may have been reset underneath.
+    """
+    global _shadow_skips
+    handle = sysfs_attr(attr)
+    data = str(val)
+    if shadow and handle.shadow == data:
+        # Writers on several threads count here: one read-modify-write at a
+        # time, or a skip is lost.
+        with _attrs_lock:
+            _shadow_skips += 1
+        return
+    handle.shadow = None
+    handle.write(data)
+    if shadow:
+        handle.shadow = data
+
+
+def invalidate_shadow(prefix: str = '') -> None:
+    """Forget the shadowed value of every attribute under ``prefix`` (all of
+    them by default), so the next write of each goes through."""
+    with _attrs_lock:
+        handles = [h for path, h in _attrs.items() if path.startswith(prefix)]
+    for handle in handles:
+        handle.shadow = None
 
 
-def write_attr(attr: str, val: Union[str, int]) -> None:
-    write_file(attr, str(val))
+def shadow_skips() -> int:
+    """Writes skipped so far because the attribute already held the value."""
+    return _shadow_skips
 
 
 def load_installed_extension(name: str):
@@ -144,7 +671,11 @@ __all__ = [
     # Enums
     'ButtonColor', 'Dir', 'EventCode', 'InputSwitch', 'MachineState', 'Microstep', 'SynCode', 'ZCur',
     # Functions
-    'load_installed_extension', 'read_file', 'write_attr', 'write_file',
+    'attr_stats', 'close_attrs', 'dump_attr_stats', 'enable_attr_stats', 'install_attr_stats_signal',
+    'invalidate_shadow', 'load_installed_extension', 'read_attr', 'read_file', 'shadow_skips', 'sysfs_attr',
+    'write_attr', 'write_file',
+    # Classes
+    'AxisReading', 'LatencyHistogram', 'PositionRecord', 'SysfsAttr',
     # Named Tuples
-    'AxisPosition', 'HeadInfo', 'Position', 'PulsPosition', 'SwitchEvent', 'Temperature'
+    'AxisPosition', 'CncConfig', 'HeadInfo', 'Position', 'PulsPosition', 'SwitchEvent', 'Temperature'
 ]
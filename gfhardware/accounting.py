@@ -0,0 +1,705 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+SPDX-License-Identifier:    MIT
+
+Step accounting for the pulse feed.
+
+Every chunk the ring accepts is handed to an accountant, which totals its
+steps and laser records with decode_all_steps. The totals are checked when the
+job ends and not before, so nothing waits on them while it runs: the only
+question is where the decoding happens. StreamingAccountant folds each chunk
+into a StepDecoder as it is written and lets it go. InlineAccountant keeps
+chunks and decodes them on the feeder's thread while the ring is full.
+ProcessAccountant decodes in a child process, off the interpreter whose
+threads react to the lid and the button.
+
+Whichever it is also keeps a PositionIndex: where the program has the head,
+and whether it has the laser on, every INDEX_STRIDE bytes, so a byte offset
+can be placed without asking the kernel. The index counts nothing itself: the
+decoding is cut at its entries, and each takes the totals the decoding has
+reached there.
+"""
+import logging
+import mmap
+import multiprocessing
+import os
+import signal
+import threading
+from array import array
+from bisect import bisect_right
+from collections import Counter, deque
+from multiprocessing.connection import Connection
+from time import monotonic
+
+from gfutilities.puls import decode_all_steps
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from gfhardware import _child
+from gfhardware._common import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# How many enqueued bytes may sit undecoded before the accounting is forced
+# to catch up in line with the feed. Set above the largest ring so filling one
+# never stalls on it: the backlog is bounded by the ring in any case, since a
+# full ring is exactly when the feeder has time to decode.
+PENDING_MAX = 48 * 1024 * 1024
+
+# Chunks a ProcessAccountant holds in shared memory at once. The child
+# decodes hundreds of times faster than the ring plays, so a handful keeps
+# it busy and bounds what the feed can get ahead by.
+SLOTS = 8
+
+# Program bytes between two entries of a PositionIndex: 6.5 s of motion at a
+# print's 10 kHz, and 17 bytes of index per entry, so a three-hour job is
+# indexed in under 30 kB.
+INDEX_STRIDE = 64 * 1024
+
+
+def _increments() -> tuple:
+    # For each byte value, what decode_all_steps counts it as: one of each of
+    # XP, XN, YP, YN, ZP, ZN, LE and LP that it is. A power record is only
+    # that; any other record may step every axis and enable the laser at once.
+    table = []
+    for b in range(256):
+        if b & 0x80:
+            table.append((0, 0, 0, 0, 0, 0, 0, 1))
+            continue
+        table.append((int(b & 0x03 == 0x01), int(b & 0x03 == 0x03),
+                      int(b & 0x0C == 0x0C), int(b & 0x0C == 0x04),
+                      int(b & 0x60 == 0x20), int(b & 0x60 == 0x60),
+                      int(b & 0x10 == 0x10), 0))
+    return tuple(table)
+
+
+_INCREMENTS = _increments()
+# The totals the eight columns of _INCREMENTS add up to, in their order.
+_SUM_KEYS = ('XP', 'XN', 'YP', 'YN', 'ZP', 'ZN', 'LE', 'LP')
+_INCREMENT_MATRIX = numpy.array(_INCREMENTS, dtype=numpy.int64) if numpy is not None else None
+
+# The ways a StepDecoder can count, fastest first. 'numpy' needs NumPy;
+# 'reference' is decode_all_steps itself, and always there.
+ENGINES = ('numpy', 'counter', 'reference')
+# Per engine, whether it reproduces this gfutilities' decode_all_steps: found
+# out the first time a decoder asks for it.
+_verified = {'reference': True}
+
+
+def _engine_ok(engine: str) -> bool:
+    ok = _verified.get(engine)
+    if ok is None:
+        if engine == 'numpy' and numpy is None:
+            ok = False
+        else:
+            # Every byte value, counted on from carried totals (as a resumed
+            # job is) and then fed in chunks of uneven size, each starting
+            # on a different byte value.
+            probe = bytes(range(256)) * 3 + bytes(range(255, -1, -1)) * 2
+            decoder = StepDecoder.__new__(StepDecoder)
+            decoder._setup(engine)
+            decoder.carry(decode_all_steps(probe[:100]))
+            at = 100
+            for size in (1, 7, 255, 256, 300):
+                decoder.feed(probe[at:at + size])
+                at += size
+            decoder.feed(probe[at:])
+            ok = decoder.stats == decode_all_steps(probe)
+            if not ok:
+                logger.warning('%s step decoder disagrees with decode_all_steps; not using it', engine)
+        _verified[engine] = ok
+    return ok
+
+
+class StepDecoder(object):
+    """
+    Step and laser totals for a program fed to it a chunk at a time.
+
+    Every record is one byte, so no record spans two chunks and the only
+    state carried between them is how many of each byte value have been
+    seen: at most 256 counters, from which stats gives the totals in
+    decode_all_steps' format. A chunk can be freed as soon as feed()
+    returns.
+
+    ``engine`` is the first of ENGINES to try. 'numpy' counts a chunk with
+    one bincount over a view of it, 'counter' with Counter.update(), both
+    in C. An engine is only used once it has been checked against
+    decode_all_steps on every byte value, fed in several chunks. Until
+    then, and for one that is missing or disagrees, the next engine is used.
+
+    Both convert the whole program's counts to lengths once, so their
+    totals equal decode_all_steps of the program in one piece, however it
+    is cut. decode_all_steps chained a chunk at a time (the 'reference'
+    engine, and the accountants that decode in line) adds up each chunk's
+    own lengths instead: the counts are the same, but the MM and IN totals
+    can differ from these in the last bits.
+    """
+
+    def __init__(self, engine: str = ENGINES[0]):
+        for name in ENGINES[ENGINES.index(engine):]:
+            if _engine_ok(name):
+                break
+        self._setup(name)
+
+    def _setup(self, engine: str) -> None:
+        self.engine = engine
+        self.bytes = 0
+        self._stats = None
+        self._base = None
+        if engine == 'numpy':
+            self._hist = numpy.zeros(256, dtype=numpy.int64)
+        elif engine == 'counter':
+            self._hist = Counter()
+        else:
+            self._hist = None
+
+    def feed(self, chunk, index: 'PositionIndex' = None) -> None:
+        """Count one chunk of the program, in program order, and with an
+        ``index``, give it an entry wherever one falls in the chunk."""
+        if index is None:
+            self._count(chunk)
+            return
+        for piece in index.pieces(chunk):
+            self._count(piece)
+            if index.advance(piece):
+                index.mark(self.stats)
+
+    def _count(self, chunk) -> None:
+        self.bytes += len(chunk)
+        if self.engine == 'numpy':
+            self._hist += numpy.bincount(numpy.frombuffer(chunk, dtype=numpy.uint8), minlength=256)
+        elif self.engine == 'counter':
+            self._hist.update(chunk)
+        else:
+            self._stats = decode_all_steps(chunk, self._stats)
+
+    def carry(self, stats: dict) -> None:
+        """Count on from ``stats``, the totals of the program before the
+        first chunk this decoder is fed."""
+        if self._hist is None:
+            self._stats = stats
+        else:
+            self._base = [stats[key] for key in _SUM_KEYS]
+
+    @property
+    def stats(self) -> dict:
+        """The totals so far, as decode_all_steps would give them for the
+        whole program in one piece; None before the first chunk."""
+        if self._hist is None or not (self.bytes or self._base):
+            return self._stats
+        if not self.bytes:
+            sums = [0] * 8
+        elif self.engine == 'numpy':
+            sums = (self._hist @ _INCREMENT_MATRIX).tolist()
+        else:
+            sums = [0] * 8
+            for b, n in self._hist.items():
+                for i, inc in enumerate(_INCREMENTS[b]):
+                    if inc:
+                        sums[i] += n
+        if self._base is not None:
+            sums = [a + b for a, b in zip(sums, self._base)]
+        xp, xn, yp, yn, zp, zn, le, lp = sums
+        cnt = {'XP': xp, 'XN': xn, 'XTOT': xp + xn, 'XEND': xp - xn,
+               'YP': yp, 'YN': yn, 'YTOT': yp + yn, 'YEND': yp - yn,
+               'ZP': zp, 'ZN': zn, 'ZTOT': zp + zn, 'ZEND': zp - zn,
+               'LE': le, 'LP': lp}
+        # decode_all_steps' own conversion, at its default microstep modes.
+        for axis in ('X', 'Y'):
+            cnt[axis + 'MM'] = (cnt[axis + 'END'] / 8) * 0.15
+        cnt['ZMM'] = (cnt['ZEND'] / 2) * 0.70612
+        for axis in ('X', 'Y', 'Z'):
+            cnt[axis + 'IN'] = cnt[axis + 'MM'] / 25.4
+        return cnt
+
+
+class PositionIndex(object):
+    """
+    Where the program puts the head, every ``stride`` bytes of it.
+
+    The index is kept by whatever decodes the program, in order: it cuts
+    each chunk into pieces() that end where an entry falls, counts a piece,
+    and passes it to advance(), then, where that says an entry is due,
+    gives mark() its totals from the start of the job. An entry is kept at
+    offset 0 and at every multiple of ``stride``: the step position of each
+    axis, and whether the last motion record before it enabled the laser.
+    The entries are kept in arrays, and at() finds the one for a byte offset
+    by bisection.
+    """
+
+    def __init__(self, stride: int = INDEX_STRIDE):
+        self.stride = stride
+        self.bytes = 0
+        self._offsets = array('Q', [0])
+        self._x = array('q', [0])
+        self._y = array('q', [0])
+        self._z = array('q', [0])
+        self._laser = array('B', [0])
+        self._laser_on = 0
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def pieces(self, chunk):
+        """``chunk`` as views that each end where an entry falls, or at the
+        chunk's end."""
+        view = memoryview(chunk)
+        start = 0
+        at = self.bytes
+        while start < len(view):
+            end = start + self.stride - at % self.stride
+            piece = view[start:end]
+            at += len(piece)
+            start += len(piece)
+            yield piece
+
+    def advance(self, piece) -> bool:
+        """Move past a piece that has been counted; True if it ends where an
+        entry is due, which mark() is then to make."""
+        self.bytes += len(piece)
+        # A power record says nothing of the enable; the last motion record does.
+        for b in reversed(piece):
+            if not b & 0x80:
+                self._laser_on = int(b & 0x10 == 0x10)
+                break
+        return not self.bytes % self.stride
+
+    def mark(self, stats: dict) -> None:
+        """Make the entry that is due, from ``stats``: the step totals from
+        the start of the job to here, in decode_all_steps' format."""
+        self._append(self.bytes, stats['XEND'], stats['YEND'], stats['ZEND'], self._laser_on)
+
+    def at(self, offset: int) -> tuple:
+        """``(offset, x, y, z, laser_on)`` for the last entry at or before
+        ``offset``: within ``stride`` bytes of it."""
+        i = bisect_right(self._offsets, offset) - 1
+        return (self._offsets[i], self._x[i], self._y[i], self._z[i], bool(self._laser[i]))
+
+    def entries(self, start: int = 0) -> list:
+        """Entries from the ``start``-th on, as (offset, x, y, z, laser)."""
+        return list(zip(self._offsets[start:], self._x[start:], self._y[start:],
+                        self._z[start:], self._laser[start:]))
+
+    def extend(self, entries) -> None:
+        """Append entries taken from another index of the same program."""
+        for entry in entries:
+            self._append(*entry)
+            self.bytes = entry[0]
+
+    def cursor(self) -> tuple:
+        """How far the index has got, as (bytes, laser): with the entries,
+        and totals for the decoding to carry on from, what resume() needs to
+        index on from there."""
+        return (self.bytes, self._laser_on)
+
+    def resume(self, entries, cursor) -> None:
+        """Pick up an index of the same program where another left off:
+        its entries after the first, and its cursor()."""
+        self.extend(entries)
+        self.bytes, self._laser_on = cursor
+
+    def _append(self, offset: int, x: int, y: int, z: int, laser: int) -> None:
+        # The offset goes in last: at() on another thread sees an entry
+        # only once the rest of it is there.
+        self._x.append(x)
+        self._y.append(y)
+        self._z.append(z)
+        self._laser.append(laser)
+        self._offsets.append(offset)
+
+
+class InlineAccountant(object):
+    """
+    Decodes on the caller's thread, when the feeder has nothing else to do.
+
+    add() takes a chunk that is in the ring; idle() decodes the oldest one.
+    The feeder calls idle() while it waits on a full ring. Once PENDING_MAX
+    bytes are waiting, add() decodes in line with the feed.
+    """
+
+    def __init__(self):
+        self.index = PositionIndex()
+        self._stats = None
+        self._pending = deque()
+        self._pending_bytes = 0
+        self._release = None
+        self._books = threading.Lock()
+
+    @property
+    def stats(self) -> dict:
+        """Step and laser totals for the chunks accounted so far."""
+        return self._stats
+
+    @property
+    def pending(self) -> int:
+        """Bytes handed over and not yet accounted."""
+        return self._pending_bytes
+
+    def start(self, chunk: int, release=None) -> None:
+        """Ready for chunks of up to ``chunk`` bytes. ``release(buf)`` is
+        called with each chunk's buffer once its bytes are no longer needed."""
+        self._release = release
+
+    def add(self, view: memoryview, buf=None) -> None:
+        with self._books:
+            self._pending.append((view, buf))
+            self._pending_bytes += len(view)
+        while self._pending_bytes > PENDING_MAX:
+            self.idle()
+
+    def idle(self, limit: int = 1) -> None:
+        """Decode up to ``limit`` waiting chunks."""
+        for _ in range(limit):
+            with self._books:
+                if not self._pending:
+                    return
+                view, buf = self._pending.popleft()
+                self._pending_bytes -= len(view)
+                self._account(view)
+            view.release()
+            if buf is not None and self._release is not None:
+                self._release(buf)
+
+    def settle(self, timeout: float = 60.0) -> bool:
+        """Finish the accounting for everything handed over. False if it
+        could not be finished in ``timeout``."""
+        deadline = monotonic() + timeout
+        while self._pending:
+            if monotonic() > deadline:
+                logger.warning('step accounting incomplete: %d bytes undecoded',
+                               self._pending_bytes)
+                return False
+            self.idle(8)
+        return True
+
+    def close(self) -> None:
+        pass
+
+    def checkpoint(self) -> dict:
+        """The accounting so far, for a FeedJournal; called on the feeder's
+        thread, between chunks. None while there is any still to do, since
+        it would not match any one offset."""
+        if self.pending:
+            return None
+        return {'accounted': self.index.bytes, 'stats': self.stats,
+                'index': self.index.entries(1), 'cursor': self.index.cursor()}
+
+    def _account(self, view: memoryview) -> None:
+        for piece in self.index.pieces(view):
+            self._stats = decode_all_steps(piece, self._stats)
+            if self.index.advance(piece):
+                self.index.mark(self._stats)
+
+
+class StreamingAccountant(InlineAccountant):
+    """
+    Counts each chunk into a StepDecoder as it is handed over.
+
+    Nothing is kept: a chunk's buffer goes back to the feeder as soon as it
+    is counted, so the accounting holds 256 counters however long the job,
+    and settle() has nothing left to do.
+    """
+
+    def __init__(self):
+        InlineAccountant.__init__(self)
+        self._decoder = None
+
+    @property
+    def stats(self) -> dict:
+        with self._books:
+            return self._decoder.stats if self._decoder is not None else self._stats
+
+    def start(self, chunk: int, release=None) -> None:
+        InlineAccountant.start(self, chunk, release)
+        if self._decoder is None:
+            self._decoder = StepDecoder()
+
+    def resume(self, state: dict) -> None:
+        """Count on from a checkpoint() of the same program."""
+        self._decoder = StepDecoder()
+        if state['stats'] is not None:
+            self._decoder.carry(state['stats'])
+        self.index.resume(state['index'], state['cursor'])
+
+    def add(self, view: memoryview, buf=None) -> None:
+        if self._decoder is None:
+            self._decoder = StepDecoder()
+        with self._books:
+            self._decoder.feed(view, self.index)
+        view.release()
+        if buf is not None and self._release is not None:
+            self._release(buf)
+
+
+class KnownAccountant(InlineAccountant):
+    """
+    The accounting of a job accounted before, as the motion cache kept it.
+
+    Chunks are let go as they are handed over, uncounted. ``stats`` are the
+    totals of the whole program, given once ``program_size`` bytes have
+    been handed over and None before; the index is whole from the start.
+    ``added`` counts bytes already in the ring, for a job picked back up
+    after a restart.
+    """
+
+    def __init__(self, stats: dict, index: list, program_size: int, added: int = 0):
+        InlineAccountant.__init__(self)
+        self.index.extend(index)
+        self._known = stats
+        self._size = program_size
+        self._added = added
+
+    def checkpoint(self) -> dict:
+        # Nothing to write down: the cache has it all.
+        return None
+
+    @property
+    def stats(self) -> dict:
+        return self._known if self._added >= self._size else None
+
+    def add(self, view: memoryview, buf=None) -> None:
+        self._added += len(view)
+        view.release()
+        if buf is not None and self._release is not None:
+            self._release(buf)
+
+
+class ProcessAccountant(InlineAccountant):
+    """
+    Decodes in a child process, fed through shared memory.
+
+    add() copies the chunk into one of ``slots`` slots of a shared mapping
+    (a memfd) and tells the child which one. The child decodes it, then
+    hands the slot back with the running totals. When every slot is taken,
+    add() waits for one to come back. The copy is the only work left on the
+    feeder's thread. settle() tells the child it has everything and joins
+    it.
+
+    The child keeps the position index too, and sends each new entry back
+    with the totals.
+
+    The child is a new interpreter (see _child) holding the mapping and its
+    two pipes and nothing else. A child holding the pulse device would keep
+    the device's dead-man from firing if this process died. If the child cannot be started, or dies, the rest of the
+    job is decoded inline. A chunk it took with it is missing from the
+    totals, and settle() says so.
+    """
+
+    def __init__(self, slots: int = SLOTS):
+        InlineAccountant.__init__(self)
+        self._slots = slots
+        self._chunk = 0
+        self._shm = None
+        self._proc = None
+        self._todo = None
+        self._done = None
+        self._free = []
+        self._outstanding = 0
+        self._lost = 0
+        self._child_indexed = False
+
+    @property
+    def stats(self) -> dict:
+        self._reap()
+        return self._stats
+
+    @property
+    def pending(self) -> int:
+        return self._pending_bytes + self._outstanding
+
+    def start(self, chunk: int, release=None) -> None:
+        InlineAccountant.start(self, chunk, release)
+        size = chunk * self._slots
+        shm_fd = todo_r = done_w = None
+        try:
+            shm_fd = os.memfd_create('pulse-accounting')
+            os.ftruncate(shm_fd, size)
+            self._shm = mmap.mmap(shm_fd, size)
+            todo_r, self._todo = multiprocessing.Pipe(duplex=False)
+            self._done, done_w = multiprocessing.Pipe(duplex=False)
+            proc = _child.start('accounting', '_worker', (shm_fd, todo_r.fileno(), done_w.fileno()),
+                                shm_fd, size, chunk, self.index.stride,
+                                todo_r.fileno(), done_w.fileno())
+        except OSError as e:
+            logger.error('accounting process did not start (%s); decoding inline', e)
+            self.close()
+            return
+        finally:
+            # The child has its own copies now, or there is no child.
+            if shm_fd is not None:
+                os.close(shm_fd)
+            for conn in (todo_r, done_w):
+                if conn is not None:
+                    conn.close()
+        self._proc = proc
+        self._chunk = chunk
+        self._child_indexed = True
+        self._free = list(range(self._slots))
+
+    def add(self, view: memoryview, buf=None) -> None:
+        if self._proc is None:
+            return InlineAccountant.add(self, view, buf)
+        while True:
+            with self._books:
+                self._reap_locked(0)
+                done = self._done
+                if done is not None and self._free:
+                    slot = self._free.pop()
+                    off = slot * self._chunk
+                    self._shm[off:off + len(view)] = view
+                    try:
+                        self._todo.send((slot, len(view)))
+                    except OSError:
+                        self._lose()
+                        done = None
+                    else:
+                        self._outstanding += len(view)
+                        break
+            if done is None:
+                return InlineAccountant.add(self, view, buf)
+            # Every slot is with the child: wait for one outside the lock,
+            # so a reader of the totals is not held up behind the feed.
+            _wait(done, 0.5)
+        view.release()
+        if buf is not None and self._release is not None:
+            self._release(buf)
+
+    def idle(self, limit: int = 1) -> None:
+        done = self._done
+        if done is None:
+            return InlineAccountant.idle(self, limit)
+        _wait(done, 0.05)
+        self._reap()
+
+    def settle(self, timeout: float = 60.0) -> bool:
+        deadline = monotonic() + timeout
+        with self._books:
+            proc = self._proc
+            if proc is not None:
+                try:
+                    self._todo.send(None)
+                except OSError:
+                    pass
+        while proc is not None and self._proc is not None:
+            if monotonic() > deadline:
+                logger.warning('step accounting incomplete: %d bytes undecoded',
+                               self._outstanding)
+                return False
+            with self._books:
+                self._reap_locked(0.05)
+                if self._proc is not None and not self._outstanding and not proc.is_alive():
+                    self._detach()
+        if not InlineAccountant.settle(self, max(0.0, deadline - monotonic())):
+            return False
+        if self._lost:
+            logger.warning('step accounting incomplete: %d bytes lost with the '
+                           'accounting process', self._lost)
+            return False
+        return True
+
+    def checkpoint(self) -> dict:
+        # The child's index cannot be picked up from part-way through a
+        # stride, so a resumed job counts its accounting again instead.
+        return None
+
+    def close(self) -> None:
+        with self._books:
+            proc = self._proc
+            self._detach()
+        if proc is not None and proc.is_alive():
+            proc.terminate()
+            proc.join(1.0)
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+    def _reap(self) -> None:
+        with self._books:
+            self._reap_locked(0)
+
+    def _reap_locked(self, timeout: float) -> None:
+        # Take back every slot the child has finished with, and the totals
+        # that came with the last of them.
+        if self._proc is None:
+            return
+        try:
+            while self._done.poll(timeout):
+                slot, n, stats, entries = self._done.recv()
+                self._free.append(slot)
+                self._outstanding -= n
+                self._stats = stats
+                self.index.extend(entries)
+                timeout = 0
+        except (EOFError, OSError):
+            self._lose()
+
+    def _account(self, view: memoryview) -> None:
+        # The child's index ends at its last entry, without the counts since:
+        # what it decoded cannot be continued here, so the index stops there.
+        if self._child_indexed:
+            self._stats = decode_all_steps(view, self._stats)
+        else:
+            InlineAccountant._account(self, view)
+
+    def _lose(self) -> None:
+        # The child is gone: what it held is gone with it.
+        if self._outstanding:
+            logger.error('accounting process ended with %d bytes undecoded; '
+                         'decoding the rest inline', self._outstanding)
+            self._lost += self._outstanding
+            self._outstanding = 0
+        self._detach()
+
+    def _detach(self) -> None:
+        proc, self._proc = self._proc, None
+        for conn in (self._todo, self._done):
+            if conn is not None:
+                conn.close()
+        self._todo = self._done = None
+        if proc is not None:
+            proc.join(1.0)
+
+
+def _wait(conn, timeout: float) -> None:
+    # A pipe another thread may close under us: closed is as good as ready.
+    try:
+        conn.poll(timeout)
+    except (EOFError, OSError):
+        pass
+
+
+def _worker(shm_fd: int, size: int, chunk: int, stride: int, todo_fd: int, done_fd: int) -> None:
+    # The child, started by _child with the mapping and the two pipes and
+    # nothing else open. A ^C at the console is the parent's business.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    shm = mmap.mmap(shm_fd, size)
+    os.close(shm_fd)
+    todo = Connection(todo_fd, writable=False)
+    done = Connection(done_fd, readable=False)
+    decoder = StepDecoder()
+    index = PositionIndex(stride)
+    sent = len(index)
+    mem = memoryview(shm)
+    while True:
+        try:
+            msg = todo.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        slot, n = msg
+        off = slot * chunk
+        decoder.feed(mem[off:off + n], index)
+        entries = index.entries(sent)
+        sent = len(index)
+        done.send((slot, n, decoder.stats, entries))
+    mem.release()
+
+
+__all__ = ['ENGINES', 'InlineAccountant', 'KnownAccountant', 'PositionIndex', 'ProcessAccountant', 'StepDecoder',
+           'StreamingAccountant', 'INDEX_STRIDE', 'PENDING_MAX']
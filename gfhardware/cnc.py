@@ -6,12 +6,106 @@ SPDX-License-Identifier:    MIT
 """
 import logging
 import os
-from typing import Union
+import select
+from collections.abc import Mapping
+from threading import Event
+from time import monotonic, perf_counter, sleep
+from typing import Iterable, Iterator, Union
 
 from gfhardware._common import *
+from gfhardware.sdma import parse_sdma
 
 logger = logging.getLogger(LOGGER_NAME)
 
+# How often a wait re-reads cnc/state when no notification comes: from the
+# first interval, doubling while nothing changes, up to the last. A change
+# starts it over, since one transition (stop, then idle) tends to follow
+# another.
+STATE_POLL_MIN_S = 0.005
+STATE_POLL_MAX_S = 0.1
+# Once the driver has been seen to notify, a wait sleeps until it does. It
+# still looks on its own this often, in case some transition is not
+# notified: a missed wakeup then costs no more than the slowest poll would.
+STATE_NOTIFY_BACKSTOP_S = STATE_POLL_MAX_S
+
+# The stepper settings apply() takes, in the order it writes them: each
+# driver's decay and current before the microstep mode that runs on them, and
+# the step rate, which sets how fast all of it moves, last.
+APPLY_ORDER = ('x_decay', 'y_decay', 'x_current', 'y_current', 'x_mode', 'y_mode', 'step_freq')
+_APPLY_ATTRS = {
+    'step_freq': 'cnc/step_freq',
+    'x_decay': 'cnc/x_decay',
+    'y_decay': 'cnc/y_decay',
+    'x_mode': 'cnc/x_mode',
+    'y_mode': 'cnc/y_mode',
+    'x_current': 'pic/x_step_current',
+    'y_current': 'pic/y_step_current',
+}
+# What a reset leaves the steppers at.
+RESET_CONFIG = CncConfig(step_freq=10000, x_mode=Microstep.M_8, y_mode=Microstep.M_8,
+                         x_decay=1, y_decay=1, x_current=33, y_current=33)
+
+
+_STATES = {
+    'disabled': MachineState.DISABLED,
+    'idle': MachineState.IDLE,
+    'running': MachineState.RUNNING,
+    'fault': MachineState.FAULT,
+    'underrun': MachineState.UNDERRUN,
+}
+
+
+def _parse_state(state: str) -> MachineState:
+    # An unknown state degrades to FAULT: not running, not safe to start.
+    try:
+        return _STATES[state]
+    except KeyError:
+        logger.error('invalid cnc state: %r' % (state,))
+        return MachineState.FAULT
+
+
+class _StateWatch(object):
+    """
+    cnc/state on a descriptor of its own, for one wait on its changes.
+
+    kernfs keeps a notification per open file, and the next read through
+    that file consumes it. The shared descriptor is read by the run loop,
+    the recorder and the samplers as well, any of which could take a
+    notification before the waiter saw it; nothing else reads this one.
+    """
+
+    def __init__(self, path: str):
+        try:
+            self._fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        except OSError:
+            self._fd = None
+            return
+        self._poller = select.poll()
+        self._poller.register(self._fd, select.POLLPRI | select.POLLERR)
+
+    def read(self) -> MachineState:
+        if self._fd is None:
+            return cnc.state
+        try:
+            return _parse_state(os.pread(self._fd, 64, 0).decode().strip())
+        except OSError:
+            return MachineState.FAULT
+
+    def wait(self, timeout: float) -> bool:
+        """Block until the driver notifies, or for ``timeout`` seconds; True
+        if it did."""
+        if self._fd is None:
+            # Nothing to poll on (the attribute is unreadable right now);
+            # the read that follows degrades to FAULT and says so.
+            sleep(timeout)
+            return False
+        return bool(self._poller.poll(max(0, int(timeout * 1000))))
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
 
 class _CNC(object):
     # Externally-held exclusive /dev/glowforge file object (the job-scoped
@@ -20,11 +114,28 @@ class _CNC(object):
     # fd instead of opening the device again (which would fail -EBUSY).
     pulse_dev = None
 
+    # What opens the pulse device when nothing holds it: None for the device
+    # itself, or a callable returning a file-like stand-in (gfhardware.sim),
+    # whose seeks cannot be carried by a plain file.
+    pulse_opener = None
+
     @staticmethod
     def set_pulse_dev(dev):
         """Register (or clear, with None) the job-held pulse-device file."""
         _CNC.pulse_dev = dev
 
+    @staticmethod
+    def set_pulse_opener(opener):
+        """Route pulse-device opens through ``opener`` (None restores the device)."""
+        _CNC.pulse_opener = opener
+
+    @staticmethod
+    def open_pulse_dev():
+        """Open the pulse device for writing, unbuffered."""
+        if _CNC.pulse_opener is not None:
+            return _CNC.pulse_opener()
+        return open(PULS_DEVICE, 'wb', buffering=0)
+
     @staticmethod
     def clear_all():
         _CNC._dev_seek(0)
@@ -39,12 +150,12 @@ class _CNC(object):
 
     @staticmethod
     def _command(cmd: str):
-        write_file(SYSFS_GF_BASE + 'cnc/' + cmd, '1')
+        write_attr(SYSFS_GF_BASE + 'cnc/' + cmd, 1)
 
     @staticmethod
     def _dev_seek(count):
         if _CNC.pulse_dev is not None:
-            os.lseek(_CNC.pulse_dev.fileno(), count, os.SEEK_SET)
+            _CNC.pulse_dev.seek(count)
             return
         # The forgectrl broker holds the device exclusive-open for its
         # lifetime; seek through the inherited fd - a transient
@@ -53,8 +164,8 @@ class _CNC(object):
         if fd is not None:
             os.lseek(int(fd), count, os.SEEK_SET)
         else:
-            with open(PULS_DEVICE, 'w') as f:
-                os.lseek(f.fileno(), count, os.SEEK_SET)
+            with _CNC.open_pulse_dev() as f:
+                f.seek(count)
 
     @staticmethod
     def disable():
@@ -72,11 +183,11 @@ class _CNC(object):
 
     @property
     def faults(self) -> str:
-        return read_file(SYSFS_GF_BASE + 'cnc/faults')
+        return read_attr(SYSFS_GF_BASE + 'cnc/faults')
 
     @property
     def ignored_faults(self) -> str:
-        return read_file(SYSFS_GF_BASE + 'cnc/ignored_faults')
+        return read_attr(SYSFS_GF_BASE + 'cnc/ignored_faults')
 
     @staticmethod
     def laser_latch(val):
@@ -85,22 +196,25 @@ class _CNC(object):
 
     @property
     def motor_lock(self) -> str:
-        return read_file(SYSFS_GF_BASE + 'cnc/motor_lock')
+        return read_attr(SYSFS_GF_BASE + 'cnc/motor_lock')
 
     @property
-    def position(self) -> Position:
-        raw = read_file(SYSFS_GF_BASE + 'cnc/position', True)
-        # Full 4-byte little-endian words; 3-byte slices would drop each MSB
-        # and wrap the counters at 16 MiB.
-        return Position(
-            _CNC.position_calc(int.from_bytes(raw[0:4], byteorder='little', signed=True), self.x_mode, XY_STEP_PER_MM),
-            _CNC.position_calc(int.from_bytes(raw[4:8], byteorder='little', signed=True), self.y_mode, XY_STEP_PER_MM),
-            _CNC.position_calc(int.from_bytes(raw[8:12], byteorder='little', signed=True), 2, Z_STEP_PER_MM),
-            PulsPosition(
-                int.from_bytes(raw[16:20], byteorder='little', signed=False),
-                int.from_bytes(raw[12:16], byteorder='little', signed=False)
-            )
-        )
+    def position(self) -> PositionRecord:
+        raw = read_attr(SYSFS_GF_BASE + 'cnc/position', True)
+        return PositionRecord(raw, _CNC._mode('x'), _CNC._mode('y'))
+
+    # The X and Y microstep modes, as last set here: they change only at a
+    # job's phase boundaries, and every position read would otherwise pay two
+    # attribute reads for them. None until set (or read once, at the first
+    # position), and forgotten with the rest of the settings on a reset.
+    _modes = {'x': None, 'y': None}
+
+    @staticmethod
+    def _mode(axis: str) -> int:
+        mode = _CNC._modes[axis]
+        if mode is None:
+            mode = _CNC._modes[axis] = int(read_attr(SYSFS_GF_BASE + 'cnc/%s_mode' % axis))
+        return mode
 
     @staticmethod
     def position_calc(steps: int, mode: int, mm_per_step: float) -> AxisPosition:
@@ -109,6 +223,11 @@ class _CNC(object):
 
     @staticmethod
     def reset():
+        # A reset is what puts the hardware in a known state, so it writes
+        # every setting through whatever this process last wrote.
+        invalidate_shadow(SYSFS_GF_BASE + 'cnc/')
+        invalidate_shadow(SYSFS_GF_BASE + 'pic/')
+        _CNC._modes.update(x=None, y=None)
         # Rail policy belongs to the forgectrl broker when it owns the
         # device (GF_PULSE_FD): a disable here, with the enable that
         # follows moments later in machine setup, is a fast off/on
@@ -118,13 +237,53 @@ class _CNC(object):
             _CNC.disable()
         _CNC.set_ignored_faults(0)
         _CNC.clear_all()
-        _CNC.set_step_freq(10000)
-        _CNC.set_x_mode(Microstep.M_8)
-        _CNC.set_y_mode(Microstep.M_8)
-        _CNC.set_x_decay(1)
-        _CNC.set_y_decay(1)
-        _CNC.set_x_current(33)
-        _CNC.set_y_current(33)
+        _CNC.apply(RESET_CONFIG)
+
+    @staticmethod
+    def apply(config) -> dict:
+        """
+        Bring the stepper settings to ``config`` in one pass.
+
+        ``config`` is a dict keyed by APPLY_ORDER names, or anything with them
+        as attributes (a CncConfig); a setting it leaves out or sets to None
+        is left alone. Only what differs from the value this process last
+        wrote is written, in APPLY_ORDER; a setting whose value is not known
+        (after a reset or a driver reload) is always written.
+
+        Returns what it did: {'written': {name: value}, 'held': [names
+        already at their value], 'write_ms': {name: ms}, 'total_ms': ms}.
+        """
+        if not isinstance(config, Mapping):
+            config = {name: getattr(config, name, None) for name in APPLY_ORDER}
+        unknown = set(config) - set(APPLY_ORDER)
+        if unknown:
+            raise ValueError('not a stepper setting: %s' % ', '.join(sorted(unknown)))
+        t0 = perf_counter()
+        written, held, write_ms = {}, [], {}
+        for name in APPLY_ORDER:
+            val = config.get(name)
+            if val is None:
+                continue
+            if isinstance(val, Microstep):
+                val = val.value
+            path = SYSFS_GF_BASE + _APPLY_ATTRS[name]
+            if sysfs_attr(path).shadow == str(val):
+                held.append(name)
+                continue
+            t = perf_counter()
+            if name in ('x_mode', 'y_mode'):
+                _CNC._modes[name[0]] = None
+                write_attr(path, val, shadow=True)
+                _CNC._modes[name[0]] = int(val)
+            else:
+                write_attr(path, val, shadow=True)
+            write_ms[name] = (perf_counter() - t) * 1000
+            written[name] = val
+        total_ms = (perf_counter() - t0) * 1000
+        if written:
+            logger.info('stepper settings: %s (%d already held; %.1f ms)',
+                        ' '.join('%s=%s' % kv for kv in written.items()), len(held), total_ms)
+        return {'written': written, 'held': held, 'write_ms': write_ms, 'total_ms': total_ms}
 
     @staticmethod
     def resume(steps: int):
@@ -140,47 +299,8 @@ class _CNC(object):
 
     @property
     def sdma_context(self) -> SDMA:
-        line = read_file(SYSFS_GF_BASE + 'cnc/sdma_context').splitlines()
-        return SDMA(**{
-            'pc': line[0][3:7],
-            'rpc': line[0][12:16],
-            'spc': line[0][21:25],
-            'epc': line[0][30:34],
-            't': line[1][9:10],
-            'sf': line[1][14:15],
-            'df': line[1][19:20],
-            'lm': line[1][24:25],
-            'r0': line[2][4:12],
-            'r1': line[2][17:25],
-            'r2': line[2][30:38],
-            'r3': line[2][43:51],
-            'r4': line[2][56:64],
-            'r5': line[2][69:77],
-            'r6': line[3][4:12],
-            'r7': line[3][17:25],
-            'mda': line[3][30:38],
-            'msa': line[3][43:51],
-            'ms': line[3][56:64],
-            'md': line[3][69:77],
-            'pda': line[4][4:12],
-            'psa': line[4][17:25],
-            'ps': line[4][30:38],
-            'pd': line[4][43:51],
-            'ca': line[4][56:64],
-            'cs': line[4][69:77],
-            'dda': line[5][4:12],
-            'dsa': line[5][17:25],
-            'ds': line[5][30:38],
-            'dd': line[5][43:51],
-            'sc0': line[5][56:64],
-            'sc1': line[5][69:77],
-            'sc2': line[6][4:12],
-            'sc3': line[6][17:25],
-            'sc4': line[6][30:38],
-            'sc5': line[6][43:51],
-            'sc6': line[6][56:64],
-            'sc7': line[6][69:77],
-        })
+        """The SDMA script's registers, as integers."""
+        return parse_sdma(read_attr(SYSFS_GF_BASE + 'cnc/sdma_context'))
 
     @staticmethod
     def set_ignored_faults(val: Union[str, int]):
@@ -195,41 +315,102 @@ class _CNC(object):
     @staticmethod
     def set_step_freq(val: Union[str, int]):
         logger.info(val)
-        write_attr(SYSFS_GF_BASE + 'cnc/step_freq', val)
+        write_attr(SYSFS_GF_BASE + 'cnc/step_freq', val, shadow=True)
 
     @staticmethod
     def set_x_current(val: Union[str, int]):
         logger.info(val)
-        write_attr(SYSFS_GF_BASE + 'pic/x_step_current', val)
+        write_attr(SYSFS_GF_BASE + 'pic/x_step_current', val, shadow=True)
 
     @staticmethod
     def set_x_decay(val: Union[str, int]):
         logger.info(val)
-        write_attr(SYSFS_GF_BASE + 'cnc/x_decay', val)
+        write_attr(SYSFS_GF_BASE + 'cnc/x_decay', val, shadow=True)
 
     @staticmethod
     def set_x_mode(val: Union[Microstep, int, str]):
         logger.info(val)
         if isinstance(val, Microstep):
             val = val.value
-        write_attr(SYSFS_GF_BASE + 'cnc/x_mode', val)
+        _CNC._modes['x'] = None
+        write_attr(SYSFS_GF_BASE + 'cnc/x_mode', val, shadow=True)
+        _CNC._modes['x'] = int(val)
 
     @staticmethod
     def set_y_current(val: Union[str, int]):
         logger.info(val)
-        write_attr(SYSFS_GF_BASE + 'pic/y_step_current', val)
+        write_attr(SYSFS_GF_BASE + 'pic/y_step_current', val, shadow=True)
 
     @staticmethod
     def set_y_decay(val: Union[str, int]):
         logger.info(val)
-        write_attr(SYSFS_GF_BASE + 'cnc/y_decay', val)
+        write_attr(SYSFS_GF_BASE + 'cnc/y_decay', val, shadow=True)
 
     @staticmethod
     def set_y_mode(val: Union[Microstep, int, str]):
         logger.info(val)
         if isinstance(val, Microstep):
             val = val.value
-        write_attr(SYSFS_GF_BASE + 'cnc/y_mode', val)
+        _CNC._modes['y'] = None
+        write_attr(SYSFS_GF_BASE + 'cnc/y_mode', val, shadow=True)
+        _CNC._modes['y'] = int(val)
+
+    # Whether the driver has been seen to sysfs_notify() cnc/state. Learned
+    # rather than assumed: a state that changed on a notification proves it,
+    # and until one has, waits poll.
+    state_notifies = False
+
+    def transitions(self, timeout: float = None, stop: Event = None) -> Iterator[MachineState]:
+        """Yield the driver state each time it changes.
+
+        Sleeps on the attribute's notification (POLLPRI/POLLERR) where the
+        driver gives one, so a transition is seen in one wakeup and a quiet
+        machine costs nothing; re-reads on an adaptive interval where it
+        does not. Ends after ``timeout`` seconds, or once ``stop`` is set.
+        """
+        watch = _StateWatch(SYSFS_GF_BASE + 'cnc/state')
+        try:
+            deadline = None if timeout is None else monotonic() + timeout
+            # The first read also takes the event kernfs reports on a file
+            # just opened, which is no transition.
+            last = watch.read()
+            interval = STATE_POLL_MIN_S
+            while stop is None or not stop.is_set():
+                wait = STATE_NOTIFY_BACKSTOP_S if _CNC.state_notifies else interval
+                if deadline is not None:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return
+                    wait = min(wait, remaining)
+                notified = watch.wait(wait)
+                state = watch.read()
+                if state is last:
+                    interval = min(interval * 2, STATE_POLL_MAX_S)
+                    continue
+                if notified and not _CNC.state_notifies:
+                    logger.info('cnc/state notifies; waits now sleep until it changes')
+                    _CNC.state_notifies = True
+                interval = STATE_POLL_MIN_S
+                last = state
+                yield state
+        finally:
+            watch.close()
+
+    def wait_state(self, states: Iterable[MachineState], timeout: float) -> Union[MachineState, None]:
+        """Block until the driver state is one of ``states``; that state, or
+        None if ``timeout`` seconds pass first."""
+        states = frozenset(states)
+        state = self.state
+        if state in states:
+            return state
+        changes = self.transitions(timeout=timeout)
+        try:
+            for state in changes:
+                if state in states:
+                    return state
+        finally:
+            changes.close()
+        return None
 
     @property
     def state(self) -> MachineState:
@@ -238,22 +419,10 @@ class _CNC(object):
         # start) instead of raising out of the poll and abandoning a
         # running job.
         try:
-            state = read_file(SYSFS_GF_BASE + 'cnc/state')
+            state = read_attr(SYSFS_GF_BASE + 'cnc/state')
         except OSError:
             return MachineState.FAULT
-        if state == 'disabled':
-            return MachineState.DISABLED
-        elif state == 'idle':
-            return MachineState.IDLE
-        elif state == 'running':
-            return MachineState.RUNNING
-        elif state == 'fault':
-            return MachineState.FAULT
-        elif state == 'underrun':
-            return MachineState.UNDERRUN
-        else:
-            logger.error('invalid cnc state: %r' % (state,))
-            return MachineState.FAULT
+        return _parse_state(state)
 
     @property
     def free(self) -> int:
@@ -263,7 +432,7 @@ class _CNC(object):
         pre-flight, never for pacing: a feeder paces on -ENOMEM from the
         write instead.
         """
-        return int(read_file(SYSFS_GF_BASE + 'cnc/free'))
+        return int(read_attr(SYSFS_GF_BASE + 'cnc/free'))
 
     @property
     def max_backtrack(self) -> int:
@@ -275,16 +444,30 @@ class _CNC(object):
         than quietly running a shorter one. Costs SDMA transactions, so read
         it once per pause, not in a loop.
         """
-        return int(read_file(SYSFS_GF_BASE + 'cnc/max_backtrack'))
+        return int(read_attr(SYSFS_GF_BASE + 'cnc/max_backtrack'))
 
     @property
     def step_freq(self) -> int:
-        return int(read_file(SYSFS_GF_BASE + 'cnc/step_freq'))
+        return int(read_attr(SYSFS_GF_BASE + 'cnc/step_freq'))
+
+    @property
+    def seconds_until_empty(self) -> float:
+        """How long the ring plays on what it already holds.
+
+        The bytes enqueued and not yet played, one a tick at the step rate.
+        The rate is the one this process last set where it knows it, so this
+        costs the one position read. A live feed that has stopped has this
+        long before the ring runs dry.
+        """
+        rate = sysfs_attr(SYSFS_GF_BASE + 'cnc/step_freq').shadow
+        rate = float(rate) if rate is not None else self.step_freq
+        pos = self.position
+        return max(0, pos.total - pos.processed) / max(1, rate)
 
     @property
     def streaming(self) -> bool:
         """Whether end-of-data mid-run counts as an underrun."""
-        return read_file(SYSFS_GF_BASE + 'cnc/streaming').strip() == '1'
+        return read_attr(SYSFS_GF_BASE + 'cnc/streaming').strip() == '1'
 
     @staticmethod
     def set_streaming(val: Union[bool, int, str]):
@@ -301,7 +484,7 @@ class _CNC(object):
     @property
     def underruns(self) -> int:
         """Streaming underruns since the module was loaded."""
-        return int(read_file(SYSFS_GF_BASE + 'cnc/underruns'))
+        return int(read_attr(SYSFS_GF_BASE + 'cnc/underruns'))
 
     @staticmethod
     def stop():
@@ -309,27 +492,27 @@ class _CNC(object):
 
     @property
     def x_current(self) -> int:
-        return int(read_file(SYSFS_GF_BASE + 'pic/x_step_current'))
+        return int(read_attr(SYSFS_GF_BASE + 'pic/x_step_current'))
 
     @property
     def y_current(self) -> int:
-        return int(read_file(SYSFS_GF_BASE + 'pic/y_step_current'))
+        return int(read_attr(SYSFS_GF_BASE + 'pic/y_step_current'))
 
     @property
     def x_decay(self) -> int:
-        return int(read_file(SYSFS_GF_BASE + 'cnc/x_decay'))
+        return int(read_attr(SYSFS_GF_BASE + 'cnc/x_decay'))
 
     @property
     def x_mode(self) -> int:
-        return int(read_file(SYSFS_GF_BASE + 'cnc/x_mode'))
+        return int(read_attr(SYSFS_GF_BASE + 'cnc/x_mode'))
 
     @property
     def y_decay(self) -> int:
-        return int(read_file(SYSFS_GF_BASE + 'cnc/y_decay'))
+        return int(read_attr(SYSFS_GF_BASE + 'cnc/y_decay'))
 
     @property
     def y_mode(self) -> int:
-        return int(read_file(SYSFS_GF_BASE + 'cnc/y_mode'))
+        return int(read_attr(SYSFS_GF_BASE + 'cnc/y_mode'))
 
 
 cnc = _CNC()
@@ -23,16 +23,16 @@ class _FanController(object):
 
     @property
     def pwm(self) -> int:
-        return int(read_file(self._pwm_path))
+        return int(read_attr(self._pwm_path))
 
     def set_pwm(self, speed: int = None):
         if speed > self._max_pwm or speed < self._min_pwm:
             raise ValueError("Speed must be between {} and {}.".format(self._min_pwm, self._max_pwm))
-        write_file(self._pwm_path, str(speed))
+        write_attr(self._pwm_path, speed)
 
     @property
     def tach(self) -> int:
-        val = int(read_file(self._tach_path))
+        val = int(read_attr(self._tach_path))
         if self._tach_calc is None:
             return val
         return self._tach_calc(val)
@@ -99,11 +99,11 @@ class Fans(object):
 class TEC(object):
     @staticmethod
     def on():
-        write_file(SYSFS_GF_BASE + 'thermal/tec_on', '1')
+        write_attr(SYSFS_GF_BASE + 'thermal/tec_on', '1')
 
     @staticmethod
     def off():
-        write_file(SYSFS_GF_BASE + 'thermal/tec_on', '0')
+        write_attr(SYSFS_GF_BASE + 'thermal/tec_on', '0')
 
 
 class _TempSensor(object):
@@ -113,7 +113,7 @@ class _TempSensor(object):
 
     @property
     def temp(self) -> Temperature:
-        raw_t = int(read_file(self._sensor_path))
+        raw_t = int(read_attr(self._sensor_path))
         if self._temp_calc is None:
             return Temperature(raw_t, -999.9, -999.9)
         c = round(self._temp_calc(raw_t), 1)
@@ -225,15 +225,15 @@ class _Temp(object):
 class WaterPump(object):
     @staticmethod
     def heater_off() -> None:
-        write_file(SYSFS_GF_BASE + 'thermal/heater_pwm', '0')
+        write_attr(SYSFS_GF_BASE + 'thermal/heater_pwm', '0')
 
     @staticmethod
     def on() -> None:
-        write_file(SYSFS_GF_BASE + 'thermal/water_pump_on', '1')
+        write_attr(SYSFS_GF_BASE + 'thermal/water_pump_on', '1')
 
     @staticmethod
     def off() -> None:
-        write_file(SYSFS_GF_BASE + 'thermal/water_pump_on', '0')
+        write_attr(SYSFS_GF_BASE + 'thermal/water_pump_on', '0')
 
     @staticmethod
     def set_heater(percentage: int) -> None:
@@ -6,13 +6,22 @@ https://community.openglow.org
 SPDX-License-Identifier:    MIT
 """
 import errno
+import io
 import logging
+import mmap
+import multiprocessing
+import os
+import queue
+import select
+import signal
 import threading
-from time import monotonic
-
-from gfutilities.puls import decode_all_steps
+from collections import deque
+from multiprocessing.connection import Connection
+from time import perf_counter
 
+from gfhardware import _child
 from gfhardware._common import LOGGER_NAME
+from gfhardware.accounting import InlineAccountant, StreamingAccountant
 from gfhardware.cnc import cnc
 
 logger = logging.getLogger(LOGGER_NAME)
@@ -21,20 +30,148 @@ logger = logging.getLogger(LOGGER_NAME)
 # millions of syscalls, small enough that a refusal costs little.
 CHUNK = 256 * 1024
 
-# How long to wait before offering a refused chunk again. The ring drains at
+# The longest wait before offering refused bytes again. The ring drains at
 # the step frequency (10 kB/s for a print), so a full ring stays full for
 # minutes: there is nothing to gain from asking more often.
 RETRY_S = 0.5
-
-# How many enqueued bytes may sit undecoded before the accounting is forced
-# to catch up in line with the feed. Set above the largest ring so filling one
-# never stalls on it: the backlog is bounded by the ring in any case, since a
-# full ring is exactly when the feeder has time to decode.
-PENDING_MAX = 48 * 1024 * 1024
+# The shortest: a device that reports room through poll() is waited on
+# instead, and one that does not is given the time its drain rate says the
+# next PARTIAL_MIN bytes of room take, within these bounds.
+RETRY_MIN_S = 0.01
+
+# The smallest piece of a chunk offered on its own. A refused chunk is offered
+# again in halves down to this, so a ring with some room takes what fits
+# rather than waiting for room for the whole chunk.
+PARTIAL_MIN = 4096
+
+# The most pieces of the job gathered into one write. A source that hands
+# back short reads is written in batches of up to CHUNK bytes, one writev()
+# each, rather than one write a piece.
+GATHER_MAX = 16
+
+# Spare chunk buffers kept for reuse once their bytes are accounted. The
+# backlog itself is bounded by the accountant; this bounds what is held idle.
+POOL_KEEP = 8
+
+# The spans, in seconds, the feed rate is reported over, and how often the
+# count behind them is sampled.
+RATE_WINDOWS_S = (10, 60, 300)
+RATE_SAMPLE_S = 1.0
 
 _BACKOFF = (errno.ENOMEM, errno.EBUSY, errno.EAGAIN)
 
 
+class _BufferPool:
+    """Chunk-sized buffers, handed back once their bytes are accounted.
+
+    A multi-hour print is hundreds of chunks, and a fresh object for each one
+    is hundreds of large allocations the allocator has to find room for on a
+    512 MB board. Reading into a buffer that has already been through the
+    ring and the accounting makes the steady state allocate nothing.
+    """
+
+    def __init__(self, size: int, keep: int = POOL_KEEP):
+        self.size = size
+        self._free = []
+        self._keep = keep
+        self._lock = threading.Lock()
+
+    def take(self) -> bytearray:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return bytearray(self.size)
+
+    def give(self, buf: bytearray) -> None:
+        with self._lock:
+            if len(self._free) < self._keep:
+                self._free.append(buf)
+
+
+class _FeedMetrics:
+    """Where a feed's time went, for PulseFeeder.metrics().
+
+    Timers are totals of perf_counter() spans, each added to by the one
+    thread doing that work; the rate samples are the only thing two threads
+    touch, and take the lock.
+    """
+
+    def __init__(self):
+        self.started = None
+        self.blocked_s = 0.0
+        self.read_s = 0.0
+        self.account_s = 0.0
+        self.refusals = 0
+        self.partial_probes = 0
+        self.backlog_max = 0
+        self.prefetch_max = 0
+        self._base = 0
+        self._samples = deque()
+        self._lock = threading.Lock()
+
+    def start(self, written: int = 0) -> None:
+        self.started = perf_counter()
+        self._base = written
+        self._samples.append((self.started, written))
+
+    def wrote(self, written: int) -> None:
+        now = perf_counter()
+        with self._lock:
+            if now - self._samples[-1][0] < RATE_SAMPLE_S:
+                return
+            self._samples.append((now, written))
+            while now - self._samples[0][0] > RATE_WINDOWS_S[-1] + RATE_SAMPLE_S:
+                self._samples.popleft()
+
+    def snapshot(self, written: int) -> dict:
+        now = perf_counter()
+        elapsed = now - self.started if self.started is not None else 0.0
+        with self._lock:
+            samples = list(self._samples)
+        rates = {}
+        for span in RATE_WINDOWS_S:
+            # The oldest sample inside the window, or the start of the feed.
+            then, count = next(((t, n) for t, n in samples if now - t <= span),
+                               samples[-1] if samples else (now, written))
+            rates['%ds' % span] = (written - count) / (now - then) if now > then else 0.0
+        rates['job'] = (written - self._base) / elapsed if elapsed else 0.0
+        return {
+            'elapsed_s': elapsed,
+            'written': written,
+            'blocked_s': self.blocked_s,
+            'read_s': self.read_s,
+            'account_s': self.account_s,
+            'refusals': self.refusals,
+            'refusals_per_min': self.refusals * 60 / elapsed if elapsed else 0.0,
+            'partial_probes': self.partial_probes,
+            'bytes_per_s': rates,
+            'backlog_max': self.backlog_max,
+            'prefetch_max': self.prefetch_max,
+        }
+
+
+def _first(views: list, count: int) -> list:
+    """The first ``count`` bytes of ``views``, as views."""
+    out = []
+    for view in views:
+        if count <= 0:
+            break
+        out.append(view[:count])
+        count -= len(view)
+    return out
+
+
+def _pollout(dev):
+    """A poll object waiting on room to write to ``dev``, if it has a
+    descriptor to wait on."""
+    try:
+        poll = select.poll()
+        poll.register(dev.fileno(), select.POLLOUT)
+    except (AttributeError, OSError, ValueError):
+        return None
+    return poll
+
+
 class PulseFeeder:
     """Keeps the kernel pulse ring fed from a job held in memory.
 
@@ -45,14 +182,36 @@ class PulseFeeder:
 
     ``-ENOMEM`` from the write is the only pacing signal needed: it means the
     window is full, and the answer is to wait and offer the same bytes again.
-    The ring holds tens of minutes, so the feeder is never the urgent party.
-
-    Step accounting is deferred to the moments when the ring is full and the
-    feeder has nothing else to do, so it can never stand between the machine
-    and the bytes it is waiting for.
+    A refused chunk is first offered in smaller pieces, so the window is
+    topped up to within PARTIAL_MIN. The wait is on POLLOUT where the device
+    reports room that way, and otherwise as long as the drain rate says the
+    next piece's room takes. The ring holds tens of minutes, so the feeder
+    is never the urgent party.
+
+    Step accounting is handed to ``accountant`` (see gfhardware.accounting).
+    By default each chunk is counted as it is written and let go, which
+    costs a fraction of the write and keeps nothing alive for later.
+
+    Pieces shorter than a chunk are gathered up to a chunk's worth and handed
+    to the device together, with os.writev() where it is a plain file; a
+    write that takes part of them is picked up from where it stopped.
+
+    With ``prefetch``, the source is read on a thread of its own, up to that
+    many chunks ahead of the writes, so the service's decompression and the
+    ring's refusals overlap instead of taking turns.
+
+    metrics() says where the feed's time went: waiting on the ring, reading
+    the source, or accounting. It is logged once when the feed stops.
+
+    With ``journal`` (a gfhardware.journal.FeedJournal), the feed is
+    checkpointed as it goes and once more when it finishes. ``offset`` is
+    for a job picked back up after a restart: that many of its bytes are in
+    the ring already, and the source reads on from there.
     """
 
-    def __init__(self, source, dev, chunk: int = CHUNK, retry_s: float = RETRY_S):
+    def __init__(self, source, dev, chunk: int = CHUNK, retry_s: float = RETRY_S,
+                 accountant: InlineAccountant = None, prefetch: int = 0,
+                 journal=None, offset: int = 0):
         self._source = source
         self._dev = dev
         self._chunk = chunk
@@ -62,12 +221,22 @@ class PulseFeeder:
         self._primed = threading.Event()
         self._done = threading.Event()
         self._streaming = False
-        self._written = 0
+        self._written = offset
+        self._journal = journal
         self._error = None
-        self._stats = None
-        self._pending = []
-        self._pending_bytes = 0
-        self._books = threading.Lock()
+        self._prefetch = prefetch
+        self._pool = _BufferPool(chunk, max(POOL_KEEP, prefetch + 2))
+        # Room on the device: a poll object while POLLOUT is worth waiting
+        # on, None once it has proved not to be; the drain rate, bytes a
+        # second, read once per job when first needed.
+        self._poll = _pollout(dev)
+        # A gathered write goes straight to the descriptor only where the
+        # device is the file itself; anything else has its own write().
+        self._fd = dev.fileno() if isinstance(dev, io.FileIO) else None
+        self._poll_misses = 0
+        self._drain_rate = None
+        self._accountant = accountant if accountant is not None else StreamingAccountant()
+        self._metrics = _FeedMetrics()
 
     # -- state -----------------------------------------------------------
     @property
@@ -87,8 +256,19 @@ class PulseFeeder:
 
     @property
     def stats(self) -> dict:
-        """Step and laser totals for the bytes fed so far."""
-        return self._stats
+        """Step and laser totals for the bytes accounted so far."""
+        return self._accountant.stats
+
+    @property
+    def index(self):
+        """The PositionIndex of the bytes accounted so far."""
+        return self._accountant.index
+
+    def position_at(self, offset: int) -> tuple:
+        """Where the program has the head at byte ``offset``, as
+        ``(offset, x, y, z, laser_on)`` for the nearest indexed point at or
+        before it: no kernel read."""
+        return self._accountant.index.at(offset)
 
     @property
     def finished(self) -> bool:
@@ -109,8 +289,23 @@ class PulseFeeder:
             return self._written
         return getattr(self._source, 'program_size', None)
 
+    def metrics(self) -> dict:
+        """A snapshot of the feed so far.
+
+        Seconds spent blocked on a full ring (``blocked_s``), in the source's
+        read (``read_s``, on the prefetch thread where there is one) and in
+        the step accounting (``account_s``); refusals of a write, in all and
+        per minute, where each is an offer that ended in a wait for room;
+        smaller offers tried before one (``partial_probes``); bytes a second over each of RATE_WINDOWS_S and the whole
+        job; and the high-water marks of the accounting backlog, in bytes,
+        and of chunks read ahead.
+        """
+        return self._metrics.snapshot(self._written)
+
     # -- lifecycle -------------------------------------------------------
     def start(self) -> None:
+        self._metrics.start(self._written)
+        self._accountant.start(self._chunk, self._pool.give)
         self._thread = threading.Thread(target=self._run, name='pulse-feeder',
                                         daemon=True)
         self._thread.start()
@@ -147,11 +342,24 @@ class PulseFeeder:
             if self._thread.is_alive():
                 logger.error('pulse feeder did not stop')
             self._thread = None
+            self._log_metrics()
+        self._accountant.close()
         if self._streaming:
             # An abandoned job must not leave the next one being read as a
             # live feed, where its ordinary end-of-data would be an underrun.
             self._set_streaming(False)
 
+    def _log_metrics(self) -> None:
+        m = self.metrics()
+        rates = m['bytes_per_s']
+        logger.info('feed metrics: %d bytes in %.1f s; blocked %.1f s, reading %.1f s, '
+                    'accounting %.1f s; %d refusals (%.1f/min), %d partial probes; bytes/s %s; '
+                    'backlog high-water %d bytes, %d chunks read ahead',
+                    m['written'], m['elapsed_s'], m['blocked_s'], m['read_s'],
+                    m['account_s'], m['refusals'], m['refusals_per_min'], m['partial_probes'],
+                    ' '.join('%s=%.0f' % kv for kv in rates.items()),
+                    m['backlog_max'], m['prefetch_max'])
+
     # -- the feed --------------------------------------------------------
     def _set_streaming(self, on: bool) -> None:
         try:
@@ -160,16 +368,6 @@ class PulseFeeder:
         except OSError as e:
             logger.error('could not set streaming=%d: %s', int(on), e)
 
-    def _account(self, limit: int = 1) -> None:
-        """Decode up to ``limit`` already-enqueued chunks."""
-        for _ in range(limit):
-            with self._books:
-                if not self._pending:
-                    return
-                chunk = self._pending.pop(0)
-                self._pending_bytes -= len(chunk)
-                self._stats = decode_all_steps(chunk, self._stats)
-
     def settle(self, timeout: float = 60.0) -> bool:
         """Finish the step accounting for everything already enqueued.
 
@@ -178,26 +376,37 @@ class PulseFeeder:
         thread once the feed is complete, where a moment's decoding costs
         nothing.
         """
-        deadline = monotonic() + timeout
-        while self._pending:
-            if monotonic() > deadline:
-                logger.warning('step accounting incomplete: %d bytes undecoded',
-                               self._pending_bytes)
-                return False
-            self._account(8)
-        return True
-
-    def _write(self, chunk: bytes) -> bool:
-        """Offer one chunk; True once written. A full ring simply waits."""
-        while not self._stop.is_set():
+        return self._accountant.settle(timeout)
+
+    def _write(self, pieces: list) -> bool:
+        """Offer a batch of pieces, each a (view, pooled buffer or None), in
+        order; True once all of them are written. A full ring simply waits.
+        Each piece is accounted, and its buffer returned, as soon as the
+        last of it is in."""
+        rest = [view for view, _ in pieces]
+        done = 0
+        left = sum(len(view) for view in rest)
+        offer = left
+        polled = False
+        while left and not self._stop.is_set():
             try:
-                self._dev.write(chunk)
+                n = self._put(_first(rest, offer))
             except OSError as e:
                 if e.errno not in _BACKOFF:
                     self._error = e
                     logger.error('pulse write failed after %d bytes: %s',
                                  self._written, e)
                     return False
+                if e.errno == errno.ENOMEM and offer > PARTIAL_MIN:
+                    # No room for all of it: see whether there is for less.
+                    # A probe, not a refusal: one is counted only for an
+                    # offer that ends in a wait.
+                    self._metrics.partial_probes += 1
+                    offer = max(PARTIAL_MIN, offer // 2)
+                    continue
+                self._metrics.refusals += 1
+                if polled and e.errno == errno.ENOMEM:
+                    self._poll_missed()
                 # The ring is full, or a pause is backtracking through it.
                 # Either way these bytes are still ours to offer again, and
                 # the wait is the right moment to catch the accounting up.
@@ -206,25 +415,163 @@ class PulseFeeder:
                                 'than the ring and will be fed as it plays',
                                 self._written)
                     self._primed.set()
-                self._account()
-                self._stop.wait(self._retry_s)
+                self._account(self._accountant.idle)
+                began = perf_counter()
+                polled = self._wait_for_room()
+                self._metrics.blocked_s += perf_counter() - began
+                offer = left
                 continue
-            self._written += len(chunk)
-            with self._books:
-                self._pending.append(chunk)
-                self._pending_bytes += len(chunk)
-            while self._pending_bytes > PENDING_MAX:
-                self._account()
-            return True
+            self._written += n
+            self._metrics.wrote(self._written)
+            left -= n
+            while n:
+                if n < len(rest[0]):
+                    rest[0] = rest[0][n:]
+                    break
+                n -= len(rest.pop(0))
+                self._account(self._accountant.add, *pieces[done])
+                done += 1
+            self._checkpoint()
+            offer = min(offer, left)
+            polled = False
+            self._poll_misses = 0
+        return not left
+
+    def _checkpoint(self, force: bool = False) -> None:
+        if self._journal is not None:
+            self._journal.note(self._written, self._accountant, force)
+
+    def _put(self, views: list) -> int:
+        """One write of ``views``, in order; the bytes the device took."""
+        if self._fd is not None:
+            return os.writev(self._fd, views)
+        n = self._dev.write(views[0])
+        # A device that reports no count took all of it.
+        return len(views[0]) if n is None else n
+
+    def _account(self, call, *args) -> None:
+        began = perf_counter()
+        call(*args)
+        self._metrics.account_s += perf_counter() - began
+        self._metrics.backlog_max = max(self._metrics.backlog_max, self._accountant.pending)
+
+    def _wait_for_room(self) -> bool:
+        """Wait until the ring may have room again; True if poll() said so."""
+        if self._poll is not None:
+            try:
+                ready = self._poll.poll(self._retry_s * 1000)
+            except OSError:
+                ready = None
+                self._poll = None
+            if ready:
+                return True
+            if self._poll is not None:
+                return False
+        if self._drain_rate is None:
+            try:
+                self._drain_rate = max(1, int(cnc.step_freq))
+            except (AttributeError, OSError, ValueError):
+                self._drain_rate = 0
+        wait = self._retry_s
+        if self._drain_rate:
+            wait = min(self._retry_s, max(RETRY_MIN_S, PARTIAL_MIN / self._drain_rate))
+        self._stop.wait(wait)
         return False
 
-    def _run(self) -> None:
+    def _poll_missed(self) -> None:
+        # poll() said there was room and the write found none. Once is a
+        # race with the player; twice running is a device whose poll says
+        # writable whatever the ring holds, and not worth waiting on.
+        self._poll_misses += 1
+        if self._poll_misses >= 2 and self._poll is not None:
+            logger.info('pulse device does not report ring room through poll; '
+                        'backing off by the drain rate instead')
+            self._poll = None
+
+    def _next_chunk(self, readinto) -> tuple:
+        """The next chunk of the job as a view, and the pooled buffer under
+        it; an empty view at the end."""
+        began = perf_counter()
         try:
+            if readinto is None:
+                return memoryview(self._source.read(self._chunk)), None
+            buf = self._pool.take()
+            n = readinto(buf)
+        finally:
+            self._metrics.read_s += perf_counter() - began
+        if not n:
+            self._pool.give(buf)
+            return memoryview(b''), None
+        return memoryview(buf)[:n], buf
+
+    def _chunks(self):
+        """The job, chunk by chunk, as (view, pooled buffer or None)."""
+        # A source that can fill a buffer is read into the pool's; one that
+        # can only hand back bytes is wrapped as it is, without a copy.
+        readinto = getattr(self._source, 'readinto', None)
+        if not self._prefetch:
             while not self._stop.is_set():
-                chunk = self._source.read(self._chunk)
+                chunk, buf = self._next_chunk(readinto)
                 if not chunk:
+                    return
+                yield chunk, buf
+            return
+        ahead = queue.Queue(self._prefetch)
+        halt = threading.Event()
+        reader = threading.Thread(target=self._read_ahead, args=(readinto, ahead, halt),
+                                  name='pulse-prefetch', daemon=True)
+        reader.start()
+        try:
+            while True:
+                item = ahead.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            halt.set()
+            reader.join()
+
+    def _read_ahead(self, readinto, ahead: queue.Queue, halt: threading.Event) -> None:
+        # The prefetch thread: read until the end of the job, or until the
+        # writer stops taking, and hand over the end or the error as well.
+        while True:
+            try:
+                item = self._next_chunk(readinto)
+                if not item[0]:
+                    item = None
+            except Exception as e:
+                item = e
+            while not (halt.is_set() or self._stop.is_set()):
+                try:
+                    ahead.put(item, timeout=0.1)
+                    self._metrics.prefetch_max = max(self._metrics.prefetch_max, ahead.qsize())
                     break
-                if not self._write(chunk):
+                except queue.Full:
+                    pass
+            else:
+                return
+            if item is None or isinstance(item, Exception):
+                return
+
+    def _batches(self, chunks):
+        """The job's pieces, gathered into batches of about a chunk."""
+        batch, size = [], 0
+        for item in chunks:
+            batch.append(item)
+            size += len(item[0])
+            if size >= self._chunk or len(batch) >= GATHER_MAX:
+                yield batch
+                batch, size = [], 0
+        if batch:
+            yield batch
+
+    def _run(self) -> None:
+        chunks = self._chunks()
+        try:
+            for batch in self._batches(chunks):
+                if not self._write(batch):
                     return
             if self._stop.is_set():
                 return
@@ -244,10 +591,343 @@ class PulseFeeder:
             self._primed.set()
             # Whatever accounting is left can finish while the machine plays
             # what it already has.
-            while self._pending and not self._stop.is_set():
-                self._account()
+            while self._accountant.pending and not self._stop.is_set():
+                self._account(self._accountant.idle)
+            self._checkpoint(force=True)
         except Exception as e:                              # pragma: no cover
             self._error = e
             logger.exception('pulse feeder failed')
         finally:
+            chunks.close()
             self._primed.set()
+
+
+# Chunks a ProcessFeeder holds in shared memory at once, between the read of
+# the job here and the write to the ring in the child.
+FEED_SLOTS = 8
+
+# How often the feeding child reports what it has written.
+STATUS_S = 0.05
+
+
+class _RemoteAccountant(InlineAccountant):
+    """The accounting a feeding child does, as its reports last gave it."""
+
+    def __init__(self):
+        InlineAccountant.__init__(self)
+        self.remote_pending = 0
+        self.final = threading.Event()
+
+    @property
+    def pending(self) -> int:
+        return self.remote_pending
+
+    def report(self, stats: dict, pending: int, entries: list) -> None:
+        with self._books:
+            self._stats = stats
+            self.remote_pending = pending
+            self.index.extend(entries)
+
+    def idle(self, limit: int = 1) -> None:
+        self.final.wait(STATUS_S)
+
+    def checkpoint(self) -> dict:
+        # The child's accounting is not this process's to write down; a
+        # resumed job counts it again.
+        return None
+
+    def settle(self, timeout: float = 60.0) -> bool:
+        deadline = perf_counter() + timeout
+        while self.remote_pending and not self.final.is_set():
+            if perf_counter() > deadline:
+                logger.warning('step accounting incomplete: %d bytes undecoded',
+                               self.remote_pending)
+                return False
+            self.idle()
+        return not self.remote_pending
+
+
+class _SlotSource:
+    """The feeding child's job source: chunks the parent put in the slots.
+
+    A chunk is copied out of its slot into the feeder's own buffer and the
+    slot handed straight back, so the parent can read ahead while the child
+    waits on the ring.
+    """
+
+    def __init__(self, shm, chunk: int, todo, freed):
+        self.halt = threading.Event()
+        self._mem = memoryview(shm)
+        self._chunk = chunk
+        self._todo = todo
+        self._freed = freed
+
+    def readinto(self, buf) -> int:
+        while not self._todo.poll(STATUS_S):
+            if self.halt.is_set():
+                return 0
+        try:
+            msg = self._todo.recv()
+        except EOFError:
+            # Not the end of the job: the end of the process that had it.
+            raise OSError(errno.EPIPE, 'job source closed')
+        if msg is None:
+            return 0
+        slot, n = msg
+        off = slot * self._chunk
+        buf[:n] = self._mem[off:off + n]
+        self._freed.send(slot)
+        return n
+
+
+class ProcessFeeder(PulseFeeder):
+    """
+    A PulseFeeder whose writes to the ring happen in a child process.
+
+    The feed is the one part of a job that must keep time, and in this
+    process it shares the interpreter with the service connection, the
+    camera upload and the cooling reports. Here a child runs an ordinary
+    PulseFeeder against the device and nothing else. It is a new
+    interpreter (see _child), not a fork, and holds the device, its pipes
+    and the slots and no other descriptor. The job reaches it through
+    FEED_SLOTS chunk-sized slots of a shared mapping (a memfd): this
+    process reads the source into a free slot, the child copies it out and
+    hands the slot back. Every STATUS_S, the child reports its written
+    count, error, step totals, new index entries and metrics. This object
+    keeps the PulseFeeder interface over those reports, so a caller cannot
+    tell the two apart.
+
+    The device's live-feed flag is set from here, never from the child. A
+    child that loses this process drops the device at once, so the
+    dead-man still fires. If the child cannot be started, the feed runs
+    in this process as a plain PulseFeeder would.
+    """
+
+    def __init__(self, source, dev, chunk: int = CHUNK, retry_s: float = RETRY_S,
+                 slots: int = FEED_SLOTS, journal=None, offset: int = 0):
+        PulseFeeder.__init__(self, source, dev, chunk, retry_s, journal=journal, offset=offset)
+        self._slots = slots
+        self._proc = None
+        self._shm = None
+        self._todo = None
+        self._freed = None
+        self._ctl = None
+        self._pump = None
+        self._listener = None
+        self._remote_metrics = None
+
+    def metrics(self) -> dict:
+        if self._proc is None:
+            return PulseFeeder.metrics(self)
+        m = dict(self._remote_metrics or self._metrics.snapshot(self._written))
+        m['read_s'] = self._metrics.read_s
+        return m
+
+    def start(self) -> None:
+        if self._fd is None:
+            # Only a plain file's descriptor is the device itself; anything
+            # else has a write() of its own that the child would bypass.
+            logger.info('pulse device is not a plain file; feeding in this process')
+            return PulseFeeder.start(self)
+        try:
+            drain_rate = max(1, int(cnc.step_freq))
+        except (AttributeError, OSError, ValueError):
+            drain_rate = 0
+        size = self._chunk * self._slots
+        shm_fd = None
+        child_ends = []
+        try:
+            shm_fd = os.memfd_create('pulse-feeder')
+            os.ftruncate(shm_fd, size)
+            self._shm = mmap.mmap(shm_fd, size)
+            todo_r, self._todo = multiprocessing.Pipe(duplex=False)
+            child_ends.append(todo_r)
+            self._freed, freed_w = multiprocessing.Pipe(duplex=False)
+            child_ends.append(freed_w)
+            self._ctl, ctl_child = multiprocessing.Pipe()
+            child_ends.append(ctl_child)
+            fds = (shm_fd, self._dev.fileno(), todo_r.fileno(), freed_w.fileno(),
+                   ctl_child.fileno())
+            proc = _child.start('feeder', '_feeder_child', fds, size, self._chunk,
+                                self._retry_s, drain_rate, self._written, *fds)
+        except (AttributeError, OSError, ValueError) as e:
+            logger.error('feeder process did not start (%s); feeding in this process', e)
+            self._close_remote()
+            return PulseFeeder.start(self)
+        finally:
+            # The child has its own copies now, or there is no child.
+            if shm_fd is not None:
+                os.close(shm_fd)
+            for conn in child_ends:
+                conn.close()
+        self._proc = proc
+        self._accountant = _RemoteAccountant()
+        self._metrics.start(self._written)
+        self._pump = threading.Thread(target=self._read_job, name='pulse-feed-reader',
+                                      daemon=True)
+        self._listener = threading.Thread(target=self._listen, name='pulse-feed-status',
+                                          daemon=True)
+        self._pump.start()
+        self._listener.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._proc is None:
+            return PulseFeeder.stop(self, timeout)
+        self._stop.set()
+        try:
+            self._ctl.send('stop')
+        except OSError:
+            pass
+        for thread in (self._pump, self._listener):
+            thread.join(timeout)
+        self._proc.join(timeout)
+        if self._proc.is_alive():
+            logger.error('feeder process did not stop')
+            self._proc.terminate()
+            self._proc.join(1.0)
+        self._log_metrics()
+        self._close_remote()
+        self._proc = None
+        if self._streaming:
+            self._set_streaming(False)
+
+    def _close_remote(self) -> None:
+        for conn in (self._todo, self._freed, self._ctl):
+            if conn is not None:
+                conn.close()
+        self._todo = self._freed = self._ctl = None
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                logger.debug('feed slots closed with the reader still holding one')
+            self._shm = None
+
+    def _read_job(self) -> None:
+        # This side's thread: fill free slots from the source, in order,
+        # then tell the child the job has ended.
+        readinto = getattr(self._source, 'readinto', None)
+        free = list(range(self._slots))
+        mem = memoryview(self._shm)
+        try:
+            while not self._stop.is_set():
+                while not free:
+                    if self._freed.poll(STATUS_S):
+                        free.append(self._freed.recv())
+                    elif self._stop.is_set():
+                        return
+                while self._freed.poll(0):
+                    free.append(self._freed.recv())
+                slot = free.pop()
+                view = mem[slot * self._chunk:(slot + 1) * self._chunk]
+                began = perf_counter()
+                try:
+                    if readinto is not None:
+                        n = readinto(view)
+                    else:
+                        data = self._source.read(self._chunk)
+                        n = len(data)
+                        view[:n] = data
+                finally:
+                    self._metrics.read_s += perf_counter() - began
+                    view.release()
+                if not n:
+                    break
+                self._todo.send((slot, n))
+            if not self._stop.is_set():
+                self._todo.send(None)
+        except (EOFError, OSError) as e:
+            if not self._stop.is_set():
+                self._error = e
+                logger.error('could not hand the job to the feeder process: %s', e)
+        except Exception as e:
+            self._error = e
+            logger.exception('pulse feeder failed')
+        finally:
+            mem.release()
+
+    def _listen(self) -> None:
+        # This side's other thread: take the child's reports until it ends.
+        while True:
+            try:
+                status = self._ctl.recv()
+            except (EOFError, OSError):
+                break
+            self._written = status['written']
+            self._accountant.report(status['stats'], status['pending'], status['index'])
+            self._remote_metrics = status['metrics']
+            self._checkpoint(force=status['finished'] and not self._done.is_set())
+            if status['error'] is not None and self._error is None:
+                self._error = OSError(*status['error']) if status['error'][0] else \
+                    OSError(status['error'][1])
+                logger.error('pulse write failed after %d bytes: %s',
+                             self._written, self._error)
+            if status['finished'] and not self._done.is_set():
+                if self._streaming:
+                    self._set_streaming(False)
+                logger.info('feeder finished: %d bytes enqueued', self._written)
+                self._done.set()
+            if status['primed'] or status['error'] is not None:
+                self._primed.set()
+            if status['final']:
+                break
+        if self._proc is not None and not self._stop.is_set() and self._error is None \
+                and not self._done.is_set():
+            self._error = OSError(errno.EPIPE, 'feeder process ended')
+            logger.error('feeder process ended after %d bytes', self._written)
+        self._accountant.final.set()
+        self._primed.set()
+
+
+def _feeder_child(size: int, chunk: int, retry_s: float, drain_rate: int, offset: int,
+                  shm_fd: int, dev_fd: int, todo_fd: int, freed_fd: int, ctl_fd: int) -> None:
+    # The child, started by _child with the slots, the device and the pipes
+    # and nothing else open. It has none of the parent's log handlers, so it
+    # logs nothing; what it has to say is in its reports.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.disable(logging.CRITICAL)
+    shm = mmap.mmap(shm_fd, size)
+    os.close(shm_fd)
+    todo = Connection(todo_fd, writable=False)
+    freed = Connection(freed_fd, readable=False)
+    ctl = Connection(ctl_fd)
+    dev = open(dev_fd, 'wb', buffering=0)
+    source = _SlotSource(shm, chunk, todo, freed)
+    feeder = PulseFeeder(source, dev, chunk, retry_s, offset=offset)
+    feeder._drain_rate = drain_rate
+    source.halt = feeder._stop
+    feeder.start()
+    sent = len(feeder.index)
+
+    def report(final: bool = False) -> None:
+        nonlocal sent
+        # The flags before the counts: a feed that finishes between the two
+        # reads is then reported as not finished yet, with counts that may
+        # already be whole, and never as finished with counts from before.
+        finished = feeder.finished
+        primed = feeder._primed.is_set()
+        error = feeder.error
+        if error is not None:
+            error = (error.errno, error.strerror) if getattr(error, 'errno', None) else (None, str(error))
+        written = feeder.written
+        stats = feeder.stats
+        pending = feeder._accountant.pending
+        entries = feeder.index.entries(sent)
+        sent += len(entries)
+        ctl.send({'written': written, 'finished': finished, 'primed': primed,
+                  'error': error, 'stats': stats, 'pending': pending,
+                  'index': entries, 'metrics': feeder.metrics(), 'final': final})
+
+    while True:
+        try:
+            stop = ctl.poll(STATUS_S) and ctl.recv() == 'stop'
+        except (EOFError, OSError):
+            # The parent is gone. Drop the device now, so its dead-man fires
+            # rather than waiting on a ring nobody will ever stop.
+            os._exit(1)
+        if stop:
+            feeder.stop()
+            report(final=True)
+            break
+        report()
+    dev.close()
@@ -0,0 +1,327 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+SPDX-License-Identifier:    MIT
+
+Motion files kept on local storage, for the job printed again and again.
+
+A repeat job is the same pulse file under a new signed URL, so the URL says
+nothing about what is behind it. What does is the store's entity tag, a
+strong validator of the file's content, and the header at its front: one
+ranged request for the first bytes fetches both without the body. The tag
+and the header's serial lock (MCsn) name the entry.
+
+An entry is the program as it was fed, compressed again here, with the
+job's motion stats, its step totals and its position index beside it, so a
+repeat is fed from the eMMC as fast as the ring will take it and its
+accounting is not done twice. The program file's sha256 is checked before it
+is used, and the front of the file as it was downloaded against the front
+the probe finds now: the tag is the store's word for the content, not a hash
+of it. The program's own sha256, as it was downloaded, is kept beside it. The cache is
+bounded in bytes and gives up the least recently used
+entries first.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import zlib
+
+from gfhardware._common import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+CACHE_DIR = '/data/motion-cache'
+
+# The front of the file asked for when probing: the whole header of every
+# job seen, which is a few hundred bytes.
+PROBE_BYTES = 4096
+
+PROBE_TIMEOUT_S = 10.0
+
+_MAGIC = b'\x80GF1'
+
+# zlib level for the stored program: the program compresses tens to one at
+# any level, and this one keeps up with the feed on the board.
+_LEVEL = 1
+
+
+def header_serial(head: bytes):
+    """MCsn from the front of a pulse file, or None if it is not there."""
+    if head[:4] != _MAGIC or len(head) < 8:
+        return None
+    end = min(len(head), int.from_bytes(head[4:8], 'little'))
+    for at in range(8, end - 7, 8):
+        if head[at:at + 4] == b'MCsn':
+            return int.from_bytes(head[at + 4:at + 8], 'little')
+    return None
+
+
+def _head_digest(head: bytes) -> str:
+    return hashlib.sha256(head[:PROBE_BYTES]).hexdigest()
+
+
+def cache_key(etag: str, serial: int) -> str:
+    """The name of an entry: the content's tag and the serial it is locked to."""
+    return hashlib.sha256(('%s\n%d' % (etag, serial)).encode()).hexdigest()
+
+
+class CachedProgram(object):
+    """A job source reading a stored program back from the open ``f``,
+    decompressing as it goes. ``body_size`` is the size of the body it was
+    downloaded as, for the compression the service got."""
+
+    def __init__(self, f, program_size: int, body_size: int = 0):
+        self.program_size = program_size
+        self.body_size = body_size
+        self._file = f
+        self._inflate = zlib.decompressobj()
+        self._rest = b''
+
+    def read(self, count: int) -> bytes:
+        while len(self._rest) < count and not self._inflate.eof:
+            data = self._file.read(256 * 1024)
+            if not data:
+                raise zlib.error('stored program ends early')
+            self._rest += self._inflate.decompress(data)
+        out, self._rest = self._rest[:count], self._rest[count:]
+        return out
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _Recording(object):
+    """A job source that keeps a compressed copy of what is read from it.
+
+    ``complete`` is True once the source has been read to its end, which is
+    the only time the copy is the whole program.
+    """
+
+    def __init__(self, source, fd: int, path: str):
+        self._source = source
+        self._file = os.fdopen(fd, 'wb')
+        self._deflate = zlib.compressobj(_LEVEL)
+        self.path = path
+        self.program_size = getattr(source, 'program_size', None)
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self.complete = False
+        self.error = None
+        if hasattr(source, 'readinto'):
+            self.readinto = self._readinto
+
+    @property
+    def body_size(self) -> int:
+        # The download's, which it knows in full only once it has it all.
+        return getattr(self._source, 'body_size', 0)
+
+    def read(self, count: int) -> bytes:
+        data = self._source.read(count)
+        self._keep(data)
+        return data
+
+    def _readinto(self, buf) -> int:
+        n = self._source.readinto(buf)
+        self._keep(memoryview(buf)[:n])
+        return n
+
+    def _keep(self, data) -> None:
+        # A read past the end is empty again, and the copy is already whole.
+        if self.error is not None or self.complete:
+            return
+        try:
+            if data:
+                self.size += len(data)
+                self.digest.update(data)
+                self._file.write(self._deflate.compress(data))
+            else:
+                self._file.write(self._deflate.flush())
+                self._file.close()
+                self.complete = True
+        except (OSError, ValueError, zlib.error) as e:
+            # Out of room, most likely: the job goes on, uncached. Whatever
+            # it was, keeping the copy is never what fails the job.
+            logger.warning('could not keep a copy of the job for the cache: %s', e)
+            self.error = e
+
+    def close(self) -> None:
+        """Let the copy go, unless put() has stored it."""
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class MotionCache(object):
+    """
+    Up to ``max_bytes`` of motion files in ``directory``.
+
+    probe() names a job from its URL before it is downloaded; get() returns
+    what is stored under that name, checked; record() wraps a job being
+    downloaded so that put() can store it once it has been fed. The job
+    closes what either gives it when it is done with it.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._paths(key)[0])
+
+    def probe(self, session, url: str) -> tuple:
+        """``(key, head)``: the entry name for the file at ``url`` and the
+        first PROBE_BYTES of the file, for get() to check an entry against.
+        The key is None where it cannot be told without downloading the
+        file: no tag, a weak one, or no serial lock."""
+        try:
+            r = session.get(url, headers={'Range': 'bytes=0-%d' % (PROBE_BYTES - 1)},
+                            stream=True, timeout=PROBE_TIMEOUT_S)
+            try:
+                if r.status_code not in (200, 206):
+                    return None
+                etag = r.headers.get('ETag')
+                head = next(r.iter_content(PROBE_BYTES), b'')
+            finally:
+                r.close()
+        except Exception as e:
+            logger.info('motion cache probe failed: %s', e)
+            return None, None
+        if not etag or etag.startswith('W/'):
+            return None, head
+        serial = header_serial(head)
+        if serial is None:
+            return None, head
+        return cache_key(etag, serial), head
+
+    def get(self, key: str, head: bytes = None):
+        """``(stats, source, index entries)`` for the entry, or None if there
+        is none or it does not check out, in which case it is dropped. With
+        ``head``, the front of the file as probe() found it, it must be the
+        front the entry was stored with."""
+        meta_path, program_path = self._paths(key)
+        with self._lock:
+            # Opened under the lock, so that an eviction once it is checked
+            # takes the name and leaves this open file whole.
+            program = None
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                program = open(program_path, 'rb')
+                digest = hashlib.sha256()
+                for block in iter(lambda: program.read(1024 * 1024), b''):
+                    digest.update(block)
+                fault = None
+                if digest.hexdigest() != meta.get('sha256'):
+                    fault = 'fails its check'
+                elif head is not None and _head_digest(head) != meta.get('head_sha256'):
+                    fault = 'is not the file the service has now'
+                program.seek(0)
+            except (OSError, ValueError) as e:
+                if program is not None:
+                    program.close()
+                if not (isinstance(e, FileNotFoundError) and e.filename == meta_path):
+                    logger.warning('motion cache entry %s unreadable (%s); dropping it', key[:12], e)
+                    self._drop(key)
+                return None
+            if fault is not None:
+                logger.warning('motion cache entry %s %s; dropping it', key[:12], fault)
+                program.close()
+                self._drop(key)
+                return None
+            # Recently used is the time it was last read.
+            os.utime(meta_path)
+        return (meta['stats'], CachedProgram(program, meta['program_size'], meta.get('body_size', 0)),
+                meta.get('index', []))
+
+    def record(self, source):
+        """``source``, keeping a copy for put(); ``source`` itself if no copy
+        can be made."""
+        try:
+            fd, path = tempfile.mkstemp(prefix='.partial-', dir=self.directory)
+        except OSError as e:
+            logger.warning('could not keep a copy of the job for the cache: %s', e)
+            return source
+        return _Recording(source, fd, path)
+
+    def put(self, key: str, recording, stats: dict, index: list = (), head: bytes = None) -> bool:
+        """Store a recorded job under ``key``, with ``head``, the front of
+        the file as probe() found it; False, and nothing stored, if the
+        recording is not the whole program."""
+        if not isinstance(recording, _Recording):
+            return False
+        if not recording.complete:
+            recording.close()
+            return False
+        meta_path, program_path = self._paths(key)
+        digest = hashlib.sha256()
+        try:
+            with open(recording.path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+            meta = json.dumps({'sha256': digest.hexdigest(), 'program_size': recording.size,
+                               'program_sha256': recording.digest.hexdigest(),
+                               'body_size': recording.body_size,
+                               'head_sha256': _head_digest(head) if head is not None else None,
+                               'stats': stats, 'index': list(index)})
+            with self._lock:
+                os.replace(recording.path, program_path)
+                fd, tmp = tempfile.mkstemp(prefix='.partial-', dir=self.directory)
+                with os.fdopen(fd, 'w') as f:
+                    f.write(meta)
+                os.replace(tmp, meta_path)
+                self._evict()
+                stored = os.path.exists(meta_path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning('could not store the job in the motion cache: %s', e)
+            recording.close()
+            self._drop(key)
+            return False
+        if stored:
+            logger.info('motion cache: stored %s (%d bytes of program)', key[:12], recording.size)
+        return stored
+
+    def _paths(self, key: str) -> tuple:
+        base = os.path.join(self.directory, key)
+        return base + '.json', base + '.puls.z'
+
+    def _drop(self, key: str) -> None:
+        for path in self._paths(key):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self) -> None:
+        # Least recently used first, until what is left fits.
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json') or name.startswith('.'):
+                continue
+            key = name[:-5]
+            paths = self._paths(key)
+            try:
+                size = sum(os.path.getsize(p) for p in paths)
+                used = os.path.getmtime(paths[0])
+            except OSError:
+                continue
+            entries.append((used, key, size))
+            total += size
+        for used, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            logger.info('motion cache: evicting %s (%d bytes)', key[:12], size)
+            self._drop(key)
+            total -= size
+
+
+__all__ = ['MotionCache']
@@ -0,0 +1,160 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+SPDX-License-Identifier:    MIT
+
+A running job's feed, written down as it goes for the daemon that follows.
+
+Under the forgectrl broker the pulse device outlives this daemon. A daemon
+that dies mid-print leaves the ring playing what it holds, minutes of it,
+with nothing to top it up. The journal is what a restarted daemon needs to
+pick the feed back up: which job it was, where its program is kept, how far
+the feed had got, and the step accounting up to a known offset. It is one
+small file, replaced whole and synced to storage each time it is written.
+
+How far the ring has been fed is the kernel's to say (its byte total), not
+the journal's. A checkpoint trails the feed by up to CHECKPOINT_S, so a
+resumed feed starts where the kernel says. The steps between the
+journaled accounting and that point are counted again from the program.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from time import monotonic
+
+from gfhardware._common import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# On tmpfs by default: the ring it describes does not survive a reboot
+# either, and a checkpoint costs no eMMC wear there.
+JOURNAL_PATH = '/tmp/gf-feed.journal'
+
+# Seconds between two checkpoints of a running feed. What one costs is a
+# small write and a sync; what a longer interval costs is counting that
+# many seconds of program again on a resume.
+CHECKPOINT_S = 5.0
+
+VERSION = 2
+
+
+def job_hash(url: str, key: str = None) -> str:
+    """A job's name in the journal: its motion cache key where it has one,
+    which names its content, and otherwise a hash of its URL."""
+    return key if key is not None else hashlib.sha256(url.encode()).hexdigest()
+
+
+class FeedJournal(object):
+    """
+    The journal of the job being fed, in the file at ``path``.
+
+    begin() writes what the job is; note() checkpoints the feed, at most
+    every ``interval`` seconds unless forced; clear() removes it once the
+    job is over. load() reads back what a daemon that died left behind.
+    A journal that cannot be written is logged once, and the job goes on
+    without one.
+    """
+
+    def __init__(self, path: str = JOURNAL_PATH, interval: float = CHECKPOINT_S):
+        self.path = path
+        self._interval = interval
+        self._record = None
+        self._spool = None
+        self._last = 0.0
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def begin(self, job: dict, spool=None) -> None:
+        """Start the journal of ``job``, a dict of whatever the resume needs
+        to find the job again. ``spool`` is the JobSpool it is fed from, if
+        one is kept."""
+        with self._lock:
+            self._record = dict(job, version=VERSION, written=0, spooled=None,
+                                accounting=None)
+            self._spool = spool
+            self._failed = False
+            self._write()
+
+    def note(self, written: int, accountant=None, force: bool = False) -> None:
+        """Checkpoint a feed that has had ``written`` bytes taken by the ring,
+        with ``accountant``'s checkpoint() if it has one to give."""
+        if self._record is None:
+            return
+        now = monotonic()
+        if not force and now - self._last < self._interval:
+            return
+        with self._lock:
+            if self._record is None:
+                return
+            self._last = now
+            self._record['written'] = written
+            spool = self._spool
+            if spool is not None and spool.done and spool.error is None:
+                self._record['spooled'] = spool.filled
+            if accountant is not None:
+                state = accountant.checkpoint()
+                if state is not None:
+                    self._record['accounting'] = state
+            self._write()
+
+    def load(self):
+        """What the journal holds, or None if there is none to trust."""
+        try:
+            with open(self.path) as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning('feed journal %s unreadable (%s); ignoring it', self.path, e)
+            return None
+        if not isinstance(record, dict) or record.get('version') != VERSION:
+            logger.warning('feed journal %s is not one this daemon reads; ignoring it', self.path)
+            return None
+        return record
+
+    def clear(self) -> None:
+        with self._lock:
+            self._record = None
+            self._spool = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning('could not remove the feed journal: %s', e)
+
+    def _write(self) -> None:
+        # Whole or not at all: the new record is synced under another name
+        # and renamed over the old, and the rename is synced too.
+        if self._failed:
+            return
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            fd, tmp = tempfile.mkstemp(prefix='.journal-', dir=directory)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self._record, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+            except BaseException:
+                try:
+                    os.unlink(tmp)
+                except FileNotFoundError:
+                    pass
+                raise
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning('feed journal not written (%s); this job cannot be resumed', e)
+            self._failed = True
+
+
+__all__ = ['FeedJournal', 'job_hash', 'JOURNAL_PATH']
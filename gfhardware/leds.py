@@ -19,7 +19,7 @@ def head_all_led_off() -> None:
 
 def set_button_color(color: ButtonColor) -> None:
     for led in range(1, 4):
-        write_attr('/sys/class/leds/button_led_%s/target' % led, color.value[led - 1])
+        write_attr('/sys/class/leds/button_led_%s/target' % led, color.value[led - 1], shadow=True)
 
 
 def set_head_led_from_pulse(value: int) -> None:
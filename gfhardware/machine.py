@@ -7,7 +7,8 @@ SPDX-License-Identifier:    MIT
 import fcntl
 import logging
 import os
-from threading import Event
+import zlib
+from threading import Event, Lock, Thread
 from time import monotonic, sleep
 from typing import Union
 
@@ -21,12 +22,20 @@ from gfutilities.service.websocket import (PULSE_REJECT_BYTES, PULSE_WARN_BYTES,
 from gfutilities.device.settings import MACHINE_SETTINGS, update_settings
 
 from gfhardware import id
+from gfhardware.accounting import (KnownAccountant, PositionIndex, ProcessAccountant, StepDecoder,
+                                   StreamingAccountant)
 from gfhardware._common import *
 from gfhardware.cnc import *
 from gfhardware.cooling import *
-from gfhardware.feeder import CHUNK as FEED_CHUNK, PulseFeeder
+from gfhardware.feeder import CHUNK as FEED_CHUNK, ProcessFeeder, PulseFeeder
 from gfhardware.coolsvc import cooling_svc, limits_from_header, LIMIT_TAGS, INERT_LIMIT_TAGS
+from gfhardware.jobcache import CACHE_DIR, MotionCache
+from gfhardware.journal import JOURNAL_PATH, FeedJournal, job_hash
 from gfhardware.leds import *
+from gfhardware.readings import Snapshot, snapshot
+from gfhardware.recorder import PositionRecorder
+from gfhardware.sdma import SdmaSampler
+from gfhardware.spool import SPOOL_DIR, JobSpool
 from gfhardware.switches import *
 from gfhardware.z_axis import ZAxis
 
@@ -57,6 +66,14 @@ def _ring_has_room() -> bool:
         return False
 
 
+def _ring_seconds_left() -> Union[float, None]:
+    """Seconds of motion the ring holds, or None where it cannot be read."""
+    try:
+        return cnc.seconds_until_empty
+    except (OSError, ValueError):
+        return None
+
+
 def _inherited_pulse_dev():
     global _pulse_stream
     fd = os.getenv('GF_PULSE_FD')
@@ -84,6 +101,15 @@ MACHINE_CONF = os.environ.get('GFHOME_CONF', '/data/forgefirm.conf')
 FEED_STALL_S = 30.0        # no progress, with room to write, is a stalled feed
 FEED_RECOVER_S = 60.0      # how long a held job waits for the feed to move
 FEED_MAX_HOLDS = 3         # a feed that keeps stalling is sawing the material
+# What the ring still holds sizes the wait: a stall with less than
+# FEED_STALL_S of motion queued is held while this much is still left to
+# play, and it is called out once the hold is FEED_WARN_LEAD_S away. The ring
+# is read as the stall begins and at most every FEED_LEFT_EVERY_S after, as
+# each read is a full position read.
+FEED_DRY_MARGIN_S = 5.0
+FEED_MIN_STALL_S = 1.0     # never hold on less stillness than this
+FEED_WARN_LEAD_S = 5.0
+FEED_LEFT_EVERY_S = 1.0
 
 # A print's warm-up and its rest, in seconds. The factory does both and this
 # machine did neither: measured on this board's own factory slot, a print
@@ -175,6 +201,11 @@ DECLARED_IGNORED = {
 # whatever it says.
 PROGRESS_INTERVAL_S = 30.0
 
+# How long a job waits for its prefetch to finish before it downloads the
+# job itself: a prefetch still going this long after the job came round has
+# stalled, and the fresh download is the quicker way.
+PREFETCH_WAIT_S = 10.0
+
 # The driver state as the wire numbers it (CCst), which is the kernel's own
 # order: a running machine reports 1, which is what a factory capture shows.
 CCST_STATE = {
@@ -186,7 +217,7 @@ CCST_STATE = {
 }
 
 
-def _conf_float(key: str, default: float) -> float:
+def _conf_str(key: str, default: str = None) -> str:
     try:
         with open(MACHINE_CONF) as f:
             for line in f:
@@ -195,15 +226,22 @@ def _conf_float(key: str, default: float) -> float:
                     continue
                 k, v = line.split('=', 1)
                 if k.strip() == key:
-                    try:
-                        default = float(v.strip())  # last occurrence wins
-                    except ValueError:
-                        pass
+                    default = v.strip()  # last occurrence wins
     except OSError:
         pass
     return default
 
 
+def _conf_float(key: str, default: float) -> float:
+    value = _conf_str(key)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
 class _JobProgress:
     """The moving bar the app shows while a job runs.
 
@@ -240,21 +278,31 @@ class _JobProgress:
             logger.info('%s: reporting against %d bytes every %.0f s',
                         label, self._total, self._interval)
 
-    def send(self, force: bool = False) -> None:
-        """Report now if a phase changed, or if the interval has come round."""
+    def due(self) -> bool:
+        """Whether the next unforced send() would report, so the pass that
+        calls it can read the position along with everything else."""
+        return (self._interval > 0 and self._q_tx is not None
+                and monotonic() - self._last >= self._interval)
+
+    def send(self, force: bool = False, snap: Snapshot = None) -> None:
+        """Report now if a phase changed, or if the interval has come round.
+
+        ``snap`` is the pass's own view of the machine, when it read the
+        position; without one the report reads its own.
+        """
         if self._interval <= 0 or self._q_tx is None:
             return
         now = monotonic()
         if not force and now - self._last < self._interval:
             return
         self._last = now
-        try:
-            pos = cnc.position
-            state = cnc.state
-        except (OSError, ValueError) as e:
+        if snap is None or snap.position is None:
+            snap = snapshot(position=True)
+        if snap.position is None:
             # Reporting must never be what ends a job.
-            logger.debug('progress not reported: %s', e)
+            logger.debug('progress not reported: no position')
             return
+        pos, state = snap.position, snap.state
         played = pos.bytes.processed
         current = played
         if self._total is not None and current > self._total:
@@ -283,6 +331,99 @@ class _JobProgress:
         logger.debug('%s: %d/%s', self._label, current, self._total)
 
 
+def _close_source(source) -> None:
+    """Let a job source go that will not be fed."""
+    close = getattr(source, 'close', None)
+    if close is not None:
+        close()
+
+
+class _JobPrefetch(Thread):
+    """The next job's download, taken while this one finishes.
+
+    The download and the checks fetch_motion makes on the header run on
+    this thread; the ring is left alone, since it belongs to the job still
+    running. With the motion cache on, the program is also read through
+    once, accounted and stored, so the job starts from the cache with its
+    totals known. Otherwise ``result`` holds what fetch_motion gave, for
+    the job to take in place of downloading it again. ``probed`` says the
+    cache was asked for the job's name, and ``key`` and ``head`` are what
+    the probe found, so the job does not ask the service again.
+
+    cancel() lets go of a prefetch no job will take: what it fetched is
+    closed, now or as soon as it has it.
+    """
+
+    def __init__(self, machine, url: str):
+        Thread.__init__(self, name='job-prefetch', daemon=True)
+        self.url = url
+        self.result = None
+        self.probed = False
+        self.key = None
+        self.head = None
+        self._machine = machine
+        self._cancelled = False
+        self._lock = Lock()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            result, self.result = self.result, None
+        if result is not None:
+            _close_source(result[1])
+
+    def run(self) -> None:
+        try:
+            # The cache is asked first: a job it holds is not downloaded.
+            cache = self._machine._motion_cache()
+            if cache is not None:
+                self.key, self.head = cache.probe(self._machine._session, self.url)
+                self.probed = True
+                if self.key is not None and self.key in cache:
+                    logger.info('prefetch: next job is in the motion cache already')
+                    return
+            if self._cancelled:
+                return
+            stats, source = self._machine._fetch_motion(self.url)
+            if not stats:
+                return
+            if self.key is None:
+                self._hand_over(stats, source)
+            else:
+                self._account(cache, self.key, self.head, stats, source)
+        except Exception:
+            logger.exception('prefetch of the next job failed')
+
+    def _hand_over(self, stats: dict, source) -> None:
+        with self._lock:
+            if not self._cancelled:
+                self.result = (stats, source)
+                return
+        _close_source(source)
+
+    def _account(self, cache, key: str, head: bytes, stats: dict, source) -> None:
+        recording = cache.record(source)
+        decoder = StepDecoder()
+        index = PositionIndex()
+        try:
+            while True:
+                while not self._machine._feed_clear.wait(.5):
+                    if self._cancelled:
+                        return
+                if self._cancelled:
+                    return
+                data = recording.read(FEED_CHUNK)
+                if not data:
+                    break
+                decoder.feed(data, index)
+            stats = dict(stats, stats=decoder.stats, size=decoder.bytes)
+            if cache.put(key, recording, stats, index.entries(), head):
+                logger.info('prefetch: next job accounted and in the motion cache')
+        finally:
+            recording.close()
+            _close_source(source)
+
+
 class Machine(BaseMachine):
     """
     Operates the GF Hardware
@@ -314,6 +455,15 @@ class Machine(BaseMachine):
         self._button_pressed: bool = False
         self._motion_stats: dict = {}
         self._feeder = None
+        self._spool = None
+        self._journal = None
+        self._job_files = []
+        self._prefetch: Union[_JobPrefetch, None] = None
+        # One motion cache for the jobs and the prefetch alike, since its
+        # lock is what keeps a read from an eviction: made again only when
+        # its configuration changes.
+        self._cache: Union[MotionCache, None] = None
+        self._cache_lock = Lock()
         self._sw_thread: SwitchMonitor = SwitchMonitor(SWITCH_DEVICE, self._switch_event)
         # Edge-to-run-loop signaling. The switch thread flags edges and
         # wakes the run loop; the run loop (the one owner of every cnc
@@ -323,8 +473,16 @@ class Machine(BaseMachine):
         # resume toggle); _enclosure_edge latches a lid or interlock open
         # seen by the edge thread until the run loop consumes it.
         self._run_wake: Event = Event()
+        # Clear while the pulse feed is stalled: work that can wait (the
+        # next job's accounting) does, and leaves the CPU to the feed.
+        self._feed_clear: Event = Event()
+        self._feed_clear.set()
         self._button_edges: int = 0
         self._enclosure_edge: bool = False
+        # Armed for each run: keeps the SDMA context an underrun or a fault
+        # would otherwise take with it (sdma_sample_hz adds the lead-up).
+        sample_hz = _conf_float('sdma_sample_hz', 0.0)
+        self._sdma = SdmaSampler(period_s=1.0 / sample_hz if sample_hz > 0 else 0.0)
 
         set_cfg('MACHINE.HEAD_FIRMWARE', self.head_info().version, True)
         set_cfg('MACHINE.HEAD_ID', self.head_info().hardware_id, True)
@@ -401,7 +559,13 @@ class Machine(BaseMachine):
         # Header values come from the service and go straight to motion
         # hardware (step frequency, stepper currents, microstep/decay
         # modes, fan duties): clamp each to its declared bounds before
-        # applying.
+        # applying. The stepper settings are collected and go to cnc.apply()
+        # together, which writes only the ones that changed, in an order the
+        # drivers are safe with; everything else is set as it comes.
+        steppers = {cnc.set_step_freq: 'step_freq', cnc.set_x_mode: 'x_mode', cnc.set_y_mode: 'y_mode',
+                    cnc.set_x_decay: 'x_decay', cnc.set_y_decay: 'y_decay',
+                    cnc.set_x_current: 'x_current', cnc.set_y_current: 'y_current'}
+        batch = {}
         for key, setting in MACHINE_SETTINGS.items():
             val = header.get(key, None)
             if val is not None:
@@ -415,7 +579,12 @@ class Machine(BaseMachine):
                         logger.warning('pulse header %s=%r above %s; clamped',
                                        key, val, setting.max_value)
                         val = setting.max_value
-                    func(val)
+                    if func in steppers:
+                        batch[steppers[func]] = val
+                    else:
+                        func(val)
+        if batch:
+            cnc.apply(batch)
 
     def _head_image(self, msg: dict, settings: dict = None) -> None:
         logger.info('capturing Head Image')
@@ -492,6 +661,14 @@ class Machine(BaseMachine):
         # starts reporting job state to it.
         cooling_svc.start()
         set_lid_led(MACHINE_SETTINGS['LLvl'].default)
+        # A job the last daemon left playing is seen through before the
+        # machine is reset, which would stop it.
+        if self._resume_job():
+            return
+        self._reset_hardware()
+
+    @staticmethod
+    def _reset_hardware() -> None:
         cnc.reset()
         ZAxis.reset()
         set_button_color(ButtonColor.OFF)
@@ -537,16 +714,267 @@ class Machine(BaseMachine):
                     self._motion_locked(msg, inherited, lid_gated)
                 finally:
                     cnc.set_pulse_dev(None)
+                    self._close_job_files()
             else:
-                with open(PULS_DEVICE, 'wb', buffering=0) as pulse_dev:
+                with cnc.open_pulse_dev() as pulse_dev:
                     fcntl.flock(pulse_dev, fcntl.LOCK_EX)
                     cnc.set_pulse_dev(pulse_dev)
                     try:
                         self._motion_locked(msg, pulse_dev, lid_gated)
                     finally:
                         cnc.set_pulse_dev(None)
+                        self._close_job_files()
         logger.info('end motion')
 
+    def _spooled(self, source, name: str = None):
+        """The job's program as the feeder will read it: ``source`` itself,
+        or, with ``feed_spool`` set, a spool of it decompressed once. A
+        ``name`` is for a spool kept where a restarted daemon can find it,
+        which is made whatever ``feed_spool`` says."""
+        if name is None and not _conf_float('feed_spool', 0):
+            return source
+        directory = _conf_str('feed_spool_dir', SPOOL_DIR)
+        try:
+            self._spool = JobSpool(source, directory, name=name)
+        except OSError as e:
+            # Nothing has been read from the download yet, so it can still
+            # be fed as it comes.
+            logger.warning('could not spool the job in %s (%s); feeding it as it downloads',
+                           directory, e)
+            return source
+        logger.info('spooling the job in %s', directory)
+        self._spool.start()
+        return self._spool
+
+    def _close_job_files(self) -> None:
+        # The journal goes first: one that outlived its spool would send a
+        # restarted daemon looking for a program that is gone.
+        if self._journal is not None:
+            self._journal.clear()
+            self._journal = None
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        # A cached program read back, or a copy for the cache that was never
+        # stored: either way the job is done with it.
+        for f in self._job_files:
+            f.close()
+        self._job_files = []
+
+    def run_puls(self, msg: dict) -> None:
+        # BaseMachine refuses a motion or print sent while another action
+        # runs. Its download need not wait for that one to finish.
+        if (self.running_action_id and msg.get('status') != 'cancelled'
+                and int(msg['id']) != self.running_action_id):
+            self.prefetch_job(msg)
+        BaseMachine.run_puls(self, msg)
+
+    def prefetch_job(self, msg: dict) -> bool:
+        """Start downloading the job ``msg`` will run, ahead of it.
+
+        For a motion or print action the service has queued behind the one
+        running, as run_puls() finds it: its download and header checks
+        overlap this job's return home and cool-down instead of following
+        them. False if there is nothing to fetch, or another prefetch is
+        still going.
+        """
+        url = msg.get('motion_url')
+        if not url or msg.get('action_type') not in ('motion', 'print'):
+            return False
+        if self._prefetch is not None:
+            if self._prefetch.url == url:
+                return True
+            if self._prefetch.is_alive():
+                logger.info('prefetch: one already in progress; not fetching action %s',
+                            msg.get('id'))
+                return False
+            # Fetched for a job that did not come: this one replaces it.
+            self._prefetch.cancel()
+        logger.info('prefetch: fetching the job of action %s', msg.get('id'))
+        self._prefetch = _JobPrefetch(self, url)
+        self._prefetch.start()
+        return True
+
+    def _take_prefetch(self, url: str):
+        """The prefetch of ``url``, once it has finished: None if there was
+        none."""
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is None:
+            return None
+        if prefetch.url != url:
+            logger.info('prefetch was for another job; dropping it')
+            prefetch.cancel()
+            return None
+        prefetch.join(PREFETCH_WAIT_S)
+        if prefetch.is_alive():
+            logger.warning('prefetch of this job not done after %.0f s; downloading it afresh',
+                           PREFETCH_WAIT_S)
+            prefetch.cancel()
+            return None
+        return prefetch
+
+    def _fetch_motion(self, url: str) -> tuple:
+        return fetch_motion(
+            self._session, url,
+            warn_bytes=max(0, int(_conf_float('pulse_warn_threshold_bytes',
+                                              PULSE_WARN_BYTES))),
+            reject_bytes=max(0, int(_conf_float('pulse_reject_threshold_bytes',
+                                                PULSE_REJECT_BYTES))))
+
+    def _motion_cache(self):
+        """The motion cache, with ``motion_cache_mb`` set; None without."""
+        size_mb = _conf_float('motion_cache_mb', 0)
+        if size_mb <= 0:
+            return None
+        directory = _conf_str('motion_cache_dir', CACHE_DIR)
+        max_bytes = int(size_mb * 1024 * 1024)
+        with self._cache_lock:
+            cache = self._cache
+            if cache is None or (cache.directory, cache.max_bytes) != (directory, max_bytes):
+                try:
+                    cache = self._cache = MotionCache(directory, max_bytes)
+                except OSError as e:
+                    logger.warning('motion cache unavailable in %s: %s', directory, e)
+                    return None
+            return cache
+
+    @staticmethod
+    def _feed_journal():
+        """The feed journal, with ``feed_journal`` set; None without."""
+        if not _conf_float('feed_journal', 0):
+            return None
+        return FeedJournal(_conf_str('feed_journal_path', JOURNAL_PATH))
+
+    def _resume_job(self) -> bool:
+        """Pick up the feed of a job the last daemon left playing.
+
+        True if there was one, and it is being seen through on a thread of
+        its own as though the service had just started it. A journal that
+        names no such job is cleared, along with its spool.
+        """
+        journal = self._feed_journal()
+        record = journal.load() if journal is not None else None
+        if record is None:
+            return False
+        try:
+            resumed = self._reopen_job(record)
+        except (KeyError, OSError, TypeError, ValueError, zlib.error) as e:
+            logger.warning('journaled job %s cannot be resumed (%s); the ring plays out '
+                           'what it holds', record.get('job', '?')[:12], e)
+            resumed = None
+        if resumed is None:
+            self._close_job_files()
+            journal.clear()
+            if record.get('spool'):
+                try:
+                    os.unlink(record['spool'])
+                except OSError:
+                    pass
+            return False
+        source, accountant, offset = resumed
+        msg = record['msg']
+        logger.info('resuming the feed of action %s at byte %d of %s', msg['id'], offset,
+                    record.get('program_size'))
+        self.running_action_id = msg['id']
+        self.running_action_type = msg['action_type']
+        self._running_action_cancelled = False
+        Thread(target=self._resumed_motion, args=(record, source, accountant, offset, journal),
+               name='resumed-job', daemon=True).start()
+        return True
+
+    def _reopen_job(self, record: dict):
+        """``(source, accountant, offset)`` to feed the journaled job on
+        from where the ring has it, or None if it is not playing."""
+        if _inherited_pulse_dev() is None:
+            # The device was this process's own, and closed with it: the
+            # dead-man has stopped the job already.
+            logger.info('journaled job found, but no broker holds the pulse device')
+            return None
+        state = cnc.state
+        if state is not MachineState.RUNNING:
+            logger.info('journaled job found, but the machine is %s', state)
+            return None
+        # The kernel's byte total is how far the ring was fed: the journal
+        # trails it by up to a checkpoint.
+        offset = cnc.position.bytes.total
+        if offset < record['written']:
+            raise ValueError('the ring holds %d bytes and the journal says %d were fed'
+                             % (offset, record['written']))
+        if record.get('cache'):
+            cache = self._motion_cache()
+            if cache is None or cache.directory != record['cache_dir']:
+                # Configured elsewhere since: nothing else reads that one.
+                cache = MotionCache(record['cache_dir'])
+            cached = cache.get(record['cache'])
+            if cached is None:
+                raise ValueError('its cache entry is gone')
+            stats, source, index = cached
+            self._job_files.append(source)
+            if offset > source.program_size:
+                raise ValueError('the ring holds %d bytes of a %d-byte program'
+                                 % (offset, source.program_size))
+            accountant = KnownAccountant(stats['stats'], index, source.program_size, added=offset)
+            skipped = 0
+            while skipped < offset:
+                skipped += len(source.read(min(FEED_CHUNK, offset - skipped)))
+            return source, accountant, offset
+        if not record.get('spool') or record.get('spooled') is None:
+            raise ValueError('its program was not kept whole')
+        if offset > record['spooled']:
+            raise ValueError('the ring holds %d bytes of a %d-byte program'
+                             % (offset, record['spooled']))
+        self._spool = JobSpool.reopen(record['spool'], record['spooled'])
+        # The steps from the last journaled accounting to where the ring
+        # has got are counted again, from the spool.
+        accountant = StreamingAccountant()
+        state = record.get('accounting')
+        if state is not None and state['accounted'] <= offset:
+            accountant.resume(state)
+            self._spool.seek(state['accounted'])
+        while self._spool.tell() < offset:
+            accountant.add(self._spool.read(min(FEED_CHUNK, offset - self._spool.tell())))
+        return self._spool, accountant, offset
+
+    def _resumed_motion(self, record: dict, source, accountant, offset: int,
+                        journal: FeedJournal) -> None:
+        # The resumed job's action thread: the rest of _motion_locked, from
+        # the run on, with what the journal kept in place of the download.
+        msg = record['msg']
+        pulse_dev = _inherited_pulse_dev()
+        try:
+            fcntl.flock(pulse_dev, fcntl.LOCK_EX)
+            cnc.set_pulse_dev(pulse_dev)
+            try:
+                self._motion_stats = record['motion']
+                cooling_svc.set_limits(limits_from_header(self._motion_stats['header_data']))
+                cooling_svc.set_mode('run')
+                if msg['action_type'] == 'print':
+                    cooling_svc.set_armed(True)
+                self._journal = journal
+                journal.begin({k: record[k] for k in ('job', 'lid_gated', 'msg', 'motion', 'program_size',
+                                                      'spool', 'cache', 'cache_dir')},
+                              spool=self._spool)
+                self._feeder = PulseFeeder(source, pulse_dev, accountant=accountant,
+                                           journal=journal, offset=offset)
+                self._feeder.start()
+                self._play(msg, pulse_dev, record['lid_gated'], running=True)
+            finally:
+                cnc.set_pulse_dev(None)
+                self._close_job_files()
+        except Exception:
+            logger.exception('resumed job failed')
+            self._action_cleanup()
+            self._running_action_cancelled = True
+        finally:
+            if self._running_action_cancelled:
+                self._send_cancelled_message(msg['id'], msg['action_type'])
+            else:
+                send_wss_event(self._q_msg_tx, msg['id'], msg['action_type'] + ':completed')
+            self.running_action_id = None
+            self.running_action_type = None
+            # What startup left undone so as not to stop this job.
+            self._reset_hardware()
+
     def _motion_locked(self, msg: dict, pulse_dev, lid_gated: bool = True) -> None:
         """Body of a motion/print job; runs with the deadman fd held."""
         cnc.clear_all()
@@ -560,13 +988,38 @@ class Machine(BaseMachine):
         # it as it drains. Held in memory is why the size guards exist: they
         # bound this process, not the length of a job (which the feed no
         # longer caps). Both are forgefirm.conf keys; 0 lifts either.
-        logger.info('loading motion file from %s' % msg['motion_url'])
-        stats, source = fetch_motion(
-            self._session, msg['motion_url'],
-            warn_bytes=max(0, int(_conf_float('pulse_warn_threshold_bytes',
-                                              PULSE_WARN_BYTES))),
-            reject_bytes=max(0, int(_conf_float('pulse_reject_threshold_bytes',
-                                                PULSE_REJECT_BYTES))))
+        # A job queued behind the last may have been fetched while that one
+        # cooled down; a job printed before may be on the eMMC already: the
+        # cache knows it by the file's content and serial lock, asked of the
+        # service without the body, and holds its accounting as well.
+        prefetch = self._take_prefetch(msg['motion_url'])
+        prefetched = prefetch.result if prefetch is not None else None
+        cache = self._motion_cache()
+        if cache is None:
+            key = head = None
+        elif prefetch is not None and prefetch.probed:
+            key, head = prefetch.key, prefetch.head
+        else:
+            key, head = cache.probe(self._session, msg['motion_url'])
+        cached = cache.get(key, head) if key is not None else None
+        if cached is not None:
+            stats, source, index = cached
+            self._job_files.append(source)
+            logger.info('motion file %s from the cache' % msg['motion_url'])
+            if prefetched is not None:
+                # Fetched ahead of a job the cache turned out to hold.
+                _close_source(prefetched[1])
+        elif prefetched is not None:
+            stats, source = prefetched
+            logger.info('motion file %s fetched ahead of the job' % msg['motion_url'])
+        else:
+            logger.info('loading motion file from %s' % msg['motion_url'])
+            stats, source = self._fetch_motion(msg['motion_url'])
+        if cached is None and stats and key is not None:
+            recording = cache.record(source)
+            if recording is not source:
+                source = recording
+                self._job_files.append(recording)
         if not stats:
             # Rejected before anything reached the ring (bad magic, a short
             # or unusable header, or more body than this machine will hold;
@@ -587,7 +1040,46 @@ class Machine(BaseMachine):
                     ' '.join('%s=%s' % kv for kv in sorted(limits.items())) or 'none')
         # Fill the ring before the operator is asked for the button, so a job
         # that cannot be loaded fails before the laser is ever armed.
-        self._feeder = PulseFeeder(source, pulse_dev)
+        # The step accounting is counted as the feed goes, which is cheap;
+        # the config can still move it to a child process. A job from the
+        # cache was accounted the first time it was fed.
+        if cached is not None:
+            accountant = KnownAccountant(stats['stats'], index, source.program_size)
+        elif _conf_float('feed_accounting_process', 0):
+            accountant = ProcessAccountant()
+        else:
+            accountant = None
+        # Reading the job a few chunks ahead of the ring lets the download's
+        # decompression run while the ring is being written, which is most of
+        # what the operator waits through before the button lights.
+        prefetch = max(0, int(_conf_float('feed_prefetch_chunks', 2)))
+        # With the feed journaled, a daemon that dies mid-job can be
+        # followed by one that picks the feed back up: the program is
+        # spooled under the job's name for it to find, unless the cache
+        # has it already.
+        journal = self._feed_journal()
+        if journal is not None:
+            job = job_hash(msg['motion_url'], key)
+            name = 'gf-job-%s.puls' % job[:16] if cached is None else None
+            feed_source = self._spooled(source, name)
+            self._journal = journal
+            journal.begin({'job': job, 'lid_gated': lid_gated,
+                           'msg': {k: msg[k] for k in ('id', 'action_type', 'motion_url')},
+                           'motion': self._motion_stats,
+                           'program_size': getattr(source, 'program_size', None),
+                           'spool': self._spool.path if self._spool is not None else None,
+                           'cache': key if cached is not None else None,
+                           'cache_dir': cache.directory if cached is not None else None},
+                          spool=self._spool)
+        else:
+            feed_source = self._spooled(source)
+        if accountant is None and _conf_float('feed_process', 0):
+            # The writes to the ring in a process of their own, which does
+            # its own counting; this one only reads the job into its slots.
+            self._feeder = ProcessFeeder(feed_source, pulse_dev, journal=journal)
+        else:
+            self._feeder = PulseFeeder(feed_source, pulse_dev, accountant=accountant,
+                                       prefetch=prefetch, journal=journal)
         self._feeder.start()
         if not self._feeder.wait_primed():
             logger.error('could not load the job into the ring: %s',
@@ -624,6 +1116,26 @@ class Machine(BaseMachine):
             if msg['action_type'] == 'print':
                 self._dwell('warm_up')
 
+        def fed(settled: bool) -> None:
+            if key is not None and cached is None and settled:
+                cache.put(key, source, self._motion_stats, self._feeder.index.entries(), head)
+            # What the service's compression actually bought, per job. This
+            # is the number the memory guards are sized against, so it is
+            # worth having in the log rather than inferred from a capture.
+            if source.body_size:
+                logger.info('pulse data: %d bytes of body, %d bytes of program (%.1f:1)',
+                            source.body_size, self._feeder.written,
+                            self._feeder.written / source.body_size)
+        self._play(msg, pulse_dev, lid_gated, fed)
+
+    def _play(self, msg: dict, pulse_dev, lid_gated: bool = True, on_fed=None,
+              running: bool = False) -> None:
+        """Run a loaded job to its end, then park, cool down and go idle.
+
+        ``on_fed(settled)`` is called once the feed is over, before the
+        feeder is let go. ``running`` is for a job picked back up after a
+        restart, whose program is already playing.
+        """
         # Run motion job. Only a print pauses on the button (the factory's
         # print handler is the one that acts on the press); a motion or a
         # hunt runs straight through.
@@ -643,25 +1155,31 @@ class Machine(BaseMachine):
                 progress = _JobProgress(self._q_msg_tx, msg['id'],
                                         'print:progress',
                                         self._feeder.job_total)
-            self._run_loop(lid_gated=lid_gated,
-                           pausable=msg['action_type'] == 'print',
-                           progress=progress)
+            recorder = self._start_trace()
+            try:
+                self._run_loop(lid_gated=lid_gated,
+                               pausable=msg['action_type'] == 'print',
+                               progress=progress, running=running)
+            finally:
+                self._save_trace(recorder, msg['id'])
+            settled = False
             if self._feeder.finished:
                 # The step totals are what the end position is checked
                 # against, so let the accounting catch up before reading it.
-                self._feeder.settle()
+                settled = self._feeder.settle()
             self._feeder.stop()
+            if self._journal is not None:
+                # The feed is over: what follows is nothing a restart could
+                # pick back up, and the park's byte count must not be taken
+                # for this job's.
+                self._journal.clear()
+                self._journal = None
             self._motion_stats['size'] = self._feeder.written
             self._motion_stats['stats'] = self._feeder.stats
             self._motion_stats['run_time'] = motion_run_time(
                 self._motion_stats, self._feeder.written)
-            # What the service's compression actually bought, per job. This
-            # is the number the memory guards are sized against, so it is
-            # worth having in the log rather than inferred from a capture.
-            if source.body_size:
-                logger.info('pulse data: %d bytes of body, %d bytes of program (%.1f:1)',
-                            source.body_size, self._feeder.written,
-                            self._feeder.written / source.body_size)
+            if on_fed is not None:
+                on_fed(settled)
             # The job's feed is over. The park that may follow writes its own
             # small program and must not inherit this one's state.
             self._feeder = None
@@ -697,6 +1215,32 @@ class Machine(BaseMachine):
         pos = cnc.position
         logger.info('end positions (%s, %s, %s)' % (pos.x.steps, pos.y.steps, pos.z.steps))
 
+    @staticmethod
+    def _start_trace() -> Union[PositionRecorder, None]:
+        """A position recorder for the run, when position_trace_hz asks for
+        one (forgefirm.conf; unset or 0 records nothing)."""
+        rate = _conf_float('position_trace_hz', 0.0)
+        if rate <= 0:
+            return None
+        recorder = PositionRecorder(rate_hz=min(rate, 1000.0))
+        recorder.start()
+        return recorder
+
+    @staticmethod
+    def _save_trace(recorder: Union[PositionRecorder, None], job_id) -> None:
+        if recorder is None:
+            return
+        recorder.stop()
+        path = '%s/%s.trace.csv' % (get_cfg('LOGGING.DIR') or '/tmp', job_id)
+        try:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            rows = recorder.export_csv(path)
+        except OSError as e:
+            logger.warning('position trace not saved: %s', e)
+            return
+        logger.info('position trace: %d samples (%d unreadable) in %s',
+                    rows, recorder.errors, path)
+
     def _return_home(self, pulse_dev) -> None:
         # The park is the response to an abort as much as to a finished
         # print, so it runs regardless of the cancel flag and regardless
@@ -804,6 +1348,22 @@ class Machine(BaseMachine):
                              ' '.join('%s=%s' % (k, header[k]) for k in declared))
         return gaps
 
+    def _stopped_at(self, pos) -> str:
+        """Where a job stopped at ``pos`` stands in its program, for the log.
+
+        From the feeder's position index, not another read of the kernel:
+        the place in the program the job will pick up from, to the nearest
+        entry before it. A job enqueued whole has no feeder, and no index:
+        ``pos`` itself is all there is.
+        """
+        if self._feeder is None:
+            return str(pos)
+        played = pos.bytes.processed
+        offset, x, y, z, laser = self._feeder.position_at(played)
+        return ('byte %d of %s; the program has the head at (%d, %d, %d) steps, '
+                'laser %s, as of byte %d' % (played, pos.bytes.total, x, y, z,
+                                             'on' if laser else 'off', offset))
+
     def _retrace(self, backtrack: int) -> tuple:
         """Walk back over ground the job already cut, with the laser off.
 
@@ -858,18 +1418,21 @@ class Machine(BaseMachine):
     def _wait_kernel_idle(self, timeout_s: float = 10.0) -> bool:
         """After a stop or a backtrack: True once the kernel reports idle
         (the controlled decel has played out), False on timeout/fault."""
-        deadline = monotonic() + timeout_s
-        while monotonic() < deadline:
-            state = cnc.state
-            if state is MachineState.IDLE:
-                return True
-            if state is not MachineState.RUNNING:
-                return False
-            sleep(.01)
-        return False
+        state = cnc.wait_state(set(MachineState) - {MachineState.RUNNING}, timeout_s)
+        return state is MachineState.IDLE
+
+    def _watch_state(self, stop: Event) -> None:
+        """Wake the run loop on every driver state change while it runs, so
+        an underrun, a fault or the program's end is acted on at once rather
+        than at the next tick."""
+        for state in cnc.transitions(stop=stop):
+            # The context first: the run loop's reaction rewrites it.
+            self._sdma.on_state(state)
+            self._run_wake.set()
 
     def _run_loop(self, park: bool = False, lid_gated: bool = True,
-                  pausable: bool = False, progress: '_JobProgress' = None) -> bool:
+                  pausable: bool = False, progress: '_JobProgress' = None,
+                  running: bool = False) -> bool:
         """Play the loaded program. Returns True if the run was aborted
         (stopped before the program's end), False if it ran to completion.
 
@@ -892,26 +1455,28 @@ class Machine(BaseMachine):
             moves again, and cancelled rather than left standing if it
             does not. A dry ring is an underrun and a scrapped job; this
             is the same job with a hidden seam.
-        The switch thread wakes this loop on every edge, so a reaction
-        lands within milliseconds; the level read each pass is the
-        backstop for an edge the thread missed.
+        The switch thread wakes this loop on every edge, and a watcher on
+        cnc/state on every transition, so a reaction lands within
+        milliseconds; the level read each pass is the backstop for an edge
+        either of them missed.
 
         ``progress``, when a caller supplies one, reports the run to the
         service: once as it starts, at every pause, resume and hold, once
         more when it ends, and on its own interval in between.
+
+        ``running`` takes over a run already under way, a job picked back up
+        after a restart, instead of starting one.
         """
-        logger.info('starting run')
+        logger.info('starting run' if not running else 'taking over the run')
         logger.info('current state: %s' % cnc.state)
         set_button_color(ButtonColor.WHITE)
         self._button_edges = 0
         self._enclosure_edge = False
         self._run_wake.clear()
-        cnc.run()
-        # Wait for state transition
-        wait_time = 20
-        while cnc.state is not MachineState.RUNNING and wait_time != 0:
-            wait_time = wait_time - 1
-            sleep(.1)
+        if not running:
+            cnc.run()
+            # Wait for state transition
+            cnc.wait_state((MachineState.RUNNING,), 2.0)
         logger.info('current state: %s' % cnc.state)
         backtrack = int(_conf_float('cloud_pause_backtrack_ticks', 2000))
         lead = int(_conf_float('cloud_resume_lead_ticks', 1950))
@@ -932,174 +1497,221 @@ class Machine(BaseMachine):
         feed_held = False
         feed_deadline = 0.0
         feed_holds = 0
+        feed_warned = False
+        ring_left, ring_read_at = None, -FEED_LEFT_EVERY_S
         if progress is not None:
             progress.send(force=True)
-        while True:
-            state = cnc.state
-            if progress is not None:
-                progress.send()
-            if state is MachineState.UNDERRUN:
-                # A live-fed ring went dry mid-run. The stop was instant, so
-                # steps were skipped at speed: the position is not to be
-                # trusted, and the job did not finish. Acknowledge it (which
-                # returns the device to idle) and report the job cancelled.
-                logger.error('pulse buffer ran dry mid-run after %s bytes; '
-                             'position is no longer trusted',
-                             cnc.position.bytes.processed)
-                cnc.stop()
-                self._running_action_cancelled = True
-                aborted = True
-                break
-            if state is not MachineState.RUNNING and not paused and not feed_held:
-                break                       # program ended, or the kernel faulted
-            switches = self._sw_thread.all_switches()
-            enclosure = self._enclosure_open(switches)
-            if enclosure is None and self._enclosure_edge:
-                enclosure = 'lid opened'    # an edge the level read already missed
-            self._enclosure_edge = False
-            # A locally-aborted run must not report ':completed' to the
-            # service: marking the action cancelled routes the finish
-            # through the ':cancelled' event.
-            if (not park and self._feeder is not None
-                    and self._feeder.error is not None):
-                logger.error('pulse feed failed mid-run (%s); stopping motion',
-                             self._feeder.error)
-                self._running_action_cancelled = True
-                aborted = True
-            elif self._running_action_cancelled and not park:
-                logger.warning('action cancelled mid-run; stopping motion')
-                aborted = True
-            elif enclosure is not None and lid_gated and not park:
-                logger.warning('%s mid-run; stopping motion', enclosure)
-                self._running_action_cancelled = True
-                aborted = True
-            elif cooling_svc.armed and not cooling_svc.fire_ok():
-                # The cooling engine's verdict (flow fault, over-temp,
-                # or an absent engine) pulls the job: latch the laser
-                # and stop.
-                verdict = cooling_svc.verdict()
-                logger.error('cooling verdict pulled fire mid-run: %s',
-                             verdict)
-                cnc.laser_latch(1)
-                if verdict is None:
-                    # Engine absent: if it died mid flow-check the
-                    # heater is still on - a write nobody else will
-                    # make now.
-                    WaterPump.heater_off()
-                self._running_action_cancelled = True
-                aborted = True
-            if aborted:
-                if not paused and not feed_held:
+        watch_stop = Event()
+        captured = self._sdma.count
+        self._sdma.arm()
+        watcher = Thread(target=self._watch_state, args=(watch_stop,), name='state-watch',
+                         daemon=True)
+        watcher.start()
+        try:
+            while True:
+                # Everything this pass decides on, read once and at one instant.
+                snap = snapshot(position=progress is not None and progress.due(),
+                                switches=self._sw_thread)
+                state = snap.state
+                self._sdma.on_state(state)
+                if progress is not None:
+                    progress.send(snap=snap)
+                if state is MachineState.UNDERRUN:
+                    # A live-fed ring went dry mid-run. The stop was instant, so
+                    # steps were skipped at speed: the position is not to be
+                    # trusted, and the job did not finish. Acknowledge it (which
+                    # returns the device to idle) and report the job cancelled.
+                    logger.error('pulse buffer ran dry mid-run after %s bytes; '
+                                 'position is no longer trusted',
+                                 (snap.position or cnc.position).bytes.processed)
                     cnc.stop()
-                    self._wait_kernel_idle()
-                break
+                    self._running_action_cancelled = True
+                    aborted = True
+                    break
+                if state is not MachineState.RUNNING and not paused and not feed_held:
+                    break                       # program ended, or the kernel faulted
+                enclosure = self._enclosure_open(snap.switches)
+                if enclosure is None and self._enclosure_edge:
+                    enclosure = 'lid opened'    # an edge the level read already missed
+                self._enclosure_edge = False
+                # A locally-aborted run must not report ':completed' to the
+                # service: marking the action cancelled routes the finish
+                # through the ':cancelled' event.
+                if (not park and self._feeder is not None
+                        and self._feeder.error is not None):
+                    logger.error('pulse feed failed mid-run (%s); stopping motion',
+                                 self._feeder.error)
+                    self._running_action_cancelled = True
+                    aborted = True
+                elif self._running_action_cancelled and not park:
+                    logger.warning('action cancelled mid-run; stopping motion')
+                    aborted = True
+                elif enclosure is not None and lid_gated and not park:
+                    logger.warning('%s mid-run; stopping motion', enclosure)
+                    self._running_action_cancelled = True
+                    aborted = True
+                elif cooling_svc.armed and not cooling_svc.fire_ok():
+                    # The cooling engine's verdict (flow fault, over-temp,
+                    # or an absent engine) pulls the job: latch the laser
+                    # and stop.
+                    verdict = cooling_svc.verdict()
+                    logger.error('cooling verdict pulled fire mid-run: %s',
+                                 verdict)
+                    cnc.laser_latch(1)
+                    if verdict is None:
+                        # Engine absent: if it died mid flow-check the
+                        # heater is still on - a write nobody else will
+                        # make now.
+                        WaterPump.heater_off()
+                    self._running_action_cancelled = True
+                    aborted = True
+                if aborted:
+                    if not paused and not feed_held:
+                        cnc.stop()
+                        self._wait_kernel_idle()
+                    break
 
-            # The feed watchdog. Only a live-fed job can starve: one that fit
-            # the ring is enqueued whole and has nothing left to wait for.
-            if self._feeder is not None and not self._feeder.finished:
-                now = monotonic()
-                moved = self._feeder.written != feed_mark
-                if moved:
-                    feed_mark, feed_at = self._feeder.written, now
-                if feed_held:
+                # The feed watchdog. Only a live-fed job can starve: one that fit
+                # the ring is enqueued whole and has nothing left to wait for.
+                if self._feeder is not None and not self._feeder.finished:
+                    now = monotonic()
+                    moved = self._feeder.written != feed_mark
                     if moved:
-                        logger.info('the pulse feed moved again after %d bytes; '
-                                    'resuming the job', self._feeder.written)
-                        if not self._resume_retraced(retraced, overlap):
+                        feed_mark, feed_at = self._feeder.written, now
+                        feed_warned = False
+                        ring_read_at = -FEED_LEFT_EVERY_S
+                        self._feed_clear.set()
+                    # A feed that has stopped is held once it has been still
+                    # FEED_STALL_S, or sooner if the ring would run dry first.
+                    stalled = now - feed_at
+                    stall_limit = FEED_STALL_S
+                    if not feed_held and not paused and stalled > FEED_MIN_STALL_S:
+                        self._feed_clear.clear()
+                        if now - ring_read_at >= FEED_LEFT_EVERY_S:
+                            ring_left, ring_read_at = _ring_seconds_left(), now
+                        if ring_left is not None:
+                            # Between reads the ring plays on: what it holds
+                            # now is the last read less the time since.
+                            left = ring_left - (now - ring_read_at)
+                            stall_limit = min(FEED_STALL_S,
+                                              max(FEED_MIN_STALL_S, left - FEED_DRY_MARGIN_S))
+                            if (left < FEED_DRY_MARGIN_S + FEED_WARN_LEAD_S
+                                    and not feed_warned):
+                                feed_warned = True
+                                logger.warning('the pulse feed has not moved in %.1f s; the '
+                                               'ring holds %.1f s of motion', stalled, left)
+                    if feed_held:
+                        if moved:
+                            logger.info('the pulse feed moved again after %d bytes; '
+                                        'resuming the job', self._feeder.written)
+                            if not self._resume_retraced(retraced, overlap):
+                                self._running_action_cancelled = True
+                                aborted = True
+                                break
+                            feed_held = False
+                            if pausable:
+                                send_wss_event(self._q_msg_tx, self.running_action_id,
+                                               'print:resumed')
+                            if progress is not None:
+                                progress.send(force=True)
+                            # Give the kernel a moment to leave idle before the
+                            # next pass reads the state.
+                            sleep(.05)
+                            continue
+                        if now > feed_deadline:
+                            logger.error('the pulse feed did not move in %.0f s of '
+                                         'waiting; cancelling the job', FEED_RECOVER_S)
                             self._running_action_cancelled = True
                             aborted = True
                             break
-                        feed_held = False
+                    elif not paused and stalled > stall_limit and _ring_has_room():
+                        feed_holds += 1
+                        logger.error('the pulse feed has not moved in %.0f s with room '
+                                     'in the ring (%d bytes fed); stopping the job '
+                                     'before the ring runs dry', now - feed_at, feed_mark)
+                        if feed_holds > FEED_MAX_HOLDS:
+                            logger.error('the feed has stalled %d times this job; '
+                                         'cancelling rather than cutting it in pieces',
+                                         feed_holds)
+                            self._running_action_cancelled = True
+                            aborted = True
+                            cnc.stop()
+                            self._wait_kernel_idle()
+                            break
+                        cnc.stop()
+                        if not self._wait_kernel_idle():
+                            break               # fault: the state read above ends the loop
+                        pos = cnc.position
+                        if pos.bytes.processed >= pos.bytes.total:
+                            break               # the decel ended the program: done
+                        ok, retraced = self._retrace(backtrack)
+                        if not ok:
+                            break
+                        feed_held = True
+                        feed_deadline = monotonic() + FEED_RECOVER_S
                         if pausable:
                             send_wss_event(self._q_msg_tx, self.running_action_id,
-                                           'print:resumed')
+                                           'print:paused')
+                        if progress is not None:
+                            progress.send(force=True)
+                        logger.info('held at %s, waiting for the feed', self._stopped_at(pos))
+                        continue
+
+                # A press while the job is held for the feed is not lost: it is
+                # left to be read once the job is moving again, where pausing is
+                # a thing the machine can actually do.
+                if pausable and self._button_edges and not feed_held:
+                    self._button_edges = 0
+                    if paused:
+                        logger.info('button pressed while paused')
+                        if not self._resume_retraced(retraced, overlap):
+                            self._running_action_cancelled = True
+                            aborted = True
+                            break
+                        paused = False
+                        send_wss_event(self._q_msg_tx, self.running_action_id,
+                                       'print:resumed')
                         if progress is not None:
                             progress.send(force=True)
                         # Give the kernel a moment to leave idle before the
                         # next pass reads the state.
                         sleep(.05)
                         continue
-                    if now > feed_deadline:
-                        logger.error('the pulse feed did not move in %.0f s of '
-                                     'waiting; cancelling the job', FEED_RECOVER_S)
-                        self._running_action_cancelled = True
-                        aborted = True
-                        break
-                elif not paused and now - feed_at > FEED_STALL_S and _ring_has_room():
-                    feed_holds += 1
-                    logger.error('the pulse feed has not moved in %.0f s with room '
-                                 'in the ring (%d bytes fed); stopping the job '
-                                 'before the ring runs dry', now - feed_at, feed_mark)
-                    if feed_holds > FEED_MAX_HOLDS:
-                        logger.error('the feed has stalled %d times this job; '
-                                     'cancelling rather than cutting it in pieces',
-                                     feed_holds)
-                        self._running_action_cancelled = True
-                        aborted = True
-                        cnc.stop()
-                        self._wait_kernel_idle()
-                        break
+                    logger.info('button pressed mid-run; pausing')
                     cnc.stop()
                     if not self._wait_kernel_idle():
-                        break               # fault: the state read above ends the loop
+                        break                   # fault: the state read above ends the loop
                     pos = cnc.position
                     if pos.bytes.processed >= pos.bytes.total:
-                        break               # the decel ended the program: done
+                        break                   # the decel ended the program: done
                     ok, retraced = self._retrace(backtrack)
                     if not ok:
                         break
-                    feed_held = True
-                    feed_deadline = monotonic() + FEED_RECOVER_S
-                    if pausable:
-                        send_wss_event(self._q_msg_tx, self.running_action_id,
-                                       'print:paused')
-                    if progress is not None:
-                        progress.send(force=True)
-                    logger.info('held at %s, waiting for the feed', cnc.position)
-                    continue
-
-            # A press while the job is held for the feed is not lost: it is
-            # left to be read once the job is moving again, where pausing is
-            # a thing the machine can actually do.
-            if pausable and self._button_edges and not feed_held:
-                self._button_edges = 0
-                if paused:
-                    logger.info('button pressed while paused')
-                    if not self._resume_retraced(retraced, overlap):
-                        self._running_action_cancelled = True
-                        aborted = True
-                        break
-                    paused = False
+                    paused = True
                     send_wss_event(self._q_msg_tx, self.running_action_id,
-                                   'print:resumed')
+                                   'print:paused')
                     if progress is not None:
                         progress.send(force=True)
-                    # Give the kernel a moment to leave idle before the
-                    # next pass reads the state.
-                    sleep(.05)
+                    logger.info('paused at %s', self._stopped_at(pos))
                     continue
-                logger.info('button pressed mid-run; pausing')
-                cnc.stop()
-                if not self._wait_kernel_idle():
-                    break                   # fault: the state read above ends the loop
-                pos = cnc.position
-                if pos.bytes.processed >= pos.bytes.total:
-                    break                   # the decel ended the program: done
-                ok, retraced = self._retrace(backtrack)
-                if not ok:
-                    break
-                paused = True
-                send_wss_event(self._q_msg_tx, self.running_action_id,
-                               'print:paused')
-                if progress is not None:
-                    progress.send(force=True)
-                logger.info('paused at %s', cnc.position)
-                continue
-            if (paused or feed_held) and state not in (MachineState.IDLE,
-                                                       MachineState.RUNNING):
-                break                       # the kernel faulted while held
-            self._run_wake.wait(.1)
-            self._run_wake.clear()
+                if (paused or feed_held) and state not in (MachineState.IDLE,
+                                                           MachineState.RUNNING):
+                    break                       # the kernel faulted while held
+                self._run_wake.wait(.1)
+                self._run_wake.clear()
+        finally:
+            watch_stop.set()
+            self._feed_clear.set()
+            # Seen through to its end, so that a watcher still in its wait
+            # does not wake, or sample for, the run that comes next (the
+            # park, after a job).
+            watcher.join()
+            self._sdma.disarm()
+        new = self._sdma.count - captured
+        for capture in self._sdma.captures[-new:] if new else ():
+            taken = [ctx for ts, ctx in capture['samples'] if ts >= capture['ts'] and ctx]
+            logger.warning('sdma context at %s: %s', capture['state'].name.lower(),
+                           taken[0] if taken else 'unreadable')
         logger.info('current state: %s' % cnc.state)
         set_button_color(ButtonColor.OFF)
         if progress is not None:
@@ -1110,14 +1722,16 @@ class Machine(BaseMachine):
         return aborted
 
     def _safe_to_move(self, lid_gated: bool = True) -> bool:
-        switches = self._sw_thread.all_switches()
-        reason = self._enclosure_open(switches)
+        snap = snapshot(switches=self._sw_thread)
+        reason = self._enclosure_open(snap.switches)
         if reason is not None and lid_gated:
             logger.info('%s, unsafe to move', reason)
             return False
-        if cnc.state is not MachineState.IDLE:
-            logger.info('machine is not idle, state: %s' % cnc.state.value)
+        if snap.state is not MachineState.IDLE:
+            logger.info('machine is not idle, state: %s' % snap.state.value)
             return False
+        # Only now is the coolant worth a PIC transaction: a machine that is
+        # open or busy is refused without one.
         temp = temp_sensor.water_2.C
         if temp > int(get_cfg('THERMAL.MAX_START_TEMP')):
             logger.info('machine temp is too high, temp: %s' % temp)
@@ -0,0 +1,89 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+SPDX-License-Identifier:    MIT
+
+One pass's view of the machine.
+
+The run loop, the progress report and the start gate each decide on a mix of
+the driver state, the position, the switch word and the temperatures. Read
+separately, one attribute at a time, every decision in a pass sees a slightly
+different machine, and the same attribute is read twice in the same pass. A
+snapshot reads what its caller declares once, through the held attribute
+descriptors, and every consumer of that pass shares it.
+"""
+import logging
+from time import monotonic
+from types import MappingProxyType
+from typing import Iterable, Union
+
+from gfhardware._common import LOGGER_NAME, TEMP_SENSORS, MachineState, Position
+from gfhardware.cnc import cnc
+from gfhardware.cooling import temp_sensor
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class Snapshot(object):
+    """
+    What the machine said at one instant. Immutable: a pass that wants a newer
+    view takes a new snapshot rather than refreshing part of this one.
+
+    ``position``, ``switches`` and ``temps`` are None when the caller did not
+    ask for them; ``position`` is also None when it could not be read, which
+    a consumer treats as "not reported this pass", never as zero.
+    """
+    __slots__ = ('ts', 'state', 'position', 'switches', 'temps')
+
+    def __init__(self, ts: float, state: MachineState, position: Union[Position, None] = None,
+                 switches: dict = None, temps: dict = None):
+        set_ = object.__setattr__
+        set_(self, 'ts', ts)
+        set_(self, 'state', state)
+        set_(self, 'position', position)
+        set_(self, 'switches', None if switches is None else MappingProxyType(switches))
+        set_(self, 'temps', None if temps is None else MappingProxyType(temps))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('a snapshot does not change')
+
+    def __delattr__(self, name):
+        raise AttributeError('a snapshot does not change')
+
+    def __repr__(self):
+        return 'Snapshot(ts=%.3f, state=%s, position=%r, switches=%r, temps=%r)' % (
+            self.ts, self.state, self.position,
+            None if self.switches is None else dict(self.switches),
+            None if self.temps is None else dict(self.temps))
+
+
+def snapshot(position: bool = False, switches=None,
+             temps: Union[bool, Iterable[str]] = False) -> Snapshot:
+    """
+    Read the declared attributes in one pass.
+
+    The driver state is always read. ``position`` adds cnc/position;
+    ``switches`` is a switch monitor (or anything with ``all_switches()``) to
+    read the switch word from; ``temps`` is True for every sensor or the names
+    of the ones wanted, since each is a PIC transaction of its own.
+
+    The state is read last, so the word a pass decides on is the freshest
+    thing in it.
+    """
+    ts = monotonic()
+    sw = None if switches is None else switches.all_switches()
+    pos = None
+    if position:
+        try:
+            pos = cnc.position
+        except (OSError, ValueError) as e:
+            logger.debug('position unreadable: %s', e)
+    t = None
+    if temps:
+        names = TEMP_SENSORS if temps is True else temps
+        t = {name: getattr(temp_sensor, name) for name in names}
+    return Snapshot(ts, cnc.state, pos, sw, t)
+
+
+__all__ = ['snapshot', 'Snapshot']
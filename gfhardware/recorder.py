@@ -0,0 +1,140 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+SPDX-License-Identifier:    MIT
+
+A print's trajectory and byte progress, sampled at a steady rate.
+
+A skipped step or an underrun shows in the log as a position that disagrees
+with the program, long after it happened. The recorder samples cnc/position
+(and, optionally, cnc/state) through a held descriptor into preallocated
+arrays, a fixed number of samples deep, so what led up to the end of a job is
+there to export when it ends or faults. A sample reads into the same buffer
+and writes into the same arrays every time: it builds nothing that outlives
+it, and runs at hundreds of hertz beside the feeder without disturbing it.
+"""
+import csv
+import logging
+from array import array
+from threading import Event, Thread
+from time import monotonic
+
+from gfhardware._common import LOGGER_NAME, SYSFS_GF_BASE, PositionRecord, sysfs_attr
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Ten minutes at 200 Hz: 2.6 MB of arrays.
+DEFAULT_SAMPLES = 120000
+DEFAULT_RATE_HZ = 200.0
+
+# cnc/state is told apart by its first letter, which is what a sample keeps.
+_STATE_NAMES = {ord('d'): 'disabled', ord('i'): 'idle', ord('r'): 'running',
+                ord('f'): 'fault', ord('u'): 'underrun'}
+
+COLUMNS = ('t', 'x', 'y', 'z', 'processed', 'total', 'state')
+
+
+class PositionRecorder(Thread):
+    """
+    Samples the position into a ring of ``samples`` entries at ``rate_hz``.
+
+    Start it with the run, stop() it after; the newest ``samples`` samples
+    are kept. Timestamps are monotonic seconds. ``state`` adds cnc/state to
+    each sample, one more attribute read.
+    """
+
+    def __init__(self, rate_hz: float = DEFAULT_RATE_HZ, samples: int = DEFAULT_SAMPLES,
+                 state: bool = True):
+        Thread.__init__(self, name='position-recorder', daemon=True)
+        self.period = 1.0 / rate_hz
+        self.capacity = samples
+        self._with_state = state
+        self._t = array('d', bytes(8 * samples))
+        self._x = array('i', bytes(4 * samples))
+        self._y = array('i', bytes(4 * samples))
+        self._z = array('i', bytes(4 * samples))
+        self._processed = array('I', bytes(4 * samples))
+        self._total = array('I', bytes(4 * samples))
+        self._state = array('B', bytes(samples))
+        self._count = 0
+        self.errors = 0
+        self._halt = Event()
+
+    @property
+    def count(self) -> int:
+        """Samples taken since the start, kept or not."""
+        return self._count
+
+    def stop(self, timeout: float = 1.0) -> None:
+        self._halt.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self) -> None:
+        pos_attr = sysfs_attr(SYSFS_GF_BASE + 'cnc/position')
+        state_attr = sysfs_attr(SYSFS_GF_BASE + 'cnc/state') if self._with_state else None
+        raw = bytearray(PositionRecord.LAYOUT.size)
+        signed = memoryview(raw)[:12].cast('i')
+        unsigned = memoryview(raw)[12:].cast('I')
+        state_raw = bytearray(1)
+        cap = self.capacity
+        next_at = monotonic()
+        while not self._halt.is_set():
+            try:
+                if pos_attr.readinto(raw) != len(raw):
+                    raise ValueError('short read of cnc/position')
+                if state_attr is not None:
+                    state_attr.readinto(state_raw)
+            except (OSError, ValueError):
+                self.errors += 1
+            else:
+                i = self._count % cap
+                self._t[i] = monotonic()
+                self._x[i] = signed[0]
+                self._y[i] = signed[1]
+                self._z[i] = signed[2]
+                self._processed[i] = unsigned[0]
+                self._total[i] = unsigned[1]
+                self._state[i] = state_raw[0]
+                self._count += 1
+            next_at += self.period
+            delay = next_at - monotonic()
+            if delay < 0:
+                # Fell behind (a slow attribute, a busy CPU): carry on from
+                # now rather than firing off the missed samples back to back.
+                next_at = monotonic()
+                delay = 0
+            self._halt.wait(delay)
+
+    def columns(self) -> dict:
+        """The kept samples, oldest first, one array per column of COLUMNS."""
+        n = min(self._count, self.capacity)
+        start = self._count % self.capacity if self._count > self.capacity else 0
+        out = {}
+        for name in COLUMNS:
+            col = getattr(self, '_' + name)
+            out[name] = col[start:n] + col[:start] if start else col[:n]
+        return out
+
+    def export_csv(self, path: str) -> int:
+        """Write the kept samples to ``path`` as CSV; the rows written."""
+        cols = self.columns()
+        with open(path, 'w', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(COLUMNS)
+            for row in zip(*(cols[name] for name in COLUMNS[:-1]), cols['state']):
+                w.writerow(('%.6f' % row[0],) + row[1:-1] + (_STATE_NAMES.get(row[-1], ''),))
+        return len(cols['t'])
+
+    def export_npz(self, path: str) -> int:
+        """Write the kept samples to ``path`` as a NumPy .npz, one array per
+        column (state as its first letter); the samples written. Needs NumPy."""
+        import numpy
+        cols = self.columns()
+        numpy.savez_compressed(path, **{name: numpy.frombuffer(col, dtype=col.typecode)
+                                        for name, col in cols.items()})
+        return len(cols['t'])
+
+
+__all__ = ['PositionRecorder']
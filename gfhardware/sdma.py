@@ -0,0 +1,185 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+SPDX-License-Identifier:    MIT
+
+The SDMA script's context, read and kept.
+
+cnc/sdma_context is a fixed-layout text dump of the pulse engine's registers.
+The field table below is built once and parsed into integers. An underrun or
+a fault leaves its evidence in that context for milliseconds at most, before
+the stop that follows rewrites it, so the sampler takes one the moment such a
+transition is seen, and, while armed, keeps a ring of the ones before it.
+"""
+import logging
+from collections import deque
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import List, Union
+
+from gfhardware._common import LOGGER_NAME, SDMA, SYSFS_GF_BASE, MachineState, sysfs_attr
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+def _field_table() -> tuple:
+    # Line by line, the dump's fields and where they start and end. The first
+    # two lines are the program counters and the flags; the five after are
+    # six 8-digit registers each, 13 columns apart.
+    table = [('pc', 0, 3, 7), ('rpc', 0, 12, 16), ('spc', 0, 21, 25), ('epc', 0, 30, 34),
+             ('t', 1, 9, 10), ('sf', 1, 14, 15), ('df', 1, 19, 20), ('lm', 1, 24, 25)]
+    names = iter(SDMA._fields[8:])
+    for line in range(2, 7):
+        for col in range(6):
+            table.append((next(names), line, 4 + 13 * col, 12 + 13 * col))
+    assert tuple(f[0] for f in table) == SDMA._fields
+    return tuple((line, start, end) for _, line, start, end in table)
+
+
+_FIELDS = _field_table()
+
+
+def parse_sdma(text: str) -> SDMA:
+    """The context dump as integers, in SDMA field order."""
+    lines = text.splitlines()
+    return SDMA._make(int(lines[line][start:end], 16) for line, start, end in _FIELDS)
+
+
+class SdmaSampler(object):
+    """
+    Takes the SDMA context around the transitions that lose it.
+
+    on_state() is told of every driver state seen; a change into UNDERRUN or
+    FAULT while armed takes the context there and then, and ``post`` more at
+    ``post_period_s`` after it. With ``period_s``, an armed sampler also takes
+    one that often, so the ring holds what led up to the transition as well.
+    Each transition's samples, the ``depth`` before it included, become one
+    capture; the last ``keep`` captures are kept.
+
+    Samples are the raw dump: parsing waits until someone looks.
+    """
+    TRIGGERS = (MachineState.UNDERRUN, MachineState.FAULT)
+
+    def __init__(self, depth: int = 16, period_s: float = 0.0, post: int = 4,
+                 post_period_s: float = 0.002, keep: int = 4):
+        self.period_s = period_s
+        self.post = post
+        self.post_period_s = post_period_s
+        self._ring = deque(maxlen=depth)
+        self._captures = deque(maxlen=keep)
+        self._lock = Lock()
+        self._last = None
+        self._armed = False
+        self._halt = Event()
+        self._wake = Event()
+        self._pending = None
+        self._thread = None
+        # Captures made since construction, kept or not.
+        self.count = 0
+
+    @property
+    def captures(self) -> List[dict]:
+        """Kept captures, oldest first: {'state', 'ts', 'samples': [(ts, SDMA)]},
+        the trigger sample the first one at or after ``ts``."""
+        with self._lock:
+            captures = list(self._captures)
+        return [{'state': c['state'], 'ts': c['ts'],
+                 'samples': [(ts, _parse_or_none(text)) for ts, text in c['samples']]}
+                for c in captures]
+
+    def arm(self) -> None:
+        with self._lock:
+            self._armed = True
+            self._last = None
+            self._ring.clear()
+        self._halt.clear()
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='sdma-sampler', daemon=True)
+            self._thread.start()
+
+    def disarm(self) -> None:
+        with self._lock:
+            self._armed = False
+        self._halt.set()
+        self._wake.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(1.0)
+
+    def on_state(self, state: MachineState) -> None:
+        """A state the caller saw. Cheap unless it is the transition to keep."""
+        with self._lock:
+            if not self._armed or state is self._last:
+                self._last = state
+                return
+            self._last = state
+            if state not in self.TRIGGERS:
+                return
+            if self._pending is not None:
+                # Another transition before the last one's samples were all
+                # in: keep that capture as far as it got.
+                self._pending.pop('left', None)
+                self._captures.append(self._pending)
+            self.count += 1
+            sample = self._sample()
+            if sample is not None:
+                self._ring.append(sample)
+            self._pending = {'state': state, 'ts': sample[0] if sample else monotonic(),
+                             'samples': list(self._ring), 'left': self.post}
+        logger.info('sdma: %s, context taken', state.name.lower())
+        self._wake.set()
+
+    def _sample(self) -> Union[tuple, None]:
+        try:
+            return monotonic(), sysfs_attr(SYSFS_GF_BASE + 'cnc/sdma_context').read()
+        except OSError as e:
+            logger.debug('sdma context unreadable: %s', e)
+            return None
+
+    def _run(self) -> None:
+        while not self._halt.is_set():
+            with self._lock:
+                pending = self._pending
+            if pending is not None:
+                wait = self.post_period_s
+            elif self.period_s > 0:
+                wait = self.period_s
+            else:
+                wait = None
+            self._wake.wait(wait)
+            self._wake.clear()
+            if self._halt.is_set():
+                break
+            with self._lock:
+                pending = self._pending
+                if pending is None:
+                    if self.period_s > 0 and self._armed:
+                        sample = self._sample()
+                        if sample is not None:
+                            self._ring.append(sample)
+                    continue
+                if pending['left'] > 0:
+                    sample = self._sample()
+                    if sample is not None:
+                        pending['samples'].append(sample)
+                    pending['left'] -= 1
+                if pending['left'] <= 0:
+                    del pending['left']
+                    self._captures.append(pending)
+                    self._pending = None
+        with self._lock:
+            if self._pending is not None:
+                self._pending.pop('left', None)
+                self._captures.append(self._pending)
+                self._pending = None
+
+
+def _parse_or_none(text: str) -> Union[SDMA, None]:
+    try:
+        return parse_sdma(text)
+    except (IndexError, ValueError):
+        return None
+
+
+__all__ = ['parse_sdma', 'SdmaSampler']
@@ -0,0 +1,42 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+SPDX-License-Identifier:    MIT
+
+A stand-in for the hardware under gfhardware, so the job path above the
+feeder can run, and be timed, off the machine.
+
+The device paths are read once, when gfhardware is imported, so they are
+moved in the environment the process starts with (environ() gives the three
+variables for a root), and the simulator is started in the process that runs
+the job:
+
+    GF_SYSFS_BASE=/tmp/gf/sys/glowforge/ GF_PULSE_DEVICE=/tmp/gf/dev/glowforge \
+    GF_SWITCH_DEVICE=/tmp/gf/dev/input/event0 python3 bench.py
+
+    # bench.py
+    with Simulator(speed=50):
+        ...
+
+It builds a /sys/glowforge tree of plain files, plays a pulse ring that
+refuses a write it has no room for with ENOMEM, moves cnc/state the way the
+driver does, and reports the switches through a pipe of input events.
+"""
+import os
+
+from gfhardware.sim.ring import RingFile, SimRing
+from gfhardware.sim.simulator import Simulator
+from gfhardware.sim.switches import SimSwitches
+
+
+def environ(root: str) -> dict:
+    """The environment that moves the device paths under ``root``."""
+    return {
+        'GF_SYSFS_BASE': os.path.join(root, 'sys', 'glowforge', ''),
+        'GF_PULSE_DEVICE': os.path.join(root, 'dev', 'glowforge'),
+        'GF_SWITCH_DEVICE': os.path.join(root, 'dev', 'input', 'event0'),
+    }
+
+
+__all__ = ['environ', 'RingFile', 'SimRing', 'Simulator', 'SimSwitches']
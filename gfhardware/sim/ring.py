@@ -0,0 +1,217 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+SPDX-License-Identifier:    MIT
+
+The pulse device's ring, in memory.
+
+What a writer sees is the device's contract: a write is taken whole or
+refused with ENOMEM, a seek of 0, 1 or 2 clears (everything; the data and
+byte counters; the position counters) and is refused with EBUSY while the
+ring plays. What the simulator sees is the other end: bytes taken off the
+front at the step rate, counted into the position the way the kernel counts
+them, and kept for a while afterwards so a backward run has something to
+retrace.
+"""
+import errno
+import os
+import threading
+from collections import deque
+
+# The device's ring is 32 MiB of pulse data.
+RING_BYTES = 32 << 20
+# How much already-played data is kept for a backward run.
+BACKTRACK_BYTES = 64 << 10
+
+
+def _table(pos, neg) -> bytes:
+    # One byte per record: the power records (top bit set) move nothing; every
+    # other record may step any axis.
+    table = bytearray(b'.' * 256)
+    for b in range(0x80):
+        if pos(b):
+            table[b] = ord('+')
+        elif neg(b):
+            table[b] = ord('-')
+    return bytes(table)
+
+
+_AXES = (
+    _table(lambda b: b & 0x03 == 0x01, lambda b: b & 0x03 == 0x03),
+    _table(lambda b: b & 0x0C == 0x0C, lambda b: b & 0x0C == 0x04),
+    _table(lambda b: b & 0x60 == 0x20, lambda b: b & 0x60 == 0x60),
+)
+
+
+def steps_in(data: bytes) -> tuple:
+    """Net (x, y, z) steps a run of pulse data makes."""
+    out = []
+    for table in _AXES:
+        marks = data.translate(table)
+        out.append(marks.count(b'+') - marks.count(b'-'))
+    return tuple(out)
+
+
+class SimRing(object):
+    """The ring and the counters the driver keeps beside it."""
+
+    def __init__(self, capacity: int = RING_BYTES, backtrack: int = BACKTRACK_BYTES):
+        self.capacity = capacity
+        self.backtrack = backtrack
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._head = 0
+        self._queued = 0
+        self._played = deque()
+        self._played_len = 0
+        # Set by the simulator while the ring plays; seeks are refused then.
+        self.busy = False
+        self.x = self.y = self.z = 0
+        self.total = 0
+        self.processed = 0
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def free(self) -> int:
+        return self.capacity - self._queued
+
+    @property
+    def playable_back(self) -> int:
+        return self._played_len
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        with self._lock:
+            if len(data) > self.capacity - self._queued:
+                raise OSError(errno.ENOMEM, os.strerror(errno.ENOMEM))
+            if data:
+                self._queue.append(data)
+                self._queued += len(data)
+                self.total += len(data)
+        return len(data)
+
+    def seek(self, count: int) -> int:
+        with self._lock:
+            if count not in (0, 1, 2):
+                raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+            if self.busy:
+                raise OSError(errno.EBUSY, os.strerror(errno.EBUSY))
+            if count in (0, 1):
+                self._queue.clear()
+                self._head = self._queued = 0
+                self._played.clear()
+                self._played_len = 0
+                self.total = self.processed = 0
+            if count in (0, 2):
+                self.x = self.y = self.z = 0
+        return 0
+
+    def play(self, limit: int) -> int:
+        """Play up to ``limit`` bytes forward; the number played."""
+        with self._lock:
+            taken = []
+            want = min(limit, self._queued)
+            got = 0
+            while got < want:
+                chunk = self._queue[0]
+                n = min(len(chunk) - self._head, want - got)
+                taken.append(chunk[self._head:self._head + n])
+                self._head += n
+                got += n
+                if self._head == len(chunk):
+                    self._queue.popleft()
+                    self._head = 0
+            if not got:
+                return 0
+            data = b''.join(taken)
+            self._queued -= got
+            self.processed += got
+            self._count(data, 1)
+            self._played.append(data)
+            self._played_len += got
+            while self._played_len - len(self._played[0]) >= self.backtrack:
+                self._played_len -= len(self._played.popleft())
+            return got
+
+    def unplay(self, limit: int) -> int:
+        """Retrace up to ``limit`` bytes of what was played; the number
+        retraced. They go back on the front of the ring, to be played again."""
+        with self._lock:
+            got = 0
+            while got < limit and self._played:
+                data = self._played.pop()
+                n = min(len(data), limit - got)
+                back, keep = data[len(data) - n:], data[:len(data) - n]
+                if keep:
+                    self._played.append(keep)
+                self._played_len -= n
+                self._count(back, -1)
+                if self._head:
+                    self._queue[0] = self._queue[0][self._head:]
+                    self._head = 0
+                self._queue.appendleft(back)
+                self._queued += n
+                self.processed -= n
+                got += n
+            return got
+
+    def _count(self, data: bytes, sign: int) -> None:
+        dx, dy, dz = steps_in(data)
+        self.x += sign * dx
+        self.y += sign * dy
+        self.z += sign * dz
+
+
+class RingFile(object):
+    """One open of the simulated pulse device.
+
+    Carries a real descriptor on the device path so a flock() and a fileno()
+    behave, while the data goes to the ring. ``on_change`` is told after a
+    write or a seek, so the counters a reader sees next are already current.
+    Closing it while the ring plays is the dead man's switch: ``on_close`` is
+    told.
+    """
+
+    def __init__(self, ring: SimRing, path: str, on_change=None, on_close=None):
+        self._ring = ring
+        self._file = open(path, 'ab', buffering=0)
+        self._on_change = on_change
+        self._on_close = on_close
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def write(self, data) -> int:
+        n = self._ring.write(data)
+        if self._on_change is not None:
+            self._on_change()
+        return n
+
+    def seek(self, count: int, whence: int = os.SEEK_SET) -> int:
+        if whence != os.SEEK_SET:
+            raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+        pos = self._ring.seek(count)
+        if self._on_change is not None:
+            self._on_change()
+        return pos
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._file.close()
+        if self._on_close is not None:
+            self._on_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
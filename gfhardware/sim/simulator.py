@@ -0,0 +1,252 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+SPDX-License-Identifier:    MIT
+
+The driver's half of the machine: the cnc state machine, the ring it plays,
+and the attributes it answers through.
+"""
+import logging
+import os
+import threading
+from time import monotonic
+
+from gfhardware._common import LOGGER_NAME, PULS_DEVICE, SWITCH_DEVICE, SYSFS_GF_BASE
+from gfhardware.cnc import cnc
+from gfhardware.sim import tree
+from gfhardware.sim.ring import BACKTRACK_BYTES, RING_BYTES, RingFile, SimRing
+from gfhardware.sim.switches import SimSwitches
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# How often the simulated driver looks at its commands and plays the ring.
+TICK_S = 0.002
+# Where a relocated Z head finds home: the hall sensor reads 0 in this window.
+Z_HOME = range(0, 20)
+
+
+class Simulator(object):
+    """
+    Stands in for the hardware at the three device paths.
+
+    The paths must already have been moved (GF_SYSFS_BASE, GF_PULSE_DEVICE,
+    GF_SWITCH_DEVICE) before gfhardware was imported; the simulator builds its
+    tree where they point and refuses to touch the real ones. Pulse-device
+    opens in this process go to its ring.
+
+    ``speed`` runs the ring that many times faster than the step rate, which
+    is cnc/step_freq as the host sets it unless ``drain_rate`` (bytes a
+    second, before ``speed``) fixes it. Only the ring is accelerated: a host's
+    own sleeps still take the time they say.
+    """
+
+    def __init__(self, speed: float = 1.0, drain_rate: int = None, ring_bytes: int = RING_BYTES,
+                 backtrack: int = BACKTRACK_BYTES, sysfs_base: str = SYSFS_GF_BASE,
+                 pulse_device: str = PULS_DEVICE, switch_device: str = SWITCH_DEVICE):
+        if os.path.realpath(sysfs_base) == '/sys/glowforge':
+            raise ValueError('the simulator needs GF_SYSFS_BASE moved off /sys/glowforge')
+        self.speed = speed
+        self.drain_rate = drain_rate
+        self.base = os.path.join(sysfs_base, '')
+        self.pulse_device = pulse_device
+        self.ring = SimRing(ring_bytes, backtrack)
+        self.switches = SimSwitches(switch_device)
+        self.underruns = 0
+        self.bytes_played = 0
+        self.deadman_trips = 0
+        self._state = 'disabled'
+        self._faults = 0
+        self._reverse = 0
+        self._carry = 0.0
+        self._z = Z_HOME.start + len(Z_HOME) // 2
+        self._fds = {}
+        self._published = {}
+        self._lock = threading.Lock()
+        self._halt = threading.Event()
+        self._thread = None
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def start(self) -> 'Simulator':
+        tree.build(self.base)
+        os.makedirs(os.path.dirname(self.pulse_device), exist_ok=True)
+        open(self.pulse_device, 'ab').close()
+        self.switches.open()
+        self._publish()
+        cnc.set_pulse_opener(self.open_pulse_dev)
+        self._halt.clear()
+        self._thread = threading.Thread(target=self._run, name='gf-sim', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._halt.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        cnc.set_pulse_opener(None)
+        self.switches.close()
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def open_pulse_dev(self) -> RingFile:
+        """What an open of the pulse device gets while the simulator runs."""
+        return RingFile(self.ring, self.pulse_device, self._ring_changed, self._deadman)
+
+    def fault(self, bits: int = 1) -> None:
+        """Trip a driver fault: the ring stops and the state says so."""
+        with self._lock:
+            self._faults |= bits
+            self._enter('fault')
+            self._publish()
+
+    def clear_fault(self) -> None:
+        with self._lock:
+            self._faults = 0
+            if self._state == 'fault':
+                self._enter('idle')
+            self._publish()
+
+    def _ring_changed(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                self._publish()
+
+    def _deadman(self) -> None:
+        with self._lock:
+            if self._state in ('running', 'underrun'):
+                logger.warning('sim: pulse device closed mid-run; stopping')
+                self.deadman_trips += 1
+                self._enter('idle')
+                self._publish()
+
+    def _run(self) -> None:
+        last = monotonic()
+        while not self._halt.wait(TICK_S):
+            now = monotonic()
+            with self._lock:
+                self._tick(now - last)
+                self._publish()
+            last = now
+
+    def _tick(self, dt: float) -> None:
+        for name in tree.COMMANDS:
+            value = self._take(name)
+            if value is not None:
+                self._command(name, value)
+        if self._state != 'running':
+            self._carry = 0.0
+            return
+        budget = self._rate() * self.speed * dt + self._carry
+        n = int(budget)
+        self._carry = budget - n
+        if self._reverse:
+            done = self.ring.unplay(min(n, self._reverse))
+            self._reverse -= done
+            if not self._reverse or (n and not done):
+                self._reverse = 0
+                self._enter('idle')
+            return
+        played = self.ring.play(n)
+        self.bytes_played += played
+        if self.ring.queued == 0:
+            if self._host_int('cnc/streaming'):
+                self.underruns += 1
+                self._enter('underrun')
+            else:
+                self._enter('idle')
+
+    def _command(self, name: str, value: str) -> None:
+        state = self._state
+        if name == 'enable':
+            if state == 'disabled':
+                self._enter('idle')
+        elif name == 'disable':
+            if state != 'fault':
+                self._enter('disabled')
+        elif name == 'run':
+            if state in ('idle', 'underrun'):
+                self._enter('running')
+        elif name in ('stop', 'halt'):
+            if state in ('running', 'underrun'):
+                self._reverse = 0
+                self._enter('idle')
+        elif name == 'resume':
+            if state not in ('idle', 'underrun'):
+                return
+            try:
+                steps = int(value)
+            except ValueError:
+                return
+            if steps < 0:
+                if -steps > self.ring.playable_back:
+                    # The driver refuses this to the writer; a file cannot.
+                    logger.warning('sim: backtrack of %d refused, %d playable',
+                                   -steps, self.ring.playable_back)
+                    return
+                self._reverse = -steps
+            self._enter('running')
+        elif name == 'z_step':
+            self._z += 1 if value == '1' else -1
+
+    def _enter(self, state: str) -> None:
+        self._state = state
+        self.ring.busy = state == 'running'
+
+    def _rate(self) -> float:
+        if self.drain_rate is not None:
+            return self.drain_rate
+        return self._host_int('cnc/step_freq')
+
+    def _fd(self, rel: str, flags: int = os.O_RDONLY) -> int:
+        fd = self._fds.get(rel)
+        if fd is None:
+            fd = self._fds[rel] = os.open(self.base + rel, flags)
+        return fd
+
+    def _host_int(self, rel: str) -> int:
+        raw = os.pread(self._fd(rel), 64, 0).strip(b'\x00 \n')
+        try:
+            return int(raw)
+        except ValueError:
+            return 0
+
+    def _take(self, name: str):
+        """A command written since the last look, emptied out of its file."""
+        fd = self._fd('cnc/' + name, os.O_RDWR)
+        if not os.fstat(fd).st_size:
+            return None
+        raw = os.pread(fd, 64, 0)
+        os.ftruncate(fd, 0)
+        # The host's write may land between the read and the truncate and
+        # come back as zeros where its value was; nothing to act on twice.
+        value = raw.strip(b'\x00 \n').decode(errors='replace')
+        return value or None
+
+    def _publish(self) -> None:
+        ring = self.ring
+        self._put('cnc/state', self._state)
+        self._put('cnc/faults', self._faults)
+        self._put('cnc/free', ring.free)
+        self._put('cnc/max_backtrack', ring.playable_back)
+        self._put('cnc/underruns', self.underruns)
+        self._put('head/hall_sensor', 0 if self._z in Z_HOME else 1)
+        position = tree.POSITION.pack(ring.x, ring.y, ring.z, ring.processed, ring.total)
+        if self._published.get('cnc/position') != position:
+            os.pwrite(self._fd('cnc/position', os.O_WRONLY), position, 0)
+            self._published['cnc/position'] = position
+
+    def _put(self, rel: str, value) -> None:
+        if self._published.get(rel) != value:
+            tree.put_value(self._fd(rel, os.O_WRONLY), value)
+            self._published[rel] = value
@@ -0,0 +1,98 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+SPDX-License-Identifier:    MIT
+
+The switch device, as a pipe of input events.
+
+A FIFO at the relocated SWITCH_DEVICE carries struct input_event records,
+each change followed by a SYN_REPORT, exactly as the kernel's evdev read
+delivers them. It answers no ioctl, so a reader knows the switches only from
+the events it has read (see switches.InputDevice): one reader per pipe, and
+the monitor thread is the one.
+"""
+import errno
+import os
+import stat
+import struct
+import threading
+from time import time
+
+from gfhardware._common import EventCode, InputSwitch, SynCode
+
+_EVENT = struct.Struct('llHHi')
+
+# A closed lid and an intact interlock loop: a machine ready to run.
+READY = {
+    InputSwitch.SW_DOOR1: True,
+    InputSwitch.SW_DOOR2: True,
+    InputSwitch.SW_BUTTON: False,
+    InputSwitch.SW_DOORS: True,
+    InputSwitch.SW_HV_ENABLE: False,
+    InputSwitch.SW_INTERLOCK: False,
+    InputSwitch.SW_INTERLOCK_LATCH: False,
+    InputSwitch.SW_HEAD: True,
+}
+
+
+class SimSwitches(object):
+    """Writes switch events into the pipe at ``path``."""
+
+    def __init__(self, path: str, initial: dict = None):
+        self.path = path
+        self._state = dict(READY if initial is None else initial)
+        self._lock = threading.Lock()
+        self._fd = None
+
+    def open(self) -> None:
+        try:
+            if not stat.S_ISFIFO(os.stat(self.path).st_mode):
+                raise OSError(errno.EEXIST, 'not a pipe; refusing to replace', self.path)
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        os.mkfifo(self.path)
+        # Held open both ways so the pipe neither blocks the opener nor reads
+        # as ended while no reader has it.
+        self._fd = os.open(self.path, os.O_RDWR | os.O_NONBLOCK)
+        for switch, val in self._state.items():
+            self._emit(switch, val)
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    @property
+    def state(self) -> dict:
+        return dict(self._state)
+
+    def set(self, switch: InputSwitch, val: bool) -> None:
+        """Change one switch, and report it."""
+        with self._lock:
+            self._state[switch] = bool(val)
+            self._emit(switch, val)
+
+    def press(self) -> None:
+        """A button press and release."""
+        self.set(InputSwitch.SW_BUTTON, True)
+        self.set(InputSwitch.SW_BUTTON, False)
+
+    def set_lid(self, closed: bool) -> None:
+        """Both lid switches and their series combination, as one."""
+        for switch in (InputSwitch.SW_DOOR1, InputSwitch.SW_DOOR2, InputSwitch.SW_DOORS):
+            self.set(switch, closed)
+
+    def _emit(self, switch: InputSwitch, val: bool) -> None:
+        now = time()
+        sec, usec = int(now), int((now % 1) * 1e6)
+        # One write per report, well under PIPE_BUF, so a reader never gets
+        # half of one.
+        os.write(self._fd, _EVENT.pack(sec, usec, EventCode.EV_SW, switch, int(bool(val))) +
+                 _EVENT.pack(sec, usec, EventCode.EV_SYN, SynCode.SYN_REPORT, 0))
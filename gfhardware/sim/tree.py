@@ -0,0 +1,123 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+SPDX-License-Identifier:    MIT
+
+The simulated /sys/glowforge tree: plain files under a root of the caller's
+choosing, one per attribute gfhardware touches.
+
+Two kinds of attribute live here. The ones the driver owns (the state, the
+position, the ring's counters) are written only by the simulator, always as
+one fixed-width write in place, so a reader never sees one half done. The
+ones the host writes (settings and commands) are left to the host; the
+simulator reads them, and takes a command by emptying its file.
+"""
+import os
+import struct
+
+# The driver's answers to a reader, as they are when the module loads.
+DRIVER_ATTRS = {
+    'cnc/state': 'disabled',
+    'cnc/faults': '0',
+    'cnc/free': '0',
+    'cnc/max_backtrack': '0',
+    'cnc/underruns': '0',
+    'head/hall_sensor': '0',
+    'head/air_assist_tach': '0',
+    'head/purge_air_current': '0',
+    'thermal/tach_exhaust': '0',
+    'thermal/tach_intake_1': '0',
+    'thermal/tach_intake_2': '0',
+    # About 25 C on the coolant sensors' divider; the rest are raw counts in
+    # range for their conversions.
+    'pic/water_temp_1': '666',
+    'pic/water_temp_2': '666',
+    'pic/pwr_temp': '500',
+    'pic/tec_temp': '500',
+}
+
+# Settings the host writes and reads back, with the values a reset leaves.
+HOST_ATTRS = {
+    'cnc/ignored_faults': '0',
+    'cnc/laser_latch': '1',
+    'cnc/motor_lock': '0',
+    'cnc/step_freq': '10000',
+    'cnc/streaming': '0',
+    'cnc/x_decay': '1',
+    'cnc/y_decay': '1',
+    'cnc/x_mode': '8',
+    'cnc/y_mode': '8',
+    'pic/x_step_current': '33',
+    'pic/y_step_current': '33',
+    'pic/lid_led': '0',
+    'head/z_enable': '1',
+    'head/z_current': '0',
+    'head/z_mode': '2',
+    'head/measure_laser': '0',
+    'head/uv_led': '0',
+    'head/white_led': '0',
+    'head/air_assist_pwm': '0',
+    'head/purge_air': '0',
+    'thermal/exhaust_pwm': '0',
+    'thermal/intake_pwm': '0',
+    'thermal/heater_pwm': '0',
+    'thermal/tec_on': '0',
+    'thermal/water_pump_on': '0',
+}
+
+# Attributes a write acts on rather than stores.
+COMMANDS = ('run', 'stop', 'halt', 'enable', 'disable', 'resume', 'z_step')
+
+HEAD_INFO = 'hw_id=0x1\nserial=1\nversion=0x1\nr5=0\nr6=0\n'
+
+# Wide enough for any value the driver side writes; padded with spaces, which
+# every reader strips.
+VALUE_WIDTH = 15
+
+POSITION = struct.Struct('<iiiII')
+
+
+def sdma_context_text() -> str:
+    """A zeroed context dump, laid out where cnc.sdma_context slices it."""
+    def line(width, fields):
+        out = [' '] * width
+        for at, text in fields:
+            out[at:at + len(text)] = text
+        return ''.join(out)
+    regs = (('r0', 'r1', 'r2', 'r3', 'r4', 'r5'),
+            ('r6', 'r7', 'mda', 'msa', 'ms', 'md'),
+            ('pda', 'psa', 'ps', 'pd', 'ca', 'cs'),
+            ('dda', 'dsa', 'ds', 'dd', 'sc0', 'sc1'),
+            ('sc2', 'sc3', 'sc4', 'sc5', 'sc6', 'sc7'))
+    lines = [
+        line(34, [(0, 'pc=0000'), (8, 'rpc=0000'), (17, 'spc=0000'), (26, 'epc=0000')]),
+        line(25, [(7, 't=0'), (11, 'sf=0'), (16, 'df=0'), (21, 'lm=0')]),
+    ]
+    for names in regs:
+        lines.append(line(77, [(4 + 13 * i - len(n) - 1, n + '=' + '0' * 8)
+                               for i, n in enumerate(names)]))
+    return '\n'.join(lines) + '\n'
+
+
+def put_value(fd: int, value) -> None:
+    """Write a driver-owned value in place, in one write."""
+    os.pwrite(fd, ('%-*s\n' % (VALUE_WIDTH, value)).encode(), 0)
+
+
+def build(base: str) -> None:
+    """Create the tree under ``base`` (the relocated SYSFS_GF_BASE)."""
+    def create(rel, data: bytes):
+        path = os.path.join(base, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+    for rel, value in DRIVER_ATTRS.items():
+        create(rel, ('%-*s\n' % (VALUE_WIDTH, value)).encode())
+    for rel, value in HOST_ATTRS.items():
+        create(rel, (value + '\n').encode())
+    for name in COMMANDS:
+        create('cnc/' + name, b'')
+    create('cnc/position', POSITION.pack(0, 0, 0, 0, 0))
+    create('cnc/sdma_context', sdma_context_text().encode())
+    create('head/info', HEAD_INFO.encode())
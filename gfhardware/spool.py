@@ -0,0 +1,276 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+SPDX-License-Identifier:    MIT
+
+A job's program, decompressed once into a file mapped into memory.
+
+Fed straight from the download, a job's program exists only as it is
+decompressed, a chunk at a time, and is gone once written. Spooled, it is
+decompressed once into an unlinked file (on tmpfs, or on the eMMC where
+configured) and the feeder writes to the device from slices of the mapping:
+the page cache holds it rather than the heap, nothing is copied on the way to
+the ring, and any byte of it can be read again, from any offset.
+"""
+import logging
+import mmap
+import os
+import tempfile
+import threading
+
+from gfhardware._common import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+SPOOL_DIR = '/tmp'
+
+# Room past the declared length for a job that runs long: more than this and
+# the job is refused rather than cut short.
+SPOOL_SLACK = 1024 * 1024
+
+# Bytes asked of the source per read while filling.
+FILL_CHUNK = 256 * 1024
+
+
+class JobSpool(object):
+    """
+    A job source that spools ``source`` and reads back from the mapping.
+
+    The file is made, and with a declared length (``source.program_size``)
+    sized and mapped, when the spool is; start() fills it on a thread of its
+    own, and a read waits for the fill to get ahead of it. With the length
+    declared, the fill decompresses straight into the mapping where the
+    source can readinto(). Without one, it appends to the file, which is
+    mapped once the whole program is in.
+
+    read() returns memoryview slices of the mapping, not copies; seek() and
+    tell() move about in what is there. Until a file of unknown length is
+    mapped, a read is a copy from the file instead. A fill that fails is
+    raised by the read that reaches it.
+
+    With ``name``, the file is made under that name in ``directory`` rather
+    than with none. close() removes it, so it outlives only a process that
+    dies holding it, and reopen() is how the next one reads it back.
+
+    close() stops the fill and closes the source, which breaks off a read
+    stalled on the download. A fill that still has not stopped after
+    ``timeout`` is left to finish on its own. The spool's file and mapping
+    stay open for it, and it closes them when it ends.
+    """
+
+    def __init__(self, source, directory: str = SPOOL_DIR, chunk: int = FILL_CHUNK,
+                 name: str = None):
+        self.program_size = getattr(source, 'program_size', None)
+        self.filled = 0
+        self.error = None
+        self._source = source
+        self._chunk = chunk
+        self._pos = 0
+        self._map = None
+        self._view = memoryview(b'')
+        self._done = False
+        self._abandoned = False
+        self._halt = threading.Event()
+        self._cond = threading.Condition()
+        self._thread = None
+        self.path = os.path.join(directory, name) if name is not None else None
+        if self.path is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        else:
+            self._fd = _unlinked_file(directory)
+        if self.program_size is not None:
+            try:
+                size = self.program_size + SPOOL_SLACK
+                os.ftruncate(self._fd, size)
+                self._map = mmap.mmap(self._fd, size)
+                self._view = memoryview(self._map)
+            except BaseException:
+                self.close()
+                raise
+
+    @classmethod
+    def reopen(cls, path: str, length: int):
+        """The whole program, ``length`` bytes of it, from a named spool an
+        earlier process filled."""
+        spool = cls.__new__(cls)
+        spool.program_size = length
+        spool.filled = length
+        spool.error = None
+        spool.path = path
+        spool._source = None
+        spool._chunk = FILL_CHUNK
+        spool._pos = 0
+        spool._done = True
+        spool._abandoned = False
+        spool._halt = threading.Event()
+        spool._cond = threading.Condition()
+        spool._thread = None
+        spool._fd = os.open(path, os.O_RDWR)
+        try:
+            if os.fstat(spool._fd).st_size < length:
+                raise ValueError('%s is shorter than the %d bytes of its program' % (path, length))
+            spool._map = mmap.mmap(spool._fd, length) if length else None
+            spool._view = memoryview(spool._map) if length else memoryview(b'')
+        except BaseException:
+            os.close(spool._fd)
+            raise
+        return spool
+
+    def start(self) -> None:
+        fill = self._fill_map if self.program_size is not None else self._fill_file
+        self._thread = threading.Thread(target=fill, name='job-spool', daemon=True)
+        self._thread.start()
+
+    @property
+    def done(self) -> bool:
+        """True once the whole program is in the spool."""
+        return self._done
+
+    def read(self, count: int) -> memoryview:
+        """Up to ``count`` bytes from the current offset, as a view of the
+        mapping; empty at the end of the program."""
+        with self._cond:
+            while self.filled < self._pos + count and not self._done and self.error is None:
+                self._cond.wait()
+            if self.error is not None:
+                raise self.error
+            end = min(self._pos + count, self.filled)
+            if self._map is None and end > self._pos:
+                out = memoryview(os.pread(self._fd, end - self._pos, self._pos))
+            else:
+                out = self._view[self._pos:end]
+            self._pos = end
+            return out
+
+    def seek(self, offset: int) -> int:
+        """Move to ``offset`` bytes into the program."""
+        if offset < 0:
+            raise ValueError('negative spool offset')
+        with self._cond:
+            self._pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self, timeout: float = 5.0) -> None:
+        self._halt.set()
+        source, self._source = self._source, None
+        close = getattr(source, 'close', None)
+        if close is not None:
+            close()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        with self._cond:
+            if not self._done:
+                # The fill is still in a read: what it reads into has to be
+                # there when it comes back, so it closes the spool itself.
+                logger.error('job spool fill did not stop')
+                self._abandoned = True
+                return
+        self._release()
+
+    def _release(self) -> None:
+        self._view.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # A slice is still out there; the mapping goes with it.
+                logger.debug('job spool closed with a slice still held')
+            self._map = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _fill_map(self) -> None:
+        readinto = getattr(self._source, 'readinto', None)
+        size = len(self._view)
+        try:
+            while not self._halt.is_set():
+                at = self.filled
+                if at >= size:
+                    if self._source.read(1):
+                        raise ValueError('job is over %d bytes longer than it declared'
+                                         % SPOOL_SLACK)
+                    break
+                want = min(self._chunk, size - at)
+                if readinto is not None:
+                    n = readinto(self._view[at:at + want])
+                else:
+                    data = self._source.read(want)
+                    n = len(data)
+                    self._view[at:at + n] = data
+                if not n:
+                    break
+                with self._cond:
+                    self.filled = at + n
+                    self._cond.notify_all()
+        except Exception as e:
+            self._failed(e)
+        self._finished()
+
+    def _fill_file(self) -> None:
+        try:
+            while not self._halt.is_set():
+                data = self._source.read(self._chunk)
+                if not data:
+                    break
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(self._fd, view):]
+                with self._cond:
+                    self.filled += len(data)
+                    self._cond.notify_all()
+            if self.filled and not self._halt.is_set():
+                mapping = mmap.mmap(self._fd, self.filled)
+                with self._cond:
+                    self._map = mapping
+                    self._view = memoryview(mapping)
+        except Exception as e:
+            self._failed(e)
+        self._finished()
+
+    def _finished(self) -> None:
+        with self._cond:
+            self._done = True
+            self._cond.notify_all()
+            abandoned = self._abandoned
+        if abandoned:
+            self._release()
+
+    def _failed(self, e: Exception) -> None:
+        if self._halt.is_set():
+            # A read broken off by close() is how the fill was stopped.
+            logger.debug('job spool fill stopped after %d bytes: %s', self.filled, e)
+        else:
+            logger.error('job spool fill failed after %d bytes: %s', self.filled, e)
+        self.error = e
+
+
+def _unlinked_file(directory: str) -> int:
+    """A read-write file in ``directory`` with no name, gone once closed."""
+    try:
+        return os.open(directory, os.O_TMPFILE | os.O_RDWR, 0o600)
+    except (AttributeError, OSError):
+        # No O_TMPFILE here, or not on this filesystem: make one and unlink it.
+        fd, path = tempfile.mkstemp(prefix='gf-spool-', dir=directory)
+        os.unlink(path)
+        return fd
+
+
+__all__ = ['JobSpool']
@@ -161,7 +161,7 @@ static PyObject * ioctl_EVIOCG_bits(PyObject *self, PyObject *args)
     }
 
     if (ret == -1)
-        return NULL;
+        return PyErr_SetFromErrno(PyExc_IOError);
 
     PyObject* res = PyList_New(0);
     for (int i=0; i<max; i++) {
@@ -8,6 +8,7 @@ Based on python-evdev
 Copyright (c) 2012-2016 Georgi Valkov. All rights reserved.
 
 """
+import errno
 import logging
 import os
 import select
@@ -26,8 +27,12 @@ logger = logging.getLogger(LOGGER_NAME)
 class InputDevice(object):
     """
     A linux input device from which input events can be read.
+
+    Something that delivers input events but does not answer the evdev
+    ioctls (a pipe standing in for the device) still reports switch states:
+    the ones this object has read events for.
     """
-    __slots__ = ('path', 'fd')
+    __slots__ = ('path', 'fd', '_seen')
 
     def __init__(self, dev):
         """
@@ -39,6 +44,7 @@ class InputDevice(object):
         self.path = dev if not hasattr(dev, '__fspath__') else dev.__fspath__()
         fd = os.open(dev, os.O_RDONLY | os.O_NONBLOCK)
         self.fd = fd
+        self._seen = {}
 
     def __del__(self):
         if hasattr(self, 'fd') and self.fd is not None:
@@ -84,6 +90,7 @@ class InputDevice(object):
             if e_type == 5:
                 code = InputSwitch(code)
                 val = True if int(val) == 1 else False
+                self._seen[code] = val
             elif e_type == 0:
                 code = SynCode(code)
             yield SwitchEvent(sec, usec, e_type, code, val)
@@ -93,7 +100,14 @@ class InputDevice(object):
         Return current switch states.
         i.e. {<InputSwitch.DOOR1: 0>: True, <InputSwitch.DOOR2: 1>: False, ...}
         """
-        active_switches = evdev.ioctl_EVIOCG_bits(self.fd, EventCode.EV_SW.value)
+        try:
+            active_switches = evdev.ioctl_EVIOCG_bits(self.fd, EventCode.EV_SW.value)
+        except OSError as e:
+            if e.errno != errno.ENOTTY:
+                raise
+            # Not an evdev node. A switch never reported reads as off, which
+            # for the lid is open: the safe answer.
+            return {switch: self._seen.get(switch, False) for switch in InputSwitch}
         switch_states = {}
         for switch in InputSwitch:
             switch_states[switch] = True if switch.value in active_switches else False
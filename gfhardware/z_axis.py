@@ -31,12 +31,12 @@ class ZAxis(object):
     @staticmethod
     def disable() -> None:
         logger.debug('setting z_enable: 1')
-        write_file(SYSFS_GF_BASE + 'head/z_enable', '1')
+        write_attr(SYSFS_GF_BASE + 'head/z_enable', '1')
 
     @staticmethod
     def enable() -> None:
         logger.debug('setting z_enable: 0')
-        write_file(SYSFS_GF_BASE + 'head/z_enable', '0')
+        write_attr(SYSFS_GF_BASE + 'head/z_enable', '0')
 
     @staticmethod
     def home() -> list:
@@ -59,13 +59,14 @@ class ZAxis(object):
 
     @staticmethod
     def _home_sense() -> bool:
-        home = True if int(read_file(SYSFS_GF_BASE + 'head/hall_sensor')) == 0 else False
+        home = True if int(read_attr(SYSFS_GF_BASE + 'head/hall_sensor')) == 0 else False
         logger.debug('read z_home as: %s' % home)
         return home
 
     @staticmethod
     def reset() -> None:
         logger.info('resetting z')
+        invalidate_shadow(SYSFS_GF_BASE + 'head/z_')
         ZAxis.configure(enabled=False, current=ZCur.LOW, mode=Microstep.HALF)
 
     @staticmethod
@@ -75,7 +76,7 @@ class ZAxis(object):
         elif isinstance(cur, int):
             cur = str(cur)
         logger.debug('setting z_current to: %s' % cur)
-        write_file(SYSFS_GF_BASE + 'head/z_current', cur)
+        write_attr(SYSFS_GF_BASE + 'head/z_current', cur, shadow=True)
 
     @staticmethod
     def set_mode(mode: Union[Microstep, str, int]) -> None:
@@ -87,7 +88,7 @@ class ZAxis(object):
             raise ValueError('Z mode can only be 1 or 2')
         mode = '0' if mode == 1 else '1'
         logger.debug('setting z_mode to: %s' % mode)
-        write_file(SYSFS_GF_BASE + 'head/z_mode', mode)
+        write_attr(SYSFS_GF_BASE + 'head/z_mode', mode, shadow=True)
 
     @staticmethod
     def set_mode_from_puls(mode: int) -> None:
@@ -96,7 +97,7 @@ class ZAxis(object):
 
     @staticmethod
     def step(direction: Dir = Dir.Pos, step_delay: float = .180) -> None:
-        write_file(SYSFS_GF_BASE + 'cnc/z_step', str(direction.value))
+        write_attr(SYSFS_GF_BASE + 'cnc/z_step', str(direction.value))
         sleep(step_delay)
 
     @staticmethod
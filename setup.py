@@ -13,7 +13,7 @@ setup(
     license='MIT AND LGPL-2.1-or-later',
     long_description=open('README.md').read(),
     keywords='Glowforge OpenGlow OV5648 imx6',
-    packages=['gfhardware', 'gfhardware.input', 'gfhardware.utils'],
+    packages=['gfhardware', 'gfhardware.input', 'gfhardware.sim', 'gfhardware.utils'],
     ext_modules=[
         Extension(
             name='gfhardware._cam',
@@ -14,11 +14,15 @@ device the feeder depends on.
 Run:  PYTHONPATH=.:../Glowforge-Utilities python3 -m unittest tests.test_feeder
 """
 import errno
+import io
 import os
+import shutil
 import sys
+import tempfile
 import time
 import types
 import unittest
+from unittest import mock
 
 HERE = os.path.dirname(os.path.abspath(__file__))
 ROOT = os.path.dirname(HERE)
@@ -51,7 +55,12 @@ sys.modules['gfhardware.cnc'] = _cnc_mod
 from gfutilities.puls import decode_all_steps                    # noqa: E402
 from gfutilities.puls.source import PulseSource                  # noqa: E402
 import gfhardware.feeder as feeder_mod                           # noqa: E402
-from gfhardware.feeder import PulseFeeder                        # noqa: E402
+import gfhardware.accounting as accounting_mod                   # noqa: E402
+from gfhardware.accounting import (InlineAccountant, KnownAccountant,  # noqa: E402
+                                   ProcessAccountant, StepDecoder, StreamingAccountant)
+from gfhardware.feeder import ProcessFeeder, PulseFeeder         # noqa: E402
+from gfhardware.journal import FeedJournal                       # noqa: E402
+from gfhardware.spool import JobSpool                            # noqa: E402
 
 CNC = _cnc_mod.cnc
 
@@ -100,6 +109,20 @@ class _Declaring:
         return out
 
 
+class _ShortReads:
+    """A job source that never hands back more than ``most`` bytes a read."""
+
+    def __init__(self, data: bytes, most: int):
+        self._data = data
+        self._at = 0
+        self._most = most
+
+    def read(self, count: int) -> bytes:
+        out = self._data[self._at:self._at + min(count, self._most)]
+        self._at += len(out)
+        return out
+
+
 def _wait(pred, timeout=5.0):
     deadline = time.monotonic() + timeout
     while time.monotonic() < deadline:
@@ -172,6 +195,23 @@ class FeederTest(unittest.TestCase):
         self.assertEqual(feeder.written, 4096)
         feeder.stop()
 
+    def test_metrics_say_where_the_time_went(self):
+        payload = bytes(200000)
+        feeder, ring = self._feeder(payload, capacity=4096)
+        feeder.start()
+        self.assertTrue(feeder.wait_primed(timeout=5))
+        time.sleep(0.1)                                  # sit against a full ring
+        m = feeder.metrics()
+        self.assertEqual(m['written'], 4096)
+        self.assertGreater(m['refusals'], 0)
+        self.assertGreater(m['blocked_s'], 0.05)
+        self.assertGreater(m['bytes_per_s']['job'], 0)
+        self.assertEqual(sorted(m['bytes_per_s']),
+                         sorted(['%ds' % w for w in feeder_mod.RATE_WINDOWS_S] + ['job']))
+        with self.assertLogs(feeder_mod.LOGGER_NAME, 'INFO') as logs:
+            feeder.stop()
+        self.assertEqual(len([r for r in logs.output if 'feed metrics' in r]), 1)
+
     # -- how long the job is ---------------------------------------------
     def test_the_job_total_is_the_job_before_the_feed_finishes(self):
         # What a progress report divides by, and the reason it can be
@@ -211,6 +251,275 @@ class FeederTest(unittest.TestCase):
         self.assertTrue([ln for ln in caught.output
                          if 'declared 9999' in ln and '4096' in ln], caught.output)
 
+    def test_a_ring_with_room_for_part_of_a_chunk_takes_that_part(self):
+        payload = bytes(range(256)) * 64                 # 16 KiB
+        saved = feeder_mod.PARTIAL_MIN
+        feeder_mod.PARTIAL_MIN = 256
+        try:
+            feeder, ring = self._feeder(payload, capacity=3000, chunk=8192)
+            feeder.start()
+            self.assertTrue(feeder.wait_primed(timeout=5))
+            # Filled to within the smallest piece, not left at zero because
+            # a whole chunk would not fit.
+            self.assertGreater(ring.in_ring, 3000 - 256)
+            self.assertEqual(bytes(ring.accepted), payload[:ring.in_ring])
+            self.assertTrue(_wait(lambda: ring.drain(3000) or feeder.finished))
+            feeder.stop()
+        finally:
+            feeder_mod.PARTIAL_MIN = saved
+        self.assertEqual(bytes(ring.accepted), payload)
+        self.assertEqual(feeder.written, len(payload))
+
+    def test_a_refusal_is_an_offer_that_waits_not_each_smaller_try(self):
+        payload = bytes(range(256)) * 256                # 64 KiB
+        saved = feeder_mod.PARTIAL_MIN
+        feeder_mod.PARTIAL_MIN = 256
+        try:
+            feeder, ring = self._feeder(payload, capacity=3000, chunk=8192)
+            waits = []
+            wait_for_room = feeder._wait_for_room
+            feeder._wait_for_room = lambda: waits.append(1) or wait_for_room()
+            feeder.start()
+            self.assertTrue(feeder.wait_primed(timeout=5))
+            time.sleep(0.1)                              # sit against a full ring
+            feeder.stop()
+        finally:
+            feeder_mod.PARTIAL_MIN = saved
+        m = feeder.metrics()
+        self.assertEqual(m['refusals'], len(waits))
+        # Each wait was reached by halving 8 KiB down to the smallest piece.
+        self.assertGreaterEqual(m['partial_probes'], 5 * m['refusals'])
+
+    def test_short_reads_are_gathered_into_one_write(self):
+        payload = os.urandom(50000)
+        source = _ShortReads(payload, 1000)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        calls = []
+        real = os.writev
+
+        def writev(fd, views):
+            calls.append(len(views))
+            return real(fd, views)
+        with open(path, 'wb', buffering=0) as dev, \
+                mock.patch.object(feeder_mod.os, 'writev', writev):
+            feeder = PulseFeeder(source, dev, chunk=8192, retry_s=0.01)
+            feeder.start()
+            self.assertTrue(_wait(lambda: feeder.finished))
+            feeder.stop()
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), payload)
+        self.assertEqual(len(calls), 6)                 # 50 pieces, nine to a batch
+        self.assertEqual(feeder.stats, decode_all_steps(payload))
+
+    def test_a_gathered_write_taken_in_part_resumes_where_it_stopped(self):
+        payload = os.urandom(30000)
+        source = _ShortReads(payload, 700)
+        accepted = bytearray()
+        refuse = [False]
+
+        def writev(fd, views):
+            # Every other offer is refused; the rest take 1500 bytes at most,
+            # which ends most of them part of the way into a piece.
+            refuse[0] = not refuse[0]
+            if refuse[0]:
+                raise OSError(errno.ENOMEM, 'Cannot allocate memory')
+            data = b''.join(bytes(v) for v in views)[:1500]
+            accepted.extend(data)
+            return len(data)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        with open(path, 'wb', buffering=0) as dev, \
+                mock.patch.object(feeder_mod.os, 'writev', writev):
+            feeder = PulseFeeder(source, dev, chunk=8192, retry_s=0.01)
+            feeder._poll = None
+            feeder.start()
+            self.assertTrue(_wait(lambda: feeder.finished, timeout=20))
+            feeder.stop()
+        self.assertEqual(bytes(accepted), payload)
+        self.assertEqual(feeder.written, len(payload))
+        self.assertEqual(feeder.stats, decode_all_steps(payload))
+
+    def test_a_device_whose_poll_always_says_writable_is_backed_off_from(self):
+        payload = bytes(20000)
+        r, w = os.pipe()
+        ring = FakeRing(4096)
+        ring.fileno = lambda: w                  # a pipe is always writable
+        try:
+            feeder = PulseFeeder(PulseSource(_puls(payload)), ring, chunk=1024, retry_s=0.01)
+            self.assertIsNotNone(feeder._poll)
+            feeder.start()
+            self.assertTrue(feeder.wait_primed(timeout=5))
+            self.assertTrue(_wait(lambda: feeder._poll is None))
+            feeder.stop()
+        finally:
+            os.close(r)
+            os.close(w)
+
+    def test_a_prefetched_job_is_fed_whole_and_in_order(self):
+        payload = os.urandom(50000)
+        ring = FakeRing(8192)
+        feeder = PulseFeeder(io.BytesIO(payload), ring, chunk=1024, retry_s=0.01, prefetch=3)
+        feeder.start()
+        self.assertTrue(feeder.wait_primed(timeout=5))
+        self.assertTrue(_wait(lambda: ring.drain(8192) or feeder.finished))
+        feeder.stop()
+        self.assertEqual(bytes(ring.accepted), payload)
+        self.assertEqual(feeder.stats, decode_all_steps(payload))
+
+    def test_a_spooled_job_is_fed_whole_from_the_mapping(self):
+        payload = os.urandom(50000)
+        ring = FakeRing(8192)
+        with JobSpool(_Declaring(payload, len(payload)), chunk=4096) as spool:
+            spool.start()
+            feeder = PulseFeeder(spool, ring, chunk=1024, retry_s=0.01)
+            feeder.start()
+            self.assertTrue(feeder.wait_primed(timeout=5))
+            self.assertTrue(_wait(lambda: ring.drain(8192) or feeder.finished))
+            feeder.stop()
+        self.assertEqual(bytes(ring.accepted), payload)
+        self.assertEqual(feeder.stats, decode_all_steps(payload))
+
+    def test_a_source_that_fails_ahead_of_the_writes_stops_the_feed(self):
+        class Failing:
+            def __init__(self):
+                self.reads = 0
+
+            def read(self, count):
+                self.reads += 1
+                if self.reads > 3:
+                    raise IOError('connection reset')
+                return bytes(count)
+
+        ring = FakeRing(1 << 20)
+        feeder = PulseFeeder(Failing(), ring, chunk=1024, retry_s=0.01, prefetch=2)
+        feeder.start()
+        self.assertTrue(_wait(lambda: feeder.error is not None))
+        feeder.stop()
+        self.assertEqual(len(ring.accepted), 3 * 1024)
+        self.assertFalse(feeder.finished)
+
+    # -- the feed in a process of its own --------------------------------
+    def test_a_feed_in_a_child_process_delivers_the_same_job(self):
+        payload = os.urandom(100000)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        with open(path, 'wb', buffering=0) as dev:
+            feeder = ProcessFeeder(_Declaring(payload, len(payload)), dev, chunk=8192,
+                                   retry_s=0.01, slots=3)
+            feeder.start()
+            self.assertIsNotNone(feeder._proc)
+            self.assertTrue(feeder.wait_primed(timeout=10))
+            self.assertTrue(_wait(lambda: feeder.finished, timeout=10))
+            self.assertTrue(feeder.settle(timeout=10))
+            feeder.stop()
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), payload)
+        self.assertEqual(feeder.written, len(payload))
+        self.assertEqual(feeder.job_total, len(payload))
+        self.assertEqual(feeder.stats, decode_all_steps(payload))
+        reference = accounting_mod.PositionIndex()
+        StepDecoder().feed(payload, reference)
+        self.assertEqual(feeder.index.entries(), reference.entries())
+        self.assertEqual(feeder.metrics()['written'], len(payload))
+        self.assertIsNone(feeder.error)
+
+    def test_the_feeding_process_holds_the_device_and_nothing_else_of_ours(self):
+        held = tempfile.NamedTemporaryFile()
+        self.addCleanup(held.close)
+        os.set_inheritable(held.fileno(), True)
+        r, w = os.pipe()
+        os.set_blocking(w, False)
+        self.addCleanup(os.close, r)
+        with open(w, 'wb', buffering=0) as dev:
+            feeder = ProcessFeeder(io.BytesIO(bytes(400000)), dev, chunk=8192, retry_s=0.01)
+            feeder.start()
+            self.assertTrue(feeder.wait_primed(timeout=10))
+            pid = feeder._proc.pid
+            with open('/proc/%d/cmdline' % pid, 'rb') as f:
+                self.assertIn(b'_child.py', f.read())        # execed, not a fork
+            proc_fd = '/proc/%d/fd' % pid
+            links = [os.readlink(os.path.join(proc_fd, fd)) for fd in os.listdir(proc_fd)]
+            feeder.stop()
+        self.assertNotIn(held.name, links)
+        self.assertIn(os.readlink('/proc/self/fd/%d' % r), links)   # the device
+        # stdio, the device, three pipes and the slots.
+        self.assertLessEqual(len(links), 8, links)
+
+    def test_a_feed_in_a_child_process_waits_on_the_ring_and_stops_when_told(self):
+        payload = bytes(400000)
+        r, w = os.pipe()
+        os.set_blocking(w, False)                # a full pipe refuses, as a full ring does
+        self.addCleanup(os.close, r)
+        with open(w, 'wb', buffering=0) as dev:
+            feeder = ProcessFeeder(io.BytesIO(payload), dev, chunk=8192, retry_s=0.01)
+            feeder.start()
+            self.assertTrue(feeder.wait_primed(timeout=10))
+            feeder.declare_live_feed()
+            got = os.read(r, 16384)
+            self.assertTrue(_wait(lambda: feeder.written > 0))
+            self.assertFalse(feeder.finished)
+            feeder.stop()
+            self.assertIsNone(feeder._proc)
+        self.assertEqual(CNC.streaming_writes, [1, 0])
+        self.assertIsNone(feeder.error)
+        self.assertEqual(got, bytes(len(got)))
+
+    # -- picking a feed back up ------------------------------------------
+    def test_a_journaled_feed_is_picked_up_where_the_ring_has_it(self):
+        payload = os.urandom(100000)
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        journal = FeedJournal(os.path.join(tmp, 'feed.journal'), interval=0)
+        journal.begin({'job': 'abc'})
+        ring = FakeRing(30000)
+        feeder = PulseFeeder(io.BytesIO(payload), ring, chunk=1024, retry_s=0.01, journal=journal)
+        feeder.start()
+        self.assertTrue(feeder.wait_primed(timeout=5))
+        feeder.stop()                           # the daemon dies here
+        record = FeedJournal(journal.path).load()
+        state = record['accounting']
+        self.assertLessEqual(record['written'], len(ring.accepted))
+        self.assertLessEqual(state['accounted'], record['written'])
+        # The next daemon: the ring says how far the feed got, and the steps
+        # after the journaled accounting are counted again.
+        offset = len(ring.accepted)
+        accountant = StreamingAccountant()
+        accountant.resume(state)
+        accountant.add(memoryview(payload)[state['accounted']:offset])
+        source = io.BytesIO(payload)
+        source.seek(offset)
+        rest = FakeRing(1 << 20)
+        feeder = PulseFeeder(source, rest, chunk=1024, retry_s=0.01, accountant=accountant,
+                             journal=journal, offset=offset)
+        feeder.start()
+        self.assertTrue(_wait(lambda: feeder.finished))
+        feeder.stop()
+        self.assertEqual(bytes(ring.accepted) + bytes(rest.accepted), payload)
+        self.assertEqual(feeder.written, len(payload))
+        self.assertEqual(feeder.stats, decode_all_steps(payload))
+        reference = accounting_mod.PositionIndex()
+        StepDecoder().feed(payload, reference)
+        self.assertEqual(feeder.index.entries(), reference.entries())
+        self.assertEqual(journal.load()['written'], len(payload))
+
+    def test_every_engine_counts_on_from_carried_totals(self):
+        payload = os.urandom(40000)
+        engines = [e for e in accounting_mod.ENGINES
+                   if e != 'numpy' or accounting_mod.numpy is not None]
+        for engine in engines:
+            first = StepDecoder(engine)
+            first.feed(payload[:15000])
+            decoder = StepDecoder(engine)
+            decoder.carry(first.stats)
+            self.assertEqual(decoder.stats, first.stats, engine)
+            decoder.feed(payload[15000:])
+            for key, val in decode_all_steps(payload).items():
+                self.assertAlmostEqual(decoder.stats[key], val, msg='%s %s' % (engine, key))
+
     # -- accounting ------------------------------------------------------
     def test_step_totals_match_decoding_the_whole_job(self):
         payload = bytes(range(256)) * 40
@@ -222,6 +531,186 @@ class FeederTest(unittest.TestCase):
         feeder.stop()
         self.assertEqual(feeder.stats, decode_all_steps(payload))
 
+    def test_a_source_that_fills_buffers_is_fed_through_the_pool(self):
+        # Each chunk reads into a buffer that has already been through the
+        # ring and the accounting, so a long job reuses the same few.
+        payload = bytes(range(256)) * 64
+        ring = FakeRing(1 << 20)
+        feeder = PulseFeeder(io.BytesIO(payload), ring, chunk=1024, retry_s=0.01)
+        feeder.start()
+        self.assertTrue(_wait(lambda: feeder.finished))
+        self.assertTrue(_wait(lambda: not feeder._accountant.pending))
+        feeder.stop()
+        self.assertEqual(bytes(ring.accepted), payload)
+        self.assertEqual(feeder.stats, decode_all_steps(payload))
+        self.assertTrue(0 < len(feeder._pool._free) <= feeder_mod.POOL_KEEP)
+
+    def test_accounting_in_a_child_process_totals_the_same(self):
+        payload = bytes(range(256)) * 200
+        ring = FakeRing(1 << 20)
+        feeder = PulseFeeder(PulseSource(_puls(payload)), ring, chunk=1024, retry_s=0.01,
+                             accountant=ProcessAccountant(slots=2))
+        feeder.start()
+        self.assertTrue(_wait(lambda: feeder.finished))
+        self.assertTrue(feeder.settle(timeout=10))
+        feeder.stop()
+        self.assertEqual(feeder.stats, decode_all_steps(payload))
+
+    def test_every_accountant_indexes_where_the_program_has_the_head(self):
+        payload = os.urandom(40000)
+        for accountant in (None, InlineAccountant(), ProcessAccountant(slots=2)):
+            ring = FakeRing(1 << 20)
+            feeder = PulseFeeder(io.BytesIO(payload), ring, chunk=1000, retry_s=0.01,
+                                 accountant=accountant)
+            feeder.index.stride = 4096
+            feeder.start()
+            self.assertTrue(_wait(lambda: feeder.finished))
+            self.assertTrue(feeder.settle(timeout=10))
+            feeder.stop()
+            self.assertEqual(len(feeder.index), 1 + len(payload) // 4096)
+            for offset in (0, 4095, 4096, 20000, len(payload)):
+                at, x, y, z, laser = feeder.position_at(offset)
+                self.assertEqual(at, offset - offset % 4096)
+                want = decode_all_steps(payload[:at]) if at else None
+                self.assertEqual((x, y, z), (want['XEND'], want['YEND'], want['ZEND'])
+                                 if want else (0, 0, 0))
+                motion = [b for b in payload[:at] if not b & 0x80]
+                self.assertEqual(laser, bool(motion and motion[-1] & 0x10))
+
+    def test_every_engine_gives_the_index_the_same_entries(self):
+        # The index takes each entry from the decoding's own totals, however
+        # the decoder counts and however the program is cut.
+        payload = os.urandom(40000) + bytes([0x01, 0x0D, 0x91, 0x91]) * 2000
+        engines = [e for e in accounting_mod.ENGINES
+                   if e != 'numpy' or accounting_mod.numpy is not None]
+        expected = None
+        for engine in engines:
+            for size in (1000, 4096, len(payload)):
+                index = accounting_mod.PositionIndex(stride=4096)
+                decoder = StepDecoder(engine)
+                for at in range(0, len(payload), size):
+                    decoder.feed(memoryview(payload)[at:at + size], index)
+                self.assertEqual(decoder.bytes, len(payload))
+                if expected is None:
+                    expected = index.entries()
+                    self.assertEqual(len(expected), 1 + len(payload) // 4096)
+                self.assertEqual(index.entries(), expected, '%s %d' % (engine, size))
+
+    def test_a_job_accounted_before_is_not_counted_again(self):
+        payload = os.urandom(20000)
+        known = decode_all_steps(payload)
+        accountant = KnownAccountant(known, [(0, 0, 0, 0, 0), (16384, 5, 6, 7, 1)], len(payload))
+        ring = FakeRing(1 << 20)
+        feeder = PulseFeeder(io.BytesIO(payload), ring, chunk=1000, retry_s=0.01,
+                             accountant=accountant)
+        feeder.start()
+        self.assertTrue(_wait(lambda: feeder.finished))
+        self.assertTrue(feeder.settle(timeout=10))
+        feeder.stop()
+        self.assertEqual(bytes(ring.accepted), payload)
+        self.assertIs(feeder.stats, known)
+        self.assertEqual(feeder.position_at(19999), (16384, 5, 6, 7, True))
+
+    def test_the_accounting_process_holds_nothing_of_this_ones(self):
+        # A fork would carry every descriptor and object this process has
+        # into the child; a fresh one has its pipes and its mapping only.
+        held = tempfile.NamedTemporaryFile()
+        self.addCleanup(held.close)
+        os.set_inheritable(held.fileno(), True)
+        accountant = ProcessAccountant(slots=2)
+        accountant.start(1024)
+        self.addCleanup(accountant.close)
+        accountant.add(memoryview(bytes(range(256)) * 4))
+        # Once a chunk has come back the child is up, and waiting on the next.
+        self.assertTrue(_wait(lambda: accountant.stats is not None and not accountant.pending))
+        with open('/proc/%d/cmdline' % accountant._proc.pid, 'rb') as f:
+            self.assertIn(b'_child.py', f.read())            # execed, not a fork
+        proc_fd = '/proc/%d/fd' % accountant._proc.pid
+        fds = os.listdir(proc_fd)
+        self.assertNotIn(held.name, [os.readlink(os.path.join(proc_fd, fd)) for fd in fds])
+        self.assertLessEqual(len(fds), 6, fds)       # stdio, two pipes, the mapping
+        self.assertTrue(accountant.settle(timeout=10))
+        self.assertEqual(accountant.stats, decode_all_steps(bytes(range(256)) * 4))
+        self.assertTrue(accountant._child_indexed)
+
+    def test_a_lost_accounting_process_falls_back_to_decoding_inline(self):
+        payload = bytes(range(256)) * 40
+        accountant = ProcessAccountant(slots=2)
+        accountant.start(1024)
+        accountant._proc.kill()
+        accountant._proc.join()
+        for at in range(0, len(payload), 1024):
+            accountant.add(memoryview(payload[at:at + 1024]))
+        self.assertTrue(accountant.settle(timeout=10))
+        accountant.close()
+        self.assertIsNone(accountant._proc)
+        self.assertEqual(accountant.stats, decode_all_steps(payload))
+
+    def test_the_streaming_decoder_totals_what_decode_all_steps_does(self):
+        # However the program is cut, the counts carried from chunk to chunk
+        # add up to decoding it whole.
+        payload = bytes(range(256)) * 50 + bytes([0x01, 0x0D, 0x2C, 0x63, 0x91]) * 333
+        for size in (1, 7, 4096, len(payload)):
+            decoder = StepDecoder()
+            for at in range(0, len(payload), size):
+                decoder.feed(memoryview(payload)[at:at + size])
+            self.assertEqual(decoder.stats, decode_all_steps(payload), size)
+            self.assertEqual(decoder.bytes, len(payload))
+
+    def test_every_engine_totals_what_decode_all_steps_does(self):
+        payload = os.urandom(1 << 16) + bytes([0x01, 0x0D, 0x2C, 0x63, 0x91]) * 333
+        engines = [e for e in accounting_mod.ENGINES
+                   if e != 'numpy' or accounting_mod.numpy is not None]
+        for engine in engines:
+            decoder = StepDecoder(engine)
+            self.assertEqual(decoder.engine, engine)
+            for at in range(0, len(payload), 5000):
+                decoder.feed(memoryview(payload)[at:at + 5000])
+            expected = decode_all_steps(payload)
+            if engine == 'reference':
+                # decode_all_steps itself, a chunk at a time: the counts are
+                # exact, the distances a float sum of the chunks' own.
+                for key, val in expected.items():
+                    self.assertAlmostEqual(decoder.stats[key], val, msg=key)
+            else:
+                self.assertEqual(decoder.stats, expected, engine)
+
+    def test_the_engines_count_what_the_chained_accountant_did(self):
+        # The accounting as it was before StepDecoder: decode_all_steps on
+        # each chunk, carrying the totals. Its counts are exact; its lengths
+        # are a float sum of the chunks' own, where a StepDecoder converts
+        # the whole program's counts once.
+        payload = os.urandom(1 << 16) + bytes([0x01, 0x0D, 0x2C, 0x63, 0x91]) * 333
+        chained = None
+        for at in range(0, len(payload), 4096):
+            chained = decode_all_steps(payload[at:at + 4096], chained)
+        lengths = [k for k in chained if k.endswith(('MM', 'IN'))]
+        for engine in [e for e in accounting_mod.ENGINES if accounting_mod._engine_ok(e)]:
+            decoder = StepDecoder(engine)
+            for at in range(0, len(payload), 4096):
+                decoder.feed(memoryview(payload)[at:at + 4096])
+            self.assertEqual(sorted(decoder.stats), sorted(chained), engine)
+            for key, val in chained.items():
+                if key in lengths:
+                    self.assertAlmostEqual(decoder.stats[key], val, msg=(engine, key))
+                else:
+                    self.assertEqual(decoder.stats[key], val, (engine, key))
+
+    @unittest.skipIf(accounting_mod.numpy is not None, 'NumPy is installed')
+    def test_without_numpy_the_next_engine_counts(self):
+        self.assertEqual(StepDecoder('numpy').engine, 'counter')
+
+    def test_a_streamed_job_keeps_nothing_for_later(self):
+        payload = bytes(range(256)) * 64
+        feeder, ring = self._feeder(payload, capacity=4096)
+        feeder.start()
+        self.assertTrue(feeder.wait_primed(timeout=5))
+        self.assertEqual(feeder._accountant.pending, 0)
+        self.assertTrue(_wait(lambda: ring.drain(4096) or feeder.finished))
+        self.assertTrue(feeder.settle(timeout=0))
+        feeder.stop()
+        self.assertEqual(feeder.stats, decode_all_steps(payload))
+
     # -- failures --------------------------------------------------------
     def test_write_error_stops_the_feed_and_is_reported(self):
         payload = bytes(4096)
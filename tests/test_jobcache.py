@@ -0,0 +1,188 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+
+Host tests for the motion cache: a job named by its content and serial lock,
+stored once it has been fed, and read back checked.
+
+Run:  PYTHONPATH=. python3 -m unittest tests.test_jobcache
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+_pkg = types.ModuleType('gfhardware')
+_pkg.__path__ = [os.path.join(ROOT, 'gfhardware')]
+sys.modules['gfhardware'] = _pkg
+
+import gfhardware.jobcache as jobcache_mod                  # noqa: E402
+from gfhardware.jobcache import MotionCache, header_serial   # noqa: E402
+
+
+def _head(serial: int) -> bytes:
+    fields = (b'STfr' + (10000).to_bytes(4, 'little')
+              + b'MCsn' + serial.to_bytes(4, 'little'))
+    return b'\x80GF1' + (8 + len(fields)).to_bytes(4, 'little') + fields
+
+
+class _Response:
+    def __init__(self, headers, body, status=206):
+        self.headers = headers
+        self.status_code = status
+        self._body = body
+
+    def iter_content(self, size):
+        yield self._body[:size]
+
+    def close(self):
+        pass
+
+
+class _Session:
+    def __init__(self, response):
+        self.response = response
+        self.asked = []
+
+    def get(self, url, **kw):
+        self.asked.append(kw.get('headers'))
+        return self.response
+
+
+def _read_all(source, count=1000) -> bytes:
+    out = bytearray()
+    while True:
+        data = source.read(count)
+        if not data:
+            return bytes(out)
+        out += data
+
+
+class MotionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.cache = MotionCache(self.dir, max_bytes=1 << 20)
+
+    def _store(self, key, payload, stats=None, head=None):
+        recording = self.cache.record(io.BytesIO(payload))
+        self.assertEqual(_read_all(recording), payload)
+        return self.cache.put(key, recording, stats or {'header_data': {'MCsn': 7}},
+                              [(0, 0, 0, 0, 0)], head)
+
+    def test_the_serial_lock_is_read_from_the_header(self):
+        self.assertEqual(header_serial(_head(1234) + b'\x01' * 100), 1234)
+        self.assertIsNone(header_serial(b'not a pulse file'))
+
+    def test_a_probe_names_the_job_by_its_tag_and_serial(self):
+        session = _Session(_Response({'ETag': '"abc"'}, _head(7) + bytes(100)))
+        key, head = self.cache.probe(session, 'https://x/job.puls?sig=1')
+        self.assertEqual(session.asked[0], {'Range': 'bytes=0-4095'})
+        self.assertEqual(head, _head(7) + bytes(100))
+        # The same content under another signature is the same job.
+        self.assertEqual(self.cache.probe(session, 'https://x/job.puls?sig=2')[0], key)
+        other = _Session(_Response({'ETag': '"abc"'}, _head(8)))
+        self.assertNotEqual(self.cache.probe(other, 'https://x/job.puls')[0], key)
+
+    def test_a_weak_or_missing_tag_is_not_cached(self):
+        for headers in ({'ETag': 'W/"abc"'}, {}):
+            session = _Session(_Response(headers, _head(7)))
+            self.assertIsNone(self.cache.probe(session, 'https://x/job.puls')[0])
+
+    def test_a_stored_job_reads_back_with_its_stats_and_index(self):
+        payload = os.urandom(20000) + bytes(50000)
+        self.assertTrue(self._store('k1', payload, {'header_data': {}, 'stats': {'XEND': 3}}))
+        stats, source, index = self.cache.get('k1')
+        self.addCleanup(source.close)
+        self.assertEqual(stats['stats'], {'XEND': 3})
+        self.assertEqual(index, [[0, 0, 0, 0, 0]])
+        self.assertEqual(source.program_size, len(payload))
+        self.assertEqual(_read_all(source, 4096), payload)
+
+    def test_an_entry_is_served_only_for_the_file_it_was_stored_from(self):
+        # The same tag and serial in front of another file: the store's tag
+        # is its word, and the front of the file is checked against it.
+        payload = os.urandom(5000)
+        self.assertTrue(self._store('k1', payload, head=_head(7) + payload[:100]))
+        stats, source, index = self.cache.get('k1', _head(7) + payload[:100])
+        source.close()
+        with self.assertLogs(jobcache_mod.logger, 'WARNING') as logs:
+            self.assertIsNone(self.cache.get('k1', _head(7) + bytes(100)))
+        self.assertIn('not the file the service has now', logs.output[0])
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_an_entry_dropped_once_it_is_handed_out_still_reads_whole(self):
+        payload = os.urandom(20000)
+        self._store('k1', payload)
+        stats, source, index = self.cache.get('k1')
+        self.addCleanup(source.close)
+        self.cache._drop('k1')                  # evicted by another job's put()
+        self.assertEqual(_read_all(source, 4096), payload)
+
+    def test_an_entry_keeps_the_size_it_was_downloaded_at(self):
+        class Download(io.BytesIO):
+            body_size = 321
+        payload = os.urandom(5000)
+        recording = self.cache.record(Download(payload))
+        _read_all(recording)
+        self.assertTrue(self.cache.put('k1', recording, {'header_data': {}}))
+        stats, source, index = self.cache.get('k1')
+        source.close()
+        self.assertEqual(source.body_size, 321)
+        with open(os.path.join(self.dir, 'k1.json')) as f:
+            meta = json.load(f)
+        self.assertEqual(meta['program_sha256'], hashlib.sha256(payload).hexdigest())
+
+    def test_a_job_not_read_to_its_end_is_not_stored(self):
+        recording = self.cache.record(io.BytesIO(bytes(5000)))
+        recording.read(1000)
+        self.assertFalse(self.cache.put('k1', recording, {}))
+        self.assertIsNone(self.cache.get('k1'))
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_reading_on_past_the_end_is_still_the_end(self):
+        payload = os.urandom(5000)
+        recording = self.cache.record(io.BytesIO(payload))
+        self.assertEqual(_read_all(recording, 4096), payload)
+        self.assertEqual(recording.read(10), b'')
+        self.assertEqual(recording.read(10), b'')
+        self.assertIsNone(recording.error)
+        self.assertTrue(self.cache.put('k1', recording, {'header_data': {}, 'stats': {}}))
+        stats, source, index = self.cache.get('k1')
+        self.addCleanup(source.close)
+        self.assertEqual(_read_all(source, 4096), payload)
+
+    def test_an_entry_that_fails_its_check_is_dropped(self):
+        self._store('k1', bytes(5000))
+        with open(os.path.join(self.dir, 'k1.puls.z'), 'r+b') as f:
+            f.write(b'\xff')
+        self.assertIsNone(self.cache.get('k1'))
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_the_least_recently_used_go_first(self):
+        self.cache.max_bytes = 3 * 1100
+        for i, key in enumerate(('k1', 'k2', 'k3')):
+            self._store(key, os.urandom(800))
+            meta = os.path.join(self.dir, key + '.json')
+            os.utime(meta, (1000 + i, 1000 + i))
+        self.cache.get('k1')[1].close()                  # k1 is now the newest
+        self._store('k4', os.urandom(800))
+        self.assertIsNone(self.cache.get('k2'))
+        for key in ('k1', 'k3', 'k4'):
+            self.cache.get(key)[1].close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+
+Host tests for the feed journal: what a restarted daemon reads to pick a
+running job's feed back up.
+
+Run:  PYTHONPATH=. python3 -m unittest tests.test_journal
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+_pkg = types.ModuleType('gfhardware')
+_pkg.__path__ = [os.path.join(ROOT, 'gfhardware')]
+sys.modules['gfhardware'] = _pkg
+
+import gfhardware.journal as journal_mod                  # noqa: E402
+from gfhardware.journal import FeedJournal, job_hash       # noqa: E402
+
+
+class _Accountant:
+    """Gives a checkpoint only when it has one to give."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def checkpoint(self):
+        return self.state
+
+
+class _Spool:
+    def __init__(self, filled, done):
+        self.filled = filled
+        self.done = done
+        self.error = None
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'feed.journal')
+
+    def test_a_job_reads_back_as_it_was_last_checkpointed(self):
+        journal = FeedJournal(self.path, interval=0)
+        spool = _Spool(0, False)
+        journal.begin({'job': 'abc', 'spool': '/tmp/job.puls'}, spool=spool)
+        self.assertEqual(FeedJournal(self.path).load()['written'], 0)
+        state = {'accounted': 4096, 'stats': {'XP': 1}, 'index': [], 'cursor': [4096, 1]}
+        spool.filled, spool.done = 50000, True
+        journal.note(4096, _Accountant(state))
+        # Accounting that is not caught up leaves the last that was.
+        journal.note(8192, _Accountant(None))
+        record = FeedJournal(self.path).load()
+        self.assertEqual(record['job'], 'abc')
+        self.assertEqual(record['written'], 8192)
+        self.assertEqual(record['spooled'], 50000)
+        self.assertEqual(record['accounting'], state)
+        # Nothing is left beside it but the journal itself.
+        self.assertEqual(os.listdir(self.dir), ['feed.journal'])
+
+    def test_checkpoints_come_no_oftener_than_the_interval_unless_forced(self):
+        journal = FeedJournal(self.path, interval=3600)
+        journal.begin({'job': 'abc'})
+        journal.note(100)
+        journal.note(200)
+        self.assertEqual(journal.load()['written'], 100)
+        journal.note(300, force=True)
+        self.assertEqual(journal.load()['written'], 300)
+
+    def test_a_cleared_journal_names_no_job(self):
+        journal = FeedJournal(self.path, interval=0)
+        journal.begin({'job': 'abc'})
+        journal.clear()
+        self.assertIsNone(journal.load())
+        journal.note(100)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_a_journal_that_is_not_one_is_ignored(self):
+        with open(self.path, 'w') as f:
+            f.write('{"job": ')
+        self.assertIsNone(FeedJournal(self.path).load())
+        with open(self.path, 'w') as f:
+            json.dump({'version': 99, 'job': 'abc'}, f)
+        self.assertIsNone(FeedJournal(self.path).load())
+
+    def test_a_journal_that_cannot_be_written_leaves_the_job_running(self):
+        journal = FeedJournal(os.path.join(self.dir, 'missing', 'feed.journal'), interval=0)
+        with self.assertLogs(journal_mod.logger, level='WARNING'):
+            journal.begin({'job': 'abc'})
+        journal.note(100)
+        self.assertIsNone(journal.load())
+
+    def test_a_job_is_named_by_its_cache_key_where_it_has_one(self):
+        self.assertEqual(job_hash('https://x/a', 'k' * 64), 'k' * 64)
+        self.assertEqual(job_hash('https://x/a'), job_hash('https://x/a'))
+        self.assertNotEqual(job_hash('https://x/a'), job_hash('https://x/b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
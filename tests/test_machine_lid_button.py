@@ -19,6 +19,7 @@ import json
 import importlib.util
 import os
 import queue
+import shutil
 import sys
 import tempfile
 import threading
@@ -66,6 +67,8 @@ class FakeCNC:
 
     def __init__(self):
         self.writes = []
+        # Each cnc.apply() batch, as passed.
+        self.applied = []
         self._state = MachineState.IDLE
         self._reads_left = 0
         self.run_reads = 10 ** 9
@@ -86,6 +89,8 @@ class FakeCNC:
         self.streaming_writes = []
         # After this many state reads a live-fed run reports a dry ring.
         self.underrun_after = None
+        # Motion the ring holds: an hour, unless a test says otherwise.
+        self.seconds_until_empty = 3600.0
 
     # -- attributes the Machine constructor maps pulse-header keys onto
     def set_step_freq(self, v): self.writes.append(('step_freq', v))
@@ -96,6 +101,12 @@ class FakeCNC:
     def set_y_current(self, v): pass
     def set_y_mode(self, v): pass
 
+    def apply(self, config):
+        self.applied.append(dict(config))
+        if 'step_freq' in config:
+            self.writes.append(('step_freq', config['step_freq']))
+        return {'written': dict(config), 'held': [], 'write_ms': {}, 'total_ms': 0.0}
+
     # -- job path
     def run(self):
         self.writes.append(('run', 1))
@@ -151,6 +162,25 @@ class FakeCNC:
                     self.processed = self.total
         return self._state
 
+    def wait_state(self, states, timeout):
+        # Polled, as a driver that never notifies would be: every read
+        # advances the state machine above exactly as a pass's read does.
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            state = self.state
+            if state in states:
+                return state
+            time.sleep(0.01)
+        return None
+
+    def transitions(self, timeout=None, stop=None):
+        # The run loop's watcher: it must not spend the reads the tests
+        # count, so it only waits to be told to stop.
+        if stop is not None:
+            stop.wait(timeout)
+        return
+        yield
+
     @property
     def max_backtrack(self):
         if self.max_backtrack_error is not None:
@@ -176,6 +206,7 @@ class FakeFeeder:
         self.finished = finished
         self.error = None
         self.stopped = False
+        self.placed = []
 
     @property
     def written(self):
@@ -183,6 +214,10 @@ class FakeFeeder:
             self._written += 1
         return self._written
 
+    def position_at(self, offset):
+        self.placed.append(offset)
+        return (0, 0, 0, 0, False)
+
     def stop(self, timeout=5.0):
         self.stopped = True
 
@@ -358,6 +393,8 @@ CNC, SW, COOL, LEDS, CAM = _install_fakes()
 import gfhardware.machine as machine_mod          # noqa: E402
 from gfhardware.machine import Machine             # noqa: E402
 from gfutilities.configuration import set_cfg     # noqa: E402
+from gfhardware.accounting import StepDecoder      # noqa: E402
+from gfhardware.journal import FeedJournal         # noqa: E402
 
 set_cfg('THERMAL.MAX_START_TEMP', 50)
 # Point the reads the constructor makes at fakes.
@@ -693,6 +730,32 @@ class StartGateTests(unittest.TestCase):
         self.assertTrue(self.m._safe_to_move(lid_gated=False))
         self.assertFalse(self.m._safe_to_move(lid_gated=True))
 
+    def test_an_open_lid_is_refused_before_the_coolant_is_read(self):
+        SW.word[InputSwitch.SW_DOORS] = False
+        sensors = type(machine_mod.temp_sensor)
+        reads = []
+        orig = sensors.water_2
+        sensors.water_2 = property(lambda s: reads.append(1) or orig)
+        try:
+            self.assertFalse(self.m._safe_to_move(lid_gated=True))
+            self.assertEqual(reads, [])
+            self.assertTrue(self.m._safe_to_move(lid_gated=False))
+            self.assertEqual(reads, [1])
+        finally:
+            sensors.water_2 = orig
+
+    def test_the_gate_decides_on_one_view_of_the_machine(self):
+        snap = machine_mod.snapshot(switches=SW, temps=('water_2',))
+        self.assertIs(snap.state, MachineState.IDLE)
+        self.assertTrue(snap.switches[InputSwitch.SW_DOORS])
+        self.assertEqual(snap.temps['water_2'].C, 20.0)
+        self.assertIsNone(snap.position)
+        # Shared by every decision in a pass, so nothing may change it.
+        with self.assertRaises(AttributeError):
+            snap.state = MachineState.FAULT
+        with self.assertRaises(TypeError):
+            snap.switches[InputSwitch.SW_DOORS] = False
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -785,6 +848,8 @@ class FeedWatchdogTests(unittest.TestCase):
         self.assertIn(('resume', -2000), w)         # retraced like a pause
         self.assertIn(('resume', 1950), w)          # and led back on over cut ground
         self.assertEqual(job_events(), ['print:paused', 'print:resumed'])
+        # Where it was held is told by the feed's index, not read again.
+        self.assertEqual(len(feeder.placed), 1)
 
     def test_feed_that_never_moves_cancels_the_job(self):
         machine_mod.FEED_RECOVER_S = 0.5
@@ -798,6 +863,46 @@ class FeedWatchdogTests(unittest.TestCase):
         # Held, then given up on: the job never claims to have finished.
         self.assertEqual(job_events(), ['print:paused'])
 
+    def test_a_ring_about_to_run_dry_is_held_before_the_stall_timeout(self):
+        # Thirty seconds of stillness is too long to wait on a ring with
+        # three seconds of motion in it: the hold comes at the shortest wait.
+        machine_mod.FEED_STALL_S = 30.0
+        machine_mod.FEED_RECOVER_S = 0.5
+        CNC.seconds_until_empty = 3.0
+        self.m._feeder = FakeFeeder(written=1000)
+        t0 = time.monotonic()
+
+        with self.assertLogs(machine_mod.logger, level='WARNING') as caught:
+            aborted = self.m._run_loop(pausable=True)
+
+        self.assertTrue(aborted)
+        self.assertIn(('stop', 1), CNC.writes)
+        self.assertLess(time.monotonic() - t0, 10.0)
+        self.assertTrue([ln for ln in caught.output if 'ring holds 3.0 s of motion' in ln],
+                        caught.output)
+
+    def test_a_long_stall_reads_the_ring_once_a_second_and_keeps_quiet(self):
+        # Twenty seconds queued is a feeder waiting on a full ring, not one
+        # about to run dry: nothing is called out, and the ring's depth (a
+        # full position read) is not taken on every pass of the loop.
+        machine_mod.FEED_STALL_S = 30.0
+        CNC.seconds_until_empty = 20.0
+        CNC.free = 0
+        CNC.run_reads = 30                          # about three seconds
+        self.m._feeder = FakeFeeder(written=1000)
+        reads = []
+        saved = machine_mod._ring_seconds_left
+        self.addCleanup(setattr, machine_mod, '_ring_seconds_left', saved)
+        machine_mod._ring_seconds_left = lambda: reads.append(1) or saved()
+
+        with self.assertNoLogs(machine_mod.logger, level='WARNING'):
+            aborted = self.m._run_loop(pausable=True)
+
+        self.assertFalse(aborted)
+        self.assertTrue(reads)
+        self.assertLessEqual(len(reads), 3)
+        self.assertTrue(self.m._feed_clear.is_set())
+
     def test_a_full_ring_is_not_a_stalled_feed(self):
         # The feeder has written nothing for the whole run because there is
         # no room to write into. That is a healthy feed with a full window,
@@ -940,6 +1045,213 @@ class JobLifecycleTests(unittest.TestCase):
         self.assertFalse([ln for ln in caught.output if 'keys with no applier: ' in ln], caught.output)
         self.assertTrue([ln for ln in caught.output if '(3 declared ignored, 0 undecided)' in ln], caught.output)
 
+    def test_a_phase_applies_its_stepper_settings_as_one_batch(self):
+        header = {'STfr': 10000, 'XSmm': 8, 'YSmm': 8, 'XSrc': 33, 'XShc': 10}
+        self.m._config_from_pulse('run', header)
+        self.assertEqual(CNC.applied, [{'step_freq': 10000, 'x_mode': 8, 'y_mode': 8,
+                                        'x_current': 33}])
+        self.m._config_from_pulse('idle', header)
+        self.assertEqual(CNC.applied[-1], {'x_current': 10})
+
+    def test_a_queued_job_is_fetched_ahead_and_handed_to_it(self):
+        fetched = []
+
+        def fetch(session, url, **kw):
+            fetched.append(url)
+            return {'header_data': {}}, 'program of %s' % url
+        self._fetch = machine_mod.fetch_motion
+        machine_mod.fetch_motion = fetch
+        try:
+            self.assertFalse(self.m.prefetch_job({'id': 43, 'action_type': 'hunt'}))
+            self.assertTrue(self.m.prefetch_job({'id': 43, 'action_type': 'print',
+                                                 'motion_url': 'u43'}))
+            self.assertEqual(self.m._take_prefetch('u43').result,
+                             ({'header_data': {}}, 'program of u43'))
+            # Taken once: the next job downloads its own.
+            self.assertIsNone(self.m._take_prefetch('u43'))
+            # A prefetch for some other job is no use to this one.
+            self.m.prefetch_job({'id': 44, 'action_type': 'print', 'motion_url': 'u44'})
+            self.m._prefetch.join()
+            self.assertIsNone(self.m._take_prefetch('u45'))
+        finally:
+            machine_mod.fetch_motion = self._fetch
+        self.assertEqual(fetched, ['u43', 'u44'])
+
+    def test_a_stalled_prefetch_is_given_up_on_and_what_it_fetches_let_go(self):
+        release = threading.Event()
+        closed = []
+
+        class Source:
+            def close(self):
+                closed.append(self)
+
+        def fetch(session, url, **kw):
+            release.wait(10)
+            return {'header_data': {}}, Source()
+        self._fetch = machine_mod.fetch_motion
+        machine_mod.fetch_motion = fetch
+        saved = machine_mod.PREFETCH_WAIT_S
+        machine_mod.PREFETCH_WAIT_S = 0.2
+        try:
+            self.m.prefetch_job({'id': 43, 'action_type': 'print', 'motion_url': 'u43'})
+            stalled = self.m._prefetch
+            t0 = time.monotonic()
+            self.assertIsNone(self.m._take_prefetch('u43'))
+            self.assertLess(time.monotonic() - t0, 2.0)
+            release.set()
+            stalled.join(5)
+            self.assertEqual(len(closed), 1)
+            # One for a job that never came is let go by the next.
+            self.m.prefetch_job({'id': 44, 'action_type': 'print', 'motion_url': 'u44'})
+            self.m._prefetch.join(5)
+            self.m.prefetch_job({'id': 45, 'action_type': 'print', 'motion_url': 'u45'})
+            self.m._prefetch.join(5)
+            self.assertEqual(len(closed), 2)
+            self.assertIsNone(self.m._take_prefetch('u46'))
+            self.assertEqual(len(closed), 3)
+        finally:
+            release.set()
+            machine_mod.fetch_motion = self._fetch
+            machine_mod.PREFETCH_WAIT_S = saved
+
+    def test_a_prefetch_names_the_job_for_the_cache_once(self):
+        # The job takes the cache's name for it from the prefetch, rather
+        # than asking the service for the header again; and a job the cache
+        # holds is not downloaded at all.
+        probes = []
+        fetched = []
+
+        class Cache:
+            directory = '/nowhere'
+
+            def probe(self, session, url):
+                probes.append(url)
+                return 'key-of-%s' % url, b'head'
+
+            def __contains__(self, key):
+                return True
+        self._fetch = machine_mod.fetch_motion
+        machine_mod.fetch_motion = lambda session, url, **kw: fetched.append(url)
+        self.m._motion_cache = lambda: Cache()
+        try:
+            self.m.prefetch_job({'id': 43, 'action_type': 'print', 'motion_url': 'u43'})
+            prefetch = self.m._take_prefetch('u43')
+        finally:
+            machine_mod.fetch_motion = self._fetch
+            del self.m._motion_cache
+        self.assertTrue(prefetch.probed)
+        self.assertEqual(prefetch.key, 'key-of-u43')
+        self.assertIsNone(prefetch.result)
+        self.assertEqual(probes, ['u43'])
+        self.assertEqual(fetched, [])
+
+    def test_a_job_sent_while_another_runs_is_fetched_ahead(self):
+        # BaseMachine turns it away, as ever; its download starts anyway.
+        fetched = []
+
+        def fetch(session, url, **kw):
+            fetched.append(url)
+            return {'header_data': {}}, 'program of %s' % url
+        self._fetch = machine_mod.fetch_motion
+        machine_mod.fetch_motion = fetch
+        try:
+            self.m.run_puls({'id': 43, 'action_type': 'print', 'status': 'ready',
+                             'motion_url': 'u43'})
+            self.assertEqual(self.m.running_action_id, 42)
+            self.assertEqual(self.m._take_prefetch('u43').result,
+                             ({'header_data': {}}, 'program of u43'))
+            # Cancelling a queued job, or the one running, fetches nothing.
+            self.m.run_puls({'id': 44, 'action_type': 'print', 'status': 'cancelled',
+                             'motion_url': 'u44'})
+            self.m.run_puls({'id': 42, 'action_type': 'print', 'status': 'cancelled',
+                             'motion_url': 'u42'})
+            self.assertIsNone(self.m._prefetch)
+        finally:
+            machine_mod.fetch_motion = self._fetch
+        self.assertEqual(fetched, ['u43'])
+
+    def test_the_jobs_share_one_motion_cache_until_it_is_configured_anew(self):
+        # Its lock is what keeps a read from an eviction, so every job and
+        # prefetch has to go through the same one.
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        conf = os.path.join(tmp, 'forgefirm.conf')
+
+        def configure(mb):
+            with open(conf, 'w') as f:
+                f.write('motion_cache_mb = %s\nmotion_cache_dir = %s\n' % (mb, tmp))
+        saved = machine_mod.MACHINE_CONF
+        machine_mod.MACHINE_CONF = conf
+        self.addCleanup(setattr, machine_mod, 'MACHINE_CONF', saved)
+        configure(8)
+        cache = self.m._motion_cache()
+        self.assertIs(self.m._motion_cache(), cache)
+        configure(16)
+        resized = self.m._motion_cache()
+        self.assertIsNot(resized, cache)
+        self.assertEqual(resized.max_bytes, 16 * 1024 * 1024)
+        configure(0)
+        self.assertIsNone(self.m._motion_cache())
+
+    def _journal_a_job(self, payload, written):
+        # A job the last daemon was feeding when it died: its journal, its
+        # spool, and the config that turned the journal on.
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        conf = os.path.join(tmp, 'forgefirm.conf')
+        self.journal_path = os.path.join(tmp, 'feed.journal')
+        with open(conf, 'w') as f:
+            f.write('feed_journal = 1\nfeed_journal_path = %s\n' % self.journal_path)
+        saved = machine_mod.MACHINE_CONF
+        machine_mod.MACHINE_CONF = conf
+        self.addCleanup(setattr, machine_mod, 'MACHINE_CONF', saved)
+        self.spool_path = os.path.join(tmp, 'gf-job-abc.puls')
+        with open(self.spool_path, 'wb') as f:
+            f.write(payload)
+        journal = FeedJournal(self.journal_path, interval=0)
+        journal.begin({'job': 'abc', 'lid_gated': True,
+                       'msg': {'id': 7, 'action_type': 'motion', 'motion_url': 'u7'},
+                       'motion': {'header_data': {}}, 'program_size': len(payload),
+                       'spool': self.spool_path, 'cache': None, 'cache_dir': None},
+                      spool=types.SimpleNamespace(done=True, filled=len(payload), error=None))
+        journal.note(written, force=True)
+        # The broker still holds the device the job was fed through.
+        self.dev = open(os.path.join(tmp, 'ring'), 'wb', buffering=0)
+        self.addCleanup(self.dev.close)
+        saved_dev = machine_mod._inherited_pulse_dev
+        machine_mod._inherited_pulse_dev = lambda: self.dev
+        self.addCleanup(setattr, machine_mod, '_inherited_pulse_dev', saved_dev)
+
+    def test_a_journaled_job_the_machine_is_no_longer_running_is_let_go(self):
+        self._journal_a_job(os.urandom(50000), 20000)
+        self.assertFalse(self.m._resume_job())
+        self.assertFalse(os.path.exists(self.journal_path))
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_a_journaled_job_still_playing_is_fed_on_from_where_the_ring_has_it(self):
+        payload = os.urandom(200000)
+        self._journal_a_job(payload, 20000)
+        # The journal trails the feed: the ring has more than it says.
+        CNC._state = MachineState.RUNNING
+        CNC._reads_left = 40
+        CNC.total = 30000
+        self.assertTrue(self.m._resume_job())
+        self.assertEqual(self.m.running_action_id, 7)
+        deadline = time.monotonic() + 10
+        while self.m.running_action_id is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIsNone(self.m.running_action_id)
+        self.assertIn('motion:completed', EVENTS)
+        with open(self.dev.name, 'rb') as f:
+            self.assertEqual(f.read(), payload[30000:])
+        self.assertNotIn(('run', 1), CNC.writes)
+        self.assertEqual(self.m._motion_stats['size'], len(payload))
+        decoder = StepDecoder()
+        decoder.feed(payload)
+        self.assertEqual(self.m._motion_stats['stats'], decoder.stats)
+        self.assertFalse(os.path.exists(self.journal_path))
+        self.assertFalse(os.path.exists(self.spool_path))
+
     def test_the_lifecycle_keys_are_logged_even_when_absent(self):
         with self.assertLogs(machine_mod.logger, level='INFO') as caught:
             self.m._log_header_gaps({'STfr': 10000})
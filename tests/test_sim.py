@@ -0,0 +1,310 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+
+Host tests for gfhardware.sim: the cnc calls a job makes, run against the
+simulated tree, ring and switch pipe instead of the machine.
+
+Run:  PYTHONPATH=. python3 -m unittest tests.test_sim
+"""
+import csv
+import errno
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+_pkg = types.ModuleType('gfhardware')
+_pkg.__path__ = [os.path.join(ROOT, 'gfhardware')]
+sys.modules.setdefault('gfhardware', _pkg)
+
+from gfhardware._common import (CncConfig, InputSwitch, MachineState,  # noqa: E402
+                                close_attrs, invalidate_shadow)
+from gfhardware import cnc as cnc_mod                                 # noqa: E402
+from gfhardware import sdma as sdma_mod                               # noqa: E402
+from gfhardware.sdma import SdmaSampler, parse_sdma                   # noqa: E402
+from gfhardware.sim import Simulator, environ                        # noqa: E402
+from gfhardware.sim.tree import sdma_context_text                     # noqa: E402
+from gfhardware import recorder as recorder_mod                       # noqa: E402
+from gfhardware.recorder import PositionRecorder                      # noqa: E402
+from gfhardware.sim.ring import SimRing, steps_in                     # noqa: E402
+
+# Ten X+ steps, four Y- steps, a power record: net (10, -4, 0).
+PROGRAM = bytes([0x01] * 10 + [0x04] * 4 + [0x80])
+
+
+class _SimCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        env = environ(self.dir)
+        self.bases = [mock.patch.object(mod, 'SYSFS_GF_BASE', env['GF_SYSFS_BASE'])
+                      for mod in (cnc_mod, recorder_mod, sdma_mod)]
+        for base in self.bases:
+            base.start()
+        self.sim = Simulator(drain_rate=20000, ring_bytes=4096,
+                             sysfs_base=env['GF_SYSFS_BASE'],
+                             pulse_device=env['GF_PULSE_DEVICE'],
+                             switch_device=env['GF_SWITCH_DEVICE']).start()
+        self.cnc = cnc_mod.cnc
+        self.cnc.enable()
+        self.assertIs(self.cnc.wait_state((MachineState.IDLE,), 1.0), MachineState.IDLE)
+
+    def tearDown(self):
+        self.sim.stop()
+        for base in self.bases:
+            base.stop()
+        close_attrs()
+        shutil.rmtree(self.dir)
+
+
+class SimTest(_SimCase):
+    def test_a_program_plays_out_into_the_position(self):
+        with self.cnc.open_pulse_dev() as dev:
+            self.cnc.set_pulse_dev(dev)
+            try:
+                self.cnc.clear_all()
+                dev.write(PROGRAM * 10)
+                self.cnc.run()
+                self.assertIs(self.cnc.wait_state((MachineState.RUNNING,), 1.0), MachineState.RUNNING)
+                self.assertIs(self.cnc.wait_state((MachineState.IDLE,), 2.0), MachineState.IDLE)
+            finally:
+                self.cnc.set_pulse_dev(None)
+        pos = self.cnc.position
+        self.assertEqual((pos.x.steps, pos.y.steps, pos.z.steps), (100, -40, 0))
+        self.assertEqual(pos.bytes, (150, 150))
+
+    def test_a_full_ring_refuses_the_write(self):
+        with self.cnc.open_pulse_dev() as dev:
+            dev.write(bytes(4000))
+            with self.assertRaises(OSError) as cm:
+                dev.write(bytes(200))
+            self.assertEqual(cm.exception.errno, errno.ENOMEM)
+            self.assertEqual(self.cnc.free, 96)
+
+    def test_a_clear_is_refused_while_the_ring_plays(self):
+        with self.cnc.open_pulse_dev() as dev:
+            dev.write(bytes(4000))
+        self.sim.drain_rate = 100
+        self.cnc.run()
+        self.cnc.wait_state((MachineState.RUNNING,), 1.0)
+        with self.assertRaises(OSError) as cm:
+            self.cnc.clear_pulse_and_byte()
+        self.assertEqual(cm.exception.errno, errno.EBUSY)
+        self.cnc.stop()
+        self.assertIs(self.cnc.wait_state((MachineState.IDLE,), 1.0), MachineState.IDLE)
+        self.cnc.clear_pulse_and_byte()
+        self.assertEqual(self.cnc.position.bytes, (0, 0))
+
+    def test_a_live_feed_that_runs_dry_is_an_underrun(self):
+        self.cnc.set_streaming(True)
+        with self.cnc.open_pulse_dev() as dev:
+            dev.write(PROGRAM)
+        self.cnc.run()
+        self.assertIs(self.cnc.wait_state((MachineState.UNDERRUN,), 2.0), MachineState.UNDERRUN)
+        self.assertEqual(self.cnc.underruns, 1)
+
+    def test_a_backward_run_retraces_what_was_played(self):
+        with self.cnc.open_pulse_dev() as dev:
+            dev.write(PROGRAM * 4)
+        self.cnc.run()
+        self.cnc.wait_state((MachineState.RUNNING,), 1.0)
+        self.cnc.wait_state((MachineState.IDLE,), 2.0)
+        self.assertEqual(self.cnc.max_backtrack, 60)
+        self.cnc.resume(-15)
+        self.cnc.wait_state((MachineState.RUNNING,), 1.0)
+        self.cnc.wait_state((MachineState.IDLE,), 2.0)
+        pos = self.cnc.position
+        self.assertEqual((pos.x.steps, pos.y.steps), (30, -12))
+        self.assertEqual(pos.bytes.processed, 45)
+
+    def test_the_ring_reports_the_time_it_holds(self):
+        self.cnc.set_step_freq(1000)
+        with self.cnc.open_pulse_dev() as dev:
+            dev.write(bytes(1500))
+        self.assertAlmostEqual(self.cnc.seconds_until_empty, 1.5)
+
+    def test_a_fault_stops_the_ring(self):
+        with self.cnc.open_pulse_dev() as dev:
+            dev.write(bytes(4000))
+        self.sim.drain_rate = 100
+        self.cnc.run()
+        self.cnc.wait_state((MachineState.RUNNING,), 1.0)
+        self.sim.fault()
+        self.assertIs(self.cnc.state, MachineState.FAULT)
+        self.assertEqual(self.cnc.faults, '1')
+
+    def test_the_sdma_context_parses(self):
+        self.assertEqual(self.cnc.sdma_context.pc, 0)
+        self.assertEqual(self.cnc.sdma_context.sc7, 0)
+
+    def test_the_context_is_kept_around_an_underrun(self):
+        sampler = SdmaSampler(depth=4, period_s=0.005, post=2)
+        sampler.arm()
+        try:
+            time.sleep(0.05)
+            sampler.on_state(MachineState.RUNNING)
+            sampler.on_state(MachineState.UNDERRUN)
+            sampler.on_state(MachineState.UNDERRUN)
+            time.sleep(0.05)
+        finally:
+            sampler.disarm()
+        self.assertEqual(sampler.count, 1)
+        capture, = sampler.captures
+        self.assertIs(capture['state'], MachineState.UNDERRUN)
+        before = [s for ts, s in capture['samples'] if ts < capture['ts']]
+        after = [s for ts, s in capture['samples'] if ts >= capture['ts']]
+        self.assertEqual(len(before), 3)
+        self.assertEqual(len(after), 3)
+        self.assertEqual(after[0].pc, 0)
+
+    def test_a_disarmed_sampler_takes_nothing(self):
+        sampler = SdmaSampler()
+        sampler.on_state(MachineState.RUNNING)
+        sampler.on_state(MachineState.FAULT)
+        self.assertEqual(sampler.captures, [])
+
+    def test_switch_changes_arrive_as_input_events(self):
+        fd = os.open(self.sim.switches.path, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            event = struct.Struct('llHHi')
+            os.read(fd, 1 << 16)         # the initial report
+            self.sim.switches.set_lid(False)
+            time.sleep(0.01)
+            raw = os.read(fd, 1 << 16)
+        finally:
+            os.close(fd)
+        events = [event.unpack_from(raw, i) for i in range(0, len(raw), event.size)]
+        reported = [(e[3], e[4]) for e in events if e[2] == 5]
+        self.assertEqual(reported, [(InputSwitch.SW_DOOR1, 0), (InputSwitch.SW_DOOR2, 0),
+                                    (InputSwitch.SW_DOORS, 0)])
+
+
+class ApplyTest(_SimCase):
+    def setUp(self):
+        _SimCase.setUp(self)
+        self.written = []
+        real = cnc_mod.write_attr
+
+        def write_attr(path, val, shadow=False):
+            self.written.append(path)
+            real(path, val, shadow)
+        self.spy = mock.patch.object(cnc_mod, 'write_attr', write_attr)
+        self.spy.start()
+        invalidate_shadow()
+
+    def tearDown(self):
+        self.spy.stop()
+        _SimCase.tearDown(self)
+
+    def _written(self):
+        return [path[len(cnc_mod.SYSFS_GF_BASE):] for path in self.written]
+
+    def test_a_reset_writes_everything_in_order(self):
+        self.cnc.reset()
+        self.assertEqual(self._written()[-7:], ['cnc/x_decay', 'cnc/y_decay', 'pic/x_step_current',
+                                                'pic/y_step_current', 'cnc/x_mode', 'cnc/y_mode',
+                                                'cnc/step_freq'])
+
+    def test_only_what_changed_is_written(self):
+        self.cnc.apply(cnc_mod.RESET_CONFIG)
+        del self.written[:]
+        report = self.cnc.apply({'step_freq': 10000, 'x_mode': 16, 'y_current': None})
+        self.assertEqual(self._written(), ['cnc/x_mode'])
+        self.assertEqual(report['written'], {'x_mode': 16})
+        self.assertEqual(report['held'], ['step_freq'])
+        self.assertEqual(set(report['write_ms']), {'x_mode'})
+        self.assertEqual(cnc_mod._CNC._modes['x'], 16)
+
+    def test_a_config_tuple_applies_its_set_fields(self):
+        report = self.cnc.apply(CncConfig(step_freq=2000))
+        self.assertEqual(report['written'], {'step_freq': 2000})
+        self.assertEqual(self.cnc.step_freq, 2000)
+
+    def test_an_unknown_setting_writes_nothing(self):
+        with self.assertRaises(ValueError):
+            self.cnc.apply({'step_freq': 2000, 'z_mode': 4})
+        self.assertEqual(self.written, [])
+
+
+class RecorderTest(_SimCase):
+    def test_a_run_is_traced_from_start_to_end(self):
+        with self.cnc.open_pulse_dev() as dev:
+            dev.write(PROGRAM * 200)
+        self.sim.drain_rate = 10000
+        recorder = PositionRecorder(rate_hz=500, samples=1000)
+        recorder.start()
+        self.cnc.run()
+        self.cnc.wait_state((MachineState.RUNNING,), 1.0)
+        self.cnc.wait_state((MachineState.IDLE,), 2.0)
+        time.sleep(0.02)
+        recorder.stop()
+        cols = recorder.columns()
+        self.assertGreater(len(cols['t']), 50)
+        self.assertEqual(list(cols['t']), sorted(cols['t']))
+        self.assertEqual(cols['x'][-1], 2000)
+        self.assertEqual(cols['processed'][-1], 3000)
+        self.assertIn(ord('r'), cols['state'])
+        self.assertEqual(cols['state'][-1], ord('i'))
+        path = os.path.join(self.dir, 'trace.csv')
+        self.assertEqual(recorder.export_csv(path), len(cols['t']))
+        with open(path) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['t', 'x', 'y', 'z', 'processed', 'total', 'state'])
+        self.assertEqual(rows[-1][1:], ['2000', '-800', '0', '3000', '3000', 'idle'])
+
+    def test_only_the_newest_samples_are_kept(self):
+        recorder = PositionRecorder(rate_hz=1000, samples=16, state=False)
+        recorder.start()
+        time.sleep(0.1)
+        recorder.stop()
+        self.assertGreater(recorder.count, 16)
+        t = recorder.columns()['t']
+        self.assertEqual(len(t), 16)
+        self.assertEqual(list(t), sorted(t))
+
+
+class SdmaParseTest(unittest.TestCase):
+    def test_every_field_comes_from_its_columns(self):
+        text = sdma_context_text()
+        lines = text.splitlines()
+        # Write each field's own index into it, in hex, where it lives.
+        for i, (line, start, end) in enumerate(sdma_mod._FIELDS):
+            lines[line] = lines[line][:start] + ('%x' % i).rjust(end - start, '0')[-(end - start):] + lines[line][end:]
+        ctx = parse_sdma('\n'.join(lines))
+        self.assertEqual(list(ctx)[:4], [0, 1, 2, 3])
+        self.assertEqual(list(ctx)[8:], list(range(8, 38)))
+        self.assertEqual(ctx.sc7, 37)
+
+
+class RingTest(unittest.TestCase):
+    def test_steps_count_as_the_decoder_counts_them(self):
+        # X: 1 is +, 3 is -; Y: 0xC is +, 4 is -; Z: 0x20 is +, 0x60 is -; a
+        # power record steps nothing whatever its low bits.
+        self.assertEqual(steps_in(bytes([0x01, 0x0D, 0x2C, 0x63, 0x81, 0xFF])),
+                         (1, 2, 0))
+
+    def test_a_retrace_is_bounded_by_what_is_kept(self):
+        ring = SimRing(capacity=1024, backtrack=16)
+        ring.write(bytes([0x01]) * 64)
+        self.assertEqual(ring.play(64), 64)
+        self.assertGreaterEqual(ring.playable_back, 16)
+        back = ring.playable_back
+        self.assertEqual(ring.unplay(1000), back)
+        self.assertEqual(ring.x, 64 - back)
+        self.assertEqual(ring.queued, back)
+
+
+if __name__ == '__main__':
+    unittest.main()
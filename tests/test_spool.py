@@ -0,0 +1,214 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+
+Host tests for the job spool: the program decompressed once into a mapped
+file, read back as views of the mapping.
+
+Run:  PYTHONPATH=. python3 -m unittest tests.test_spool
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+_pkg = types.ModuleType('gfhardware')
+_pkg.__path__ = [os.path.join(ROOT, 'gfhardware')]
+sys.modules['gfhardware'] = _pkg
+
+import gfhardware.spool as spool_mod          # noqa: E402
+from gfhardware.spool import JobSpool         # noqa: E402
+
+
+class _Declaring(io.BytesIO):
+    """A job source that says how long it is, right or wrong."""
+
+    def __init__(self, data: bytes, program_size):
+        super().__init__(data)
+        self.program_size = program_size
+
+
+class _Trickle:
+    """A source that hands out a chunk only when told to, declaring its
+    length unless ``declared`` is False."""
+
+    def __init__(self, data: bytes, declared: bool = True):
+        if declared:
+            self.program_size = len(data)
+        self._data = data
+        self._at = 0
+        self.allow = threading.Semaphore(0)
+
+    def read(self, count: int) -> bytes:
+        if self._at < len(self._data):
+            self.allow.acquire()
+        out = self._data[self._at:self._at + count]
+        self._at += len(out)
+        return out
+
+
+class _Stalled(_Trickle):
+    """A download that has stopped coming, until it is closed."""
+
+    closed = False
+
+    def read(self, count: int) -> bytes:
+        out = _Trickle.read(self, count)
+        if self.closed:
+            raise OSError('connection closed')
+        return out
+
+    def close(self):
+        self.closed = True
+        self.allow.release()
+
+
+def _read_all(spool, count=1000) -> bytes:
+    out = bytearray()
+    while True:
+        view = spool.read(count)
+        if not view:
+            return bytes(out)
+        out += view
+
+
+class SpoolTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def _spool(self, source, chunk=4096):
+        spool = JobSpool(source, self.dir, chunk=chunk)
+        self.addCleanup(spool.close)
+        spool.start()
+        return spool
+
+    def test_a_declared_job_reads_back_whole_from_the_mapping(self):
+        payload = os.urandom(50000)
+        spool = self._spool(_Declaring(payload, len(payload)))
+        view = spool.read(1000)
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(bytes(view) + _read_all(spool), payload)
+        self.assertTrue(spool.done)
+        # The file has no name: nothing is left behind in the directory.
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_a_job_that_will_not_say_how_long_it_is_is_mapped_once_spooled(self):
+        payload = os.urandom(30000)
+        spool = self._spool(io.BytesIO(payload))
+        self.assertEqual(_read_all(spool, 7000), payload)
+        self.assertTrue(spool.done)
+        spool.seek(0)
+        view = spool.read(100)
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(bytes(view), payload[:100])
+
+    def test_a_job_of_unknown_length_is_read_as_it_spools(self):
+        # Spooling it first would hold the job's start for the whole download.
+        payload = os.urandom(3 * 4096)
+        source = _Trickle(payload, declared=False)
+        spool = self._spool(source)
+        source.allow.release()
+        self.assertEqual(bytes(spool.read(4096)), payload[:4096])
+        self.assertFalse(spool.done)
+        source.allow.release()
+        source.allow.release()
+        self.assertEqual(_read_all(spool), payload[4096:])
+        self.assertTrue(spool.done)
+
+    def test_a_read_waits_for_the_fill_to_get_ahead_of_it(self):
+        payload = os.urandom(3 * 4096)
+        source = _Trickle(payload)
+        spool = self._spool(source)
+        got = []
+        reader = threading.Thread(target=lambda: got.append(bytes(spool.read(2 * 4096))))
+        reader.start()
+        source.allow.release()
+        reader.join(0.2)
+        self.assertTrue(reader.is_alive())
+        source.allow.release()
+        reader.join(5)
+        self.assertEqual(got, [payload[:2 * 4096]])
+        source.allow.release()
+        self.assertEqual(_read_all(spool), payload[2 * 4096:])
+
+    def test_any_offset_can_be_read_again(self):
+        payload = os.urandom(20000)
+        spool = self._spool(_Declaring(payload, len(payload)))
+        _read_all(spool)
+        spool.seek(12345)
+        self.assertEqual(spool.tell(), 12345)
+        self.assertEqual(bytes(spool.read(100)), payload[12345:12445])
+
+    def test_a_job_well_past_its_declared_length_fails_the_read(self):
+        payload = os.urandom(100 + spool_mod.SPOOL_SLACK + 1)
+        spool = self._spool(_Declaring(payload, 100))
+        with self.assertRaises(ValueError):
+            _read_all(spool, 1 << 20)
+
+    def test_a_job_a_little_long_is_still_read_whole(self):
+        payload = os.urandom(5000)
+        spool = self._spool(_Declaring(payload, 4000))
+        self.assertEqual(_read_all(spool), payload)
+
+    def test_a_named_spool_is_kept_for_the_next_process_until_closed(self):
+        payload = os.urandom(20000)
+        spool = JobSpool(_Declaring(payload, len(payload)), self.dir, chunk=4096, name='job.puls')
+        self.addCleanup(spool.close)
+        spool.start()
+        _read_all(spool)
+        path = os.path.join(self.dir, 'job.puls')
+        self.assertEqual(spool.path, path)
+        # The process that made it died holding it; the next one reads it back.
+        again = JobSpool.reopen(path, spool.filled)
+        again.seek(5000)
+        self.assertEqual(_read_all(again), payload[5000:])
+        again.close()
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_closing_breaks_off_a_fill_stalled_on_the_download(self):
+        source = _Stalled(os.urandom(3 * 4096))
+        spool = self._spool(source)
+        thread = spool._thread
+        with self.assertNoLogs(spool_mod.logger, 'ERROR'):
+            spool.close(timeout=5)
+        self.assertTrue(source.closed)
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(spool._fd)
+
+    def test_a_fill_that_will_not_stop_is_left_to_close_the_spool(self):
+        source = _Trickle(os.urandom(3 * 4096), declared=False)
+        spool = self._spool(source)
+        with self.assertLogs(spool_mod.logger, 'ERROR') as logs:
+            spool.close(timeout=0.1)
+        self.assertIn('did not stop', logs.output[0])
+        # What the read writes into is still there for it.
+        self.assertIsNotNone(spool._fd)
+        source.allow.release()
+        deadline = time.monotonic() + 5
+        while spool._fd is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIsNone(spool._fd)
+
+    def test_a_kept_spool_shorter_than_its_program_is_refused(self):
+        path = os.path.join(self.dir, 'job.puls')
+        with open(path, 'wb') as f:
+            f.write(bytes(100))
+        with self.assertRaises(ValueError):
+            JobSpool.reopen(path, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
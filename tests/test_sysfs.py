@@ -0,0 +1,384 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+
+Host tests for the held-open attribute layer in gfhardware._common: the run
+loop reads the same handful of attributes on every pass, so each is opened
+once and re-read in place. These drive it against a tree of plain files,
+which behave like attributes in every way the layer relies on except that a
+shorter value would leave a tail, which the layer trims.
+
+Run:  PYTHONPATH=. python3 -m unittest tests.test_sysfs
+"""
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+_pkg = types.ModuleType('gfhardware')
+_pkg.__path__ = [os.path.join(ROOT, 'gfhardware')]
+sys.modules.setdefault('gfhardware', _pkg)
+
+from gfhardware import _common                                   # noqa: E402
+from gfhardware._common import (AxisPosition, LatencyHistogram,  # noqa: E402
+                                MachineState, Position, PulsPosition,
+                                attr_stats, close_attrs, dump_attr_stats,
+                                enable_attr_stats, invalidate_shadow,
+                                read_attr, read_file, shadow_skips,
+                                sysfs_attr, write_attr)
+from gfhardware import cnc as cnc_mod                            # noqa: E402
+
+
+class SysfsAttrTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'step_freq')
+        with open(self.path, 'w') as f:
+            f.write('10000\n')
+
+    def tearDown(self):
+        close_attrs()
+        shutil.rmtree(self.dir)
+
+    def test_one_handle_per_path(self):
+        self.assertIs(sysfs_attr(self.path), sysfs_attr(self.path))
+
+    def test_a_read_sees_the_current_value_through_the_held_descriptor(self):
+        self.assertEqual(read_attr(self.path), '10000')
+        fd = sysfs_attr(self.path)._rfd
+        with open(self.path, 'w') as f:
+            f.write('2500\n')
+        self.assertEqual(read_attr(self.path), '2500')
+        # Re-read in place, not reopened.
+        self.assertEqual(sysfs_attr(self.path)._rfd, fd)
+
+    def test_a_shorter_write_reads_back_as_written(self):
+        write_attr(self.path, 5)
+        self.assertEqual(read_attr(self.path), '5')
+        with open(self.path) as f:
+            self.assertEqual(f.read(), '5')
+
+    def test_binary_reads_are_not_stripped(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\x00\x01\x0a\x20')
+        self.assertEqual(read_attr(self.path, True), b'\x00\x01\x0a\x20')
+
+    def test_an_attribute_that_went_away_and_came_back_is_reopened(self):
+        # What a driver reload looks like from here: the held descriptor
+        # names something that no longer answers.
+        self.assertEqual(read_attr(self.path), '10000')
+        handle = sysfs_attr(self.path)
+        os.close(handle._rfd)
+        with open(self.path, 'w') as f:
+            f.write('7\n')
+        self.assertEqual(read_attr(self.path), '7')
+
+    def test_a_reopen_keeps_the_descriptor_numbers(self):
+        # Another thread may hold the number it fetched before the reload:
+        # it has to reach the attribute again, not whatever opened next.
+        read_attr(self.path)
+        write_attr(self.path, 3)
+        handle = sysfs_attr(self.path)
+        rfd, wfd = handle._rfd, handle._wfd
+        handle._reopen()
+        self.assertEqual((handle._rfd, handle._wfd), (rfd, wfd))
+        os.pwrite(wfd, b'9', 0)
+        self.assertEqual(os.pread(rfd, 16, 0), b'9')
+
+    def test_a_refused_write_is_not_retried(self):
+        calls = []
+        handle = sysfs_attr(self.path)
+
+        def refuse(data):
+            calls.append(data)
+            raise OSError(22, 'Invalid argument')
+        handle_cls = type(handle)
+        orig = handle_cls._pwrite
+        handle_cls._pwrite = lambda self_, data: refuse(data)
+        try:
+            with self.assertRaises(OSError):
+                write_attr(self.path, -2000)
+        finally:
+            handle_cls._pwrite = orig
+        self.assertEqual(len(calls), 1)
+
+    def test_a_missing_attribute_raises_like_an_open_would(self):
+        with self.assertRaises(FileNotFoundError):
+            read_attr(os.path.join(self.dir, 'no_such_attr'))
+
+    def test_closing_drops_the_registry(self):
+        handle = sysfs_attr(self.path)
+        read_attr(self.path)
+        close_attrs()
+        self.assertIsNone(handle._rfd)
+        self.assertIsNot(sysfs_attr(self.path), handle)
+        self.assertIs(_common.sysfs_attr(self.path), sysfs_attr(self.path))
+
+
+class ShadowTest(unittest.TestCase):
+    """Settings only this process writes are not written again unchanged."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'x_mode')
+        with open(self.path, 'w') as f:
+            f.write('8\n')
+        self.writes = []
+        orig = _common.SysfsAttr._pwrite
+
+        def counting(handle, data):
+            self.writes.append(data)
+            orig(handle, data)
+        patcher = mock.patch.object(_common.SysfsAttr, '_pwrite', counting)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        close_attrs()
+        shutil.rmtree(self.dir)
+
+    def test_an_unchanged_setting_is_written_once(self):
+        skipped = shadow_skips()
+        for _ in range(3):
+            write_attr(self.path, 16, shadow=True)
+        self.assertEqual(self.writes, [b'16'])
+        self.assertEqual(shadow_skips() - skipped, 2)
+        write_attr(self.path, 8, shadow=True)
+        self.assertEqual(self.writes, [b'16', b'8'])
+
+    def test_an_unshadowed_write_always_goes_through(self):
+        write_attr(self.path, 1)
+        write_attr(self.path, 1)
+        self.assertEqual(len(self.writes), 2)
+
+    def test_invalidation_forgets_what_was_written(self):
+        write_attr(self.path, 16, shadow=True)
+        invalidate_shadow(self.dir + '/x_')
+        write_attr(self.path, 16, shadow=True)
+        self.assertEqual(len(self.writes), 2)
+
+    def test_invalidation_is_by_prefix(self):
+        write_attr(self.path, 16, shadow=True)
+        invalidate_shadow(self.dir + '/y_')
+        write_attr(self.path, 16, shadow=True)
+        self.assertEqual(len(self.writes), 1)
+
+    def test_a_failed_write_forgets_the_value(self):
+        write_attr(self.path, 16, shadow=True)
+        with mock.patch.object(_common.SysfsAttr, '_pwrite',
+                               side_effect=OSError(5, 'I/O error')):
+            with self.assertRaises(OSError):
+                write_attr(self.path, 4, shadow=True)
+        write_attr(self.path, 16, shadow=True)
+        self.assertEqual(self.writes, [b'16', b'16'])
+
+
+class PositionTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, 'cnc'))
+        self.attr = lambda name: os.path.join(self.dir, 'cnc', name)
+        with open(self.attr('position'), 'wb') as f:
+            f.write(struct.pack('<3i2I', 800, -160, 4, 1000, 2 ** 31 + 5))
+        for name in ('x_mode', 'y_mode'):
+            with open(self.attr(name), 'w') as f:
+                f.write('8\n')
+        self.base = mock.patch.object(cnc_mod, 'SYSFS_GF_BASE', self.dir + '/')
+        self.base.start()
+        cnc_mod._CNC._modes.update(x=None, y=None)
+        self.cnc = cnc_mod.cnc
+
+    def tearDown(self):
+        self.base.stop()
+        cnc_mod._CNC._modes.update(x=None, y=None)
+        close_attrs()
+        shutil.rmtree(self.dir)
+
+    def test_it_decodes_as_the_named_tuples_did(self):
+        pos = self.cnc.position
+        self.assertEqual(pos.x.steps, 800)
+        self.assertAlmostEqual(pos.x.mm, 15.0)
+        self.assertAlmostEqual(pos.y.inch, -3.0 / 25.4)
+        self.assertEqual(pos.bytes.total, 2 ** 31 + 5)
+        self.assertEqual(pos.bytes.processed, 1000)
+        expected = Position(AxisPosition(800, 15.0, 15.0 / 25.4),
+                            AxisPosition(-160, -3.0, -3.0 / 25.4),
+                            AxisPosition(4, 4 / 2 * 0.70612, 4 / 2 * 0.70612 / 25.4),
+                            PulsPosition(2 ** 31 + 5, 1000))
+        self.assertEqual(pos, expected)
+        x, y, z, counters = pos
+        self.assertEqual(counters, (2 ** 31 + 5, 1000))
+
+    def test_the_modes_are_read_once_and_then_follow_the_setters(self):
+        reads = []
+        orig = cnc_mod.read_attr
+
+        def counting(path, binary=False):
+            reads.append(os.path.basename(path))
+            return orig(path, binary)
+        with mock.patch.object(cnc_mod, 'read_attr', counting):
+            self.cnc.position
+            self.cnc.position
+            self.cnc.set_x_mode(16)
+            pos = self.cnc.position
+        self.assertEqual(reads.count('x_mode') + reads.count('y_mode'), 2)
+        self.assertAlmostEqual(pos.x.mm, 7.5)
+
+    def test_a_short_read_is_an_error_not_zeros(self):
+        with open(self.attr('position'), 'wb') as f:
+            f.write(b'\x00' * 12)
+        with self.assertRaises(ValueError):
+            self.cnc.position
+
+
+class AttrStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'water_temp_2')
+        with open(self.path, 'w') as f:
+            f.write('666\n')
+        enable_attr_stats()
+
+    def tearDown(self):
+        enable_attr_stats(False)
+        close_attrs()
+        shutil.rmtree(self.dir)
+
+    def test_every_bucket_holds_what_it_counts_within_a_sixteenth(self):
+        for ns in [0, 1, 31, 32, 33, 1000, 4095, 123456, 10 ** 9]:
+            low, high = LatencyHistogram.bounds(LatencyHistogram.index(ns))
+            self.assertLessEqual(low, ns)
+            self.assertLess(ns, high)
+            self.assertLessEqual(high - low, max(1, low // 16))
+
+    def test_percentiles_come_from_the_buckets(self):
+        hist = LatencyHistogram()
+        for us in range(1, 1001):
+            hist.record(us * 1000)
+        self.assertAlmostEqual(hist.percentile(50), 500000, delta=500000 / 16)
+        self.assertEqual(hist.percentile(100), 1000000)
+
+    def test_reads_and_writes_are_counted_per_path(self):
+        for _ in range(3):
+            read_attr(self.path)
+        write_attr(self.path, 700)
+        read_file(self.path)
+        with self.assertRaises(OSError):
+            read_attr(os.path.join(self.dir, 'absent'))
+        stats = attr_stats()
+        self.assertEqual(stats[self.path]['read']['count'], 4)
+        self.assertEqual(stats[self.path]['write']['count'], 1)
+        self.assertEqual(stats[os.path.join(self.dir, 'absent')]['read']['errors'], 1)
+
+    def test_nothing_is_recorded_while_off(self):
+        enable_attr_stats(False)
+        read_attr(self.path)
+        self.assertEqual(attr_stats(), {})
+
+    def test_the_dump_is_json(self):
+        read_attr(self.path)
+        out = dump_attr_stats(os.path.join(self.dir, 'stats.json'))
+        with open(out) as f:
+            self.assertEqual(json.load(f)[self.path]['read']['count'], 1)
+
+
+class StateWaitTest(unittest.TestCase):
+    """A plain file never notifies, so these exercise the polled fallback:
+    the shape of a driver that does not sysfs_notify() cnc/state."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, 'cnc'))
+        self.state_path = os.path.join(self.dir, 'cnc', 'state')
+        self._set('running')
+        self.base = mock.patch.object(cnc_mod, 'SYSFS_GF_BASE', self.dir + '/')
+        self.base.start()
+        self.cnc = cnc_mod.cnc
+
+    def tearDown(self):
+        self.base.stop()
+        close_attrs()
+        shutil.rmtree(self.dir)
+
+    def _set(self, state, delay=0.0):
+        def write():
+            # One fixed-width write in place: a truncate-and-write could be
+            # read half done, as an empty (and so invalid) state.
+            fd = os.open(self.state_path, os.O_WRONLY | os.O_CREAT)
+            try:
+                os.pwrite(fd, ('%-10s\n' % state).encode(), 0)
+            finally:
+                os.close(fd)
+        if delay:
+            t = threading.Timer(delay, write)
+            t.start()
+            self.addCleanup(t.join)
+        else:
+            write()
+
+    def test_a_state_already_reached_returns_at_once(self):
+        self.assertIs(self.cnc.wait_state((MachineState.RUNNING,), 0), MachineState.RUNNING)
+
+    def test_a_change_is_seen_within_the_poll_interval(self):
+        self._set('idle', delay=0.05)
+        t0 = time.monotonic()
+        state = self.cnc.wait_state((MachineState.IDLE, MachineState.FAULT), 2.0)
+        self.assertIs(state, MachineState.IDLE)
+        self.assertLess(time.monotonic() - t0, 0.05 + cnc_mod.STATE_POLL_MAX_S + 0.05)
+        self.assertFalse(cnc_mod._CNC.state_notifies)
+
+    def test_a_state_never_reached_times_out(self):
+        self.assertIsNone(self.cnc.wait_state((MachineState.IDLE,), 0.1))
+
+    def test_transitions_are_reported_once_each(self):
+        self._set('underrun', delay=0.03)
+        self._set('idle', delay=0.3)
+        seen = list(self.cnc.transitions(timeout=0.6))
+        self.assertEqual(seen, [MachineState.UNDERRUN, MachineState.IDLE])
+
+    def test_a_missed_notification_costs_no_more_than_the_slowest_poll(self):
+        notifies = mock.patch.object(cnc_mod._CNC, 'state_notifies', True)
+        notifies.start()
+        self.addCleanup(notifies.stop)
+        self._set('idle', delay=0.05)
+        t0 = time.monotonic()
+        self.assertIs(self.cnc.wait_state((MachineState.IDLE,), 2.0), MachineState.IDLE)
+        self.assertLess(time.monotonic() - t0, 0.05 + cnc_mod.STATE_POLL_MAX_S + 0.05)
+
+    def test_a_wait_reads_through_a_descriptor_of_its_own(self):
+        # Reads through the shared one would consume the notifications the
+        # wait is sleeping on.
+        reads = []
+        orig = _common.SysfsAttr._read
+
+        def counting(handle, size):
+            reads.append(handle.path)
+            return orig(handle, size)
+        self._set('idle', delay=0.03)
+        with mock.patch.object(_common.SysfsAttr, '_read', counting):
+            seen = list(self.cnc.transitions(timeout=0.2))
+        self.assertEqual(seen, [MachineState.IDLE])
+        self.assertNotIn(self.state_path, reads)
+
+    def test_a_stopped_iterator_ends(self):
+        stop = threading.Event()
+        stop.set()
+        self.assertEqual(list(self.cnc.transitions(stop=stop)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()